@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the FileTable bulk write strategies.
+
+Usage: python -m benchmarks.bulk_insert [--sizes 1000,10000,100000]
+
+For each batch size, every strategy writes the same rows into an empty table and the throughput is reported in rows/s.
+"""
+
+from plumbum import cli # type: ignore
+
+from dolt_annex.datatypes import FileTableSchema
+from dolt_annex.table import WRITE_STRATEGIES, choose_write_strategy, write_rows
+
+from benchmarks.common import scratch_dolt_server, synthetic_rows, timed
+
+schema = FileTableSchema(
+    name="submissions",
+    file_column="annex_key",
+    key_columns=["source", "id", "updated", "part"],
+)
+
+class BulkInsertBenchmark(cli.Application):
+    """Compare rows/s for each bulk write strategy"""
+
+    sizes = cli.SwitchAttr(
+        "--sizes",
+        str,
+        help="Comma separated list of batch sizes",
+        default = "1000,10000,100000",
+    )
+
+    def main(self):
+        with scratch_dolt_server() as dolt:
+            session = dolt.session(dolt.active_branch)
+            database = f"{dolt.db_name}/{dolt.active_branch}"
+            print(f"{'rows':>10} {'strategy':>10} {'seconds':>10} {'rows/s':>12}")
+            for size in sorted(int(size) for size in self.sizes.split(',')):
+                rows = synthetic_rows(size)
+                for strategy in WRITE_STRATEGIES:
+                    session.execute(f"DELETE FROM {schema.name}", None)
+                    elapsed = timed(lambda: write_rows(session, schema, database, rows, strategy))
+                    chosen = " *" if strategy == choose_write_strategy(size) else ""
+                    print(f"{size:>10} {strategy:>10} {elapsed:>10.3f} {size / elapsed:>12.0f}{chosen}")
+            if not session.load_data_supported:
+                print("LOAD DATA LOCAL INFILE was rejected by the server; load_data timings used multi-row inserts.")
+
+if __name__ == "__main__":
+    BulkInsertBenchmark.run()
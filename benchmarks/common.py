@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Shared helpers for benchmarks. Benchmarks that talk to Dolt require the dolt binary on the PATH."""
+
+from contextlib import contextmanager
+from pathlib import Path
+import random
+import tempfile
+import time
+
+from typing_extensions import Callable, Generator, Tuple
+
+from plumbum import local # type: ignore
+
+from dolt_annex.dolt import DoltSqlServer
+
+SUBMISSIONS_SQL = "CREATE TABLE IF NOT EXISTS `submissions` ( source VARCHAR(100), id int, updated DATETIME, part int, annex_key VARCHAR(100), PRIMARY KEY(source, id, updated, part) )"
+
+@contextmanager
+def scratch_dolt_server() -> Generator[DoltSqlServer, None, None]:
+    """Create a throwaway Dolt repo containing an empty submissions table, and spawn a server for it."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dolt_dir = Path(tmp_dir) / "bench"
+        dolt_dir.mkdir()
+        dolt = local.cmd.dolt.with_cwd(dolt_dir)
+        dolt("init", "--name", "bench", "--email", "bench@localhost")
+        dolt("sql", "-q", SUBMISSIONS_SQL)
+        dolt("add", ".")
+        dolt("commit", "-m", "init submissions table")
+        db_config = {
+            "user": "root",
+            "database": "bench",
+            "autocommit": True,
+            "port": random.randint(20000, 30000),
+            "unix_socket": str(Path(tmp_dir) / "bench.sock"),
+        }
+        with DoltSqlServer(dolt_dir, "bench", db_config, spawn_dolt_server=True) as dolt_server:
+            yield dolt_server
+
+def synthetic_rows(count: int, offset: int = 0) -> list[Tuple]:
+    """Generate rows of (annex_key, source, id, updated, part) for the submissions table."""
+    return [
+        (f"SHA256E-s{i}--{i:064x}.png", "bench.example", i, "2021-01-01 00:00:00", 1)
+        for i in range(offset, offset + count)
+    ]
+
+def timed(func: Callable[[], object]) -> float:
+    """Return the wall clock time taken by func, in seconds."""
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the merge and anti-join diff engines.
+
+Usage: python -m benchmarks.diff_engines [--rows 200000] [--deltas 10,1000,100000]
+
+For each delta, a source branch with --rows rows is diffed against a destination branch that is missing
+the last delta rows, and every row of the diff is consumed. The merge engine's time includes merging both
+branches into the union branch, since that is part of every push or pull that uses it.
+"""
+
+from plumbum import cli # type: ignore
+
+from dolt_annex.commands.push import diff_keys
+from dolt_annex.datatypes import FileTableSchema
+from dolt_annex.diff import DIFF_ENGINES
+from dolt_annex.table import write_rows
+
+from benchmarks.common import scratch_dolt_server, synthetic_rows, timed
+
+schema = FileTableSchema(
+    name="submissions",
+    file_column="annex_key",
+    key_columns=["source", "id", "updated", "part"],
+)
+
+INSERT_BATCH_SIZE = 100000
+PAGE_SIZE = 1000
+
+class DiffEnginesBenchmark(cli.Application):
+    """Compare the merge and anti-join diff engines on small and large deltas"""
+
+    rows = cli.SwitchAttr(
+        "--rows",
+        int,
+        help="The number of rows in the source branch",
+        default = 200000,
+    )
+
+    deltas = cli.SwitchAttr(
+        "--deltas",
+        str,
+        help="Comma separated list of the number of rows missing from the destination branch",
+        default = "10,1000,100000",
+    )
+
+    def main(self):
+        with scratch_dolt_server() as dolt:
+            print(f"{'delta':>10} {'engine':>10} {'rows':>10} {'seconds':>10}")
+            for delta in sorted(int(delta) for delta in self.deltas.split(',')):
+                delta = min(delta, self.rows)
+                for engine in DIFF_ENGINES:
+                    # Each run gets fresh branches, so that the merge engine can't reuse an earlier union branch.
+                    dataset = f"bench-{delta}-{engine}"
+                    self.fill_branch(dolt, f"source-{dataset}", self.rows)
+                    self.fill_branch(dolt, f"destination-{dataset}", self.rows - delta)
+                    count = 0
+                    def consume():
+                        nonlocal count
+                        for _ in diff_keys(dolt, "source", "destination", dataset, schema, [], page_size=PAGE_SIZE, engine=engine):
+                            count += 1
+                    elapsed = timed(consume)
+                    print(f"{delta:>10} {engine:>10} {count:>10} {elapsed:>10.2f}")
+
+    @staticmethod
+    def fill_branch(dolt, branch: str, count: int):
+        dolt.create_branch_if_missing(branch, dolt.active_branch)
+        session = dolt.session(branch)
+        for offset in range(0, count, INSERT_BATCH_SIZE):
+            write_rows(session, schema, f"{dolt.db_name}/{branch}", synthetic_rows(min(INSERT_BATCH_SIZE, count - offset), offset))
+        with dolt.set_branch(branch):
+            dolt.commit()
+
+if __name__ == "__main__":
+    DiffEnginesBenchmark.run()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark computing keys for files of different sizes.
+
+Usage: python -m benchmarks.key_hashing [--sizes 1K,1M,64M,1G,10G] [--dir PATH]
+
+For each size, a file of random data is written once, then hashed by reading the whole file into memory
+(how keys used to be computed) and by key_from_file. Each measurement runs in a fresh process,
+so that its peak memory can be reported alongside its throughput. Peak RSS includes memory mapped
+file pages, which the kernel can reclaim at any time, so the peak heap allocated by Python is reported too.
+Sizes above the free space in --dir (the system temp directory by default) are skipped.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import multiprocessing
+import os
+from pathlib import Path
+import resource
+import shutil
+import tempfile
+import tracemalloc
+
+from typing_extensions import Callable, Dict, Tuple
+
+from plumbum import cli # type: ignore
+
+from dolt_annex.file_keys import key_from_file
+
+from benchmarks.common import timed
+
+UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+WRITE_CHUNK_SIZE = 16 * 1024 * 1024
+
+def parse_size(size: str) -> int:
+    if size[-1].upper() in UNITS:
+        return int(size[:-1]) * UNITS[size[-1].upper()]
+    return int(size)
+
+def read_whole_file(path: Path):
+    with open(path, 'rb') as f:
+        hashlib.sha256(f.read()).hexdigest()
+
+METHODS: Dict[str, Callable[[Path], object]] = {
+    "read": read_whole_file,
+    "stream": key_from_file,
+}
+
+def measure(method: str, path: Path) -> Tuple[float, int, int]:
+    """
+    Run in a child process. Returns the seconds taken, the process's peak resident memory in KiB,
+    and the peak Python heap allocation in bytes, which is measured by a second, untimed run.
+    """
+    elapsed = timed(lambda: METHODS[method](path))
+    peak_rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    METHODS[method](path)
+    _, peak_heap = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak_rss_kib, peak_heap
+
+def write_file(path: Path, size: int):
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, WRITE_CHUNK_SIZE)
+            f.write(os.urandom(chunk))
+            remaining -= chunk
+
+class KeyHashingBenchmark(cli.Application):
+    """Compare the throughput and peak memory of hashing files by reading them whole or by streaming them"""
+
+    sizes = cli.SwitchAttr(
+        "--sizes",
+        str,
+        help="Comma separated list of file sizes, with an optional K, M or G suffix",
+        default = "1K,1M,64M,1G,10G",
+    )
+
+    dir = cli.SwitchAttr("--dir", cli.ExistingDirectory, help="Where to write the files being hashed", default = None)
+
+    def main(self):
+        context = multiprocessing.get_context("spawn")
+        with tempfile.TemporaryDirectory(dir=self.dir) as tmp_dir:
+            path = Path(tmp_dir) / "file.bin"
+            print(f"{'size':>6} {'method':>7} {'seconds':>10} {'MB/s':>10} {'peak RSS MB':>12} {'peak heap MB':>13}")
+            for size_name in self.sizes.split(','):
+                size = parse_size(size_name)
+                if size > shutil.disk_usage(tmp_dir).free:
+                    print(f"{size_name:>6} skipped: not enough free space")
+                    continue
+                write_file(path, size)
+                for method in METHODS:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        elapsed, peak_rss_kib, peak_heap = executor.submit(measure, method, path).result()
+                    print(f"{size_name:>6} {method:>7} {elapsed:>10.3f} {size / (1024 * 1024) / elapsed:>10.1f}"
+                          f" {peak_rss_kib / 1024:>12.1f} {peak_heap / (1024 * 1024):>13.1f}")
+                path.unlink()
+
+if __name__ == "__main__":
+    KeyHashingBenchmark.run()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark concurrent copies to a file:// remote.
+
+Usage: python -m benchmarks.local_copy [--jobs 1,2,4,8,16] [--small-files 5000] [--large-files 16] [--large-mb 64] [--dir PATH]
+
+Two key distributions are generated: many small files, and a few large files.
+Each is copied into an empty remote directory with each level of concurrency, using both fast_copy, which file:// remotes use,
+and a plain shutil copy for comparison, and files/s and MB/s are reported.
+Pass --dir to benchmark a specific device or network filesystem instead of the system temp directory.
+"""
+
+import os
+from pathlib import Path
+import shutil
+import tempfile
+
+from typing_extensions import Dict, List
+
+from plumbum import cli # type: ignore
+
+from dolt_annex import move_functions
+from dolt_annex.commands.sync import FileMover
+from dolt_annex.move_functions import MoveFunction
+from dolt_annex.pipeline import pipelined
+from dolt_annex.logger import logger, WARNING
+
+from benchmarks.common import timed
+
+SMALL_FILE_SIZE = 4 * 1024
+
+COPY_FUNCTIONS: Dict[str, MoveFunction] = {
+    "fast_copy": move_functions.fast_copy,
+    "copy": move_functions.copy,
+}
+
+def write_files(directory: Path, count: int, size: int) -> List[Path]:
+    """Write count files of random data, spread across subdirectories like an annex."""
+    paths = []
+    for i in range(count):
+        path = Path(f"{i % 256:02x}") / f"file-{i}"
+        (directory / path).parent.mkdir(parents=True, exist_ok=True)
+        with open(directory / path, "wb") as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+class LocalCopyBenchmark(cli.Application):
+    """Compare throughput of file:// transfers at different levels of concurrency"""
+
+    jobs = cli.SwitchAttr(
+        "--jobs",
+        str,
+        help="Comma separated list of job counts",
+        default = "1,2,4,8,16",
+    )
+
+    small_files = cli.SwitchAttr("--small-files", int, help="The number of 4KiB files", default = 5000)
+
+    large_files = cli.SwitchAttr("--large-files", int, help="The number of large files", default = 16)
+
+    large_mb = cli.SwitchAttr("--large-mb", int, help="The size of each large file in MiB", default = 64)
+
+    dir = cli.SwitchAttr("--dir", cli.ExistingDirectory, help="Where to create the source and remote directories", default = None)
+
+    def main(self):
+        # FileMover logs every file it moves.
+        logger.log_level = WARNING
+        with tempfile.TemporaryDirectory(dir=self.dir) as tmp_dir:
+            local_dir = Path(tmp_dir) / "local"
+            remote_dir = Path(tmp_dir) / "remote"
+            distributions = {
+                "small": write_files(local_dir / "small", self.small_files, SMALL_FILE_SIZE),
+                "large": write_files(local_dir / "large", self.large_files, self.large_mb * 1024 * 1024),
+            }
+            print(f"{'keys':>6} {'function':>10} {'jobs':>5} {'seconds':>10} {'files/s':>10} {'MB/s':>10}")
+            for name, paths in distributions.items():
+                total_mb = sum((local_dir / name / path).stat().st_size for path in paths) / (1024 * 1024)
+                for function_name, copy_function in COPY_FUNCTIONS.items():
+                    for jobs in sorted(int(jobs) for jobs in self.jobs.split(',')):
+                        shutil.rmtree(remote_dir, ignore_errors=True)
+                        mover = FileMover(copy_function, copy_function, str(remote_dir), local_dir / name, jobs)
+                        def copy_all():
+                            for _ in pipelined(paths, lambda path: mover.put(path, path), 1000, mover.jobs):
+                                pass
+                        elapsed = timed(copy_all)
+                        print(f"{name:>6} {function_name:>10} {jobs:>5} {elapsed:>10.3f} {len(paths) / elapsed:>10.0f} {total_mb / elapsed:>10.1f}")
+
+if __name__ == "__main__":
+    LocalCopyBenchmark.run()
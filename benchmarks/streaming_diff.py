@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark client memory use when iterating over a large diff, with buffered and streaming queries.
+
+Usage: python -m benchmarks.streaming_diff [--rows 1000000]
+
+A branch containing --rows rows is diffed against an empty branch, and every row of the diff is consumed.
+Peak Python heap usage is measured with tracemalloc.
+"""
+
+import time
+import tracemalloc
+
+from plumbum import cli # type: ignore
+
+from dolt_annex.commands.sync import diff_query
+from dolt_annex.datatypes import FileTableSchema
+from dolt_annex.table import write_rows
+
+from benchmarks.common import scratch_dolt_server, synthetic_rows
+
+schema = FileTableSchema(
+    name="submissions",
+    file_column="annex_key",
+    key_columns=["source", "id", "updated", "part"],
+)
+
+INSERT_BATCH_SIZE = 100000
+
+class StreamingDiffBenchmark(cli.Application):
+    """Compare peak memory of buffered and streaming diff queries"""
+
+    rows = cli.SwitchAttr(
+        "--rows",
+        int,
+        help="The number of rows in the diff",
+        default = 1000000,
+    )
+
+    def main(self):
+        with scratch_dolt_server() as dolt:
+            dolt.create_branch_if_missing("empty", dolt.active_branch)
+            session = dolt.session(dolt.active_branch)
+            database = f"{dolt.db_name}/{dolt.active_branch}"
+            for offset in range(0, self.rows, INSERT_BATCH_SIZE):
+                write_rows(session, schema, database, synthetic_rows(min(INSERT_BATCH_SIZE, self.rows - offset), offset))
+            dolt.commit()
+
+            print(f"{'mode':>10} {'rows':>10} {'seconds':>10} {'peak MiB':>10}")
+            for stream in (False, True):
+                tracemalloc.start()
+                start = time.perf_counter()
+                count = 0
+                for _ in dolt.query(diff_query(schema, []), ("empty", dolt.active_branch), stream=stream):
+                    count += 1
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                mode = "stream" if stream else "buffered"
+                print(f"{mode:>10} {count:>10} {elapsed:>10.2f} {peak / 2**20:>10.1f}")
+
+if __name__ == "__main__":
+    StreamingDiffBenchmark.run()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from .commands import init, server_command, sync, push, pull, import_command, gallery_dl
+from .commands import init, server_command, sync, push, pull, import_command, gallery_dl, migrate_layout
 from .application import Application
 
 # gallery-dl postprocessors callbacks must be in the top level package, so we import them here
@@ -14,6 +14,7 @@ Application.subcommand("push", push.Push)
 Application.subcommand("pull", pull.Pull)
 Application.subcommand("server", server_command.Server)
 Application.subcommand("gallery-dl", gallery_dl.GalleryDL)
+Application.subcommand("migrate-layout", migrate_layout.MigrateLayout)
 
 if __name__ == "__main__":
     Application.run()
@@ -5,6 +5,7 @@ import json
 from pathlib import Path
 
 from plumbum import cli
+from typing_extensions import Optional
 
 
 from .config import Config, set_config
@@ -12,6 +13,7 @@ class Env:
     DOLT_DIR = "DA_DOLT_DIR"
     FILES_DIR = "DA_FILES_DIR"
     SPAWN_DOLT_SERVER = "DA_SPAWN_DOLT_SERVER"
+    SHARED_DOLT_SERVER = "DA_SHARED_DOLT_SERVER"
     DOLT_SERVER_SOCKET = "DA_DOLT_SERVER_SOCKET"
     DOLT_DB = "DA_DOLT_DB"
     DOLT_REMOTE = "DA_DOLT_REMOTE"
@@ -19,6 +21,9 @@ class Env:
     NAME = "DA_NAME"
     ANNEX_COMMIT_MESSAGE = "DA_ANNEX_COMMIT_MESSAGE"
     AUTO_PUSH = "DA_AUTO_PUSH"
+    SLOW_QUERY_THRESHOLD = "DA_SLOW_QUERY_THRESHOLD"
+    SLOW_QUERY_LOG = "DA_SLOW_QUERY_LOG"
+    QUERY_STATS = "DA_QUERY_STATS"
 
 class Application(cli.Application):
     """The top level CLI command"""
@@ -36,8 +41,12 @@ class Application(cli.Application):
             name = None,
         )
 
+    # The config file passed with -c, if any.
+    config_path: Optional[Path] = None
+
     @cli.switch(['-c', '--config'], cli.ExistingFile)
     def set_config(self, path):
+        self.config_path = Path(path)
         with open(path) as f:
             try:
                 config_json = json.load(f)
@@ -58,6 +67,9 @@ class Application(cli.Application):
     spawn_dolt_server = cli.Flag("--spawn-dolt-server", envname=Env.SPAWN_DOLT_SERVER,
                                  help = "If set, spawn a new Dolt server instead of connecting to an existing one.")
 
+    shared_dolt_server = cli.Flag("--shared-dolt-server", envname=Env.SHARED_DOLT_SERVER,
+                                  help = "If set, start or attach to a Dolt server that is shared between dolt-annex processes and stops when the last one exits.")
+
     dolt_server_socket = cli.SwitchAttr("--dolt-server-socket", str, envname=Env.DOLT_SERVER_SOCKET,
                                         help = "The UNIX socket to use for the Dolt server.")
 
@@ -71,6 +83,15 @@ class Application(cli.Application):
 
     annexcommitmessage = cli.SwitchAttr("--annexcommitmessage", str, envname=Env.ANNEX_COMMIT_MESSAGE)
 
+    slow_query_threshold = cli.SwitchAttr("--slow-query-threshold", float, envname=Env.SLOW_QUERY_THRESHOLD,
+                                          help = "Log Dolt statements that take at least this many seconds, along with their query plan.")
+
+    slow_query_log = cli.SwitchAttr("--slow-query-log", str, envname=Env.SLOW_QUERY_LOG,
+                                    help = "The file to append slow statements to. If unset, they are logged as warnings.")
+
+    query_stats = cli.SwitchAttr("--query-stats", str, envname=Env.QUERY_STATS,
+                                 help = "Write per-statement latency histograms for the Dolt server to this JSON file.")
+
     def main(self, *args):
         # Set each config parameter in order of preference:
         # 1. Command line argument or environment variable
@@ -78,6 +99,7 @@ class Application(cli.Application):
         # 3. Default value
         self.config.dolt_dir = Path(self.dolt_dir or self.config.dolt_dir or "./dolt")
         self.config.spawn_dolt_server = self.spawn_dolt_server or self.config.spawn_dolt_server
+        self.config.shared_dolt_server = self.shared_dolt_server or self.config.shared_dolt_server
         self.config.dolt_server_socket = self.dolt_server_socket or self.config.dolt_server_socket
         self.config.dolt_db = self.dolt_db or self.config.dolt_db or self.config.dolt_dir.name
         self.config.dolt_remote = self.dolt_remote or self.config.dolt_remote or "origin"
@@ -85,6 +107,9 @@ class Application(cli.Application):
         self.config.name = self.name or self.config.name or "user"
         self.config.annexcommitmessage = self.annexcommitmessage or self.config.annexcommitmessage or "update git-annex"
         self.config.files_dir = self.config.files_dir or Path("./annex")
+        self.config.slow_query_threshold = self.slow_query_threshold or self.config.slow_query_threshold
+        self.config.slow_query_log = Path(self.slow_query_log) if self.slow_query_log else self.config.slow_query_log
+        self.config.query_stats = Path(self.query_stats) if self.query_stats else self.config.query_stats
        
         if self.nested_command is None:
             self.help()
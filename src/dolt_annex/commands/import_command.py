@@ -1,21 +1,24 @@
-from dataclasses import dataclass
+from contextlib import nullcontext
 import os
+from dataclasses import dataclass
 from pathlib import Path
 
-from typing_extensions import Dict, Iterable
+from typing_extensions import Dict, Iterable, Iterator, Optional
 
 from plumbum import cli # type: ignore
 
 from dolt_annex import importers, move_functions
 from dolt_annex.datatypes.table import DatasetSchema
-from dolt_annex.file_keys import key_from_file
+from dolt_annex.file_keys import HASH_CACHE_FILE, HashCache, key_from_file
 from dolt_annex.filestore import get_key_path
 from dolt_annex.application import Application
 from dolt_annex.importers.base import get_importer
 from dolt_annex.logger import logger
 from dolt_annex.move_functions import MoveFunction
-from dolt_annex.datatypes import AnnexKey, Repo
-from dolt_annex.table import Dataset, FileTable
+from dolt_annex.datatypes import AnnexKey, Repo, TableRow
+from dolt_annex.pipeline import pipelined
+from dolt_annex.walk import WalkEntry, walk_files
+from dolt_annex.table import Dataset
 
 class ImportError(Exception):
     pass
@@ -26,6 +29,20 @@ class ImportConfig:
     batch_size: int
     move_function: MoveFunction
     follow_symlinks: bool
+    # The number of files to hash and extract key columns from concurrently.
+    jobs: int = 1
+    # Hashes of previously imported files. If set, files that haven't changed since they were hashed aren't hashed again.
+    hash_cache: Optional[HashCache] = None
+    # Hash every file even if it has a cache entry, and correct entries that don't match.
+    verify_hashes: bool = False
+
+@dataclass
+class ImportedFile:
+    """A file that has been hashed and matched to a row, but not yet recorded."""
+    path: Path
+    key: AnnexKey
+    table_name: str
+    key_columns: TableRow
 
 class Import(cli.Application):
     """Import a file or directory into the annex and database"""
@@ -42,19 +59,31 @@ class Import(cli.Application):
     move = cli.Flag(
         "--move",
         help="Move imported files into the annex",
-        excludes = ["--copy", "--symlink"],
+        excludes = ["--copy", "--symlink", "--reflink", "--hardlink"],
     )
 
     copy = cli.Flag(
         "--copy",
-        help="Copy imported files into the annex",
-        excludes = ["--move", "--symlink"],
+        help="Copy imported files into the annex, sharing blocks with the originals if the filesystem supports reflinks",
+        excludes = ["--move", "--symlink", "--reflink", "--hardlink"],
     )
 
     symlink = cli.Flag(
         "--symlink",
         help="Copy imported files into the annex",
-        excludes = ["--move", "--copy"],
+        excludes = ["--move", "--copy", "--reflink", "--hardlink"],
+    )
+
+    reflink = cli.Flag(
+        "--reflink",
+        help="Copy imported files into the annex by sharing their blocks copy-on-write. Fails if the filesystem doesn't support reflinks.",
+        excludes = ["--move", "--copy", "--symlink", "--hardlink"],
+    )
+
+    hardlink = cli.Flag(
+        "--hardlink",
+        help="Hardlink imported files into the annex. Only safe if the originals are never modified in place.",
+        excludes = ["--move", "--copy", "--symlink", "--reflink"],
     )
 
     symlinks = cli.SwitchAttr(
@@ -75,88 +104,147 @@ class Import(cli.Application):
         help="The name of the dataset being imported to",
     )
 
+    jobs = cli.SwitchAttr(
+        "--jobs",
+        cli.Range(1, 64),
+        help="The number of files to hash concurrently",
+        default = 1,
+    )
+
+    no_hash_cache = cli.Flag(
+        "--no-hash-cache",
+        help=f"Hash every file without reading or updating the hash cache ({HASH_CACHE_FILE})",
+        excludes = ["--verify"],
+    )
+
+    verify = cli.Flag(
+        "--verify",
+        help="Hash every file even if the hash cache has it, and correct cache entries that don't match",
+    )
+
     def get_move_function(self) -> MoveFunction:
         """Get the function to move files based on the command line arguments"""
-        print(f"Copy: {self.copy}, Move: {self.move}, Symlink: {self.symlink}")
+        logger.debug(f"Copy: {self.copy}, Move: {self.move}, Symlink: {self.symlink}, Reflink: {self.reflink}, Hardlink: {self.hardlink}")
         if self.copy:
-            return move_functions.copy
+            return move_functions.fast_copy
         elif self.symlink:
             return move_functions.move_and_symlink
+        elif self.reflink:
+            return move_functions.reflink
+        elif self.hardlink:
+            return move_functions.hardlink
         else:
             return move_functions.move
         
     def main(self, *files_or_directories: str):
 
-        if not self.copy and not self.move and not self.symlink:
-            raise ValueError("Must specify --copy, --move, or --symlink")
+        if not self.copy and not self.move and not self.symlink and not self.reflink and not self.hardlink:
+            raise ValueError("Must specify --copy, --move, --symlink, --reflink or --hardlink")
         
         move_function = self.get_move_function()
         follow_symlinks = (self.symlinks == "follow")
 
-        import_config = ImportConfig(
-            batch_size = self.batch_size,
-            move_function = move_function,
-            follow_symlinks = follow_symlinks,
-        )
         dataset_schema = DatasetSchema.must_load(self.dataset)
 
-        with Dataset.connect(self.parent.config, import_config.batch_size, dataset_schema) as dataset:
+        # The hash cache is stored next to the uuid file, in the repository's directory.
+        with (
+            nullcontext(None) if self.no_hash_cache else HashCache(Path(HASH_CACHE_FILE)) as hash_cache,
+            Dataset.connect(self.parent.config, self.batch_size, dataset_schema) as dataset,
+        ):
+            import_config = ImportConfig(
+                batch_size = self.batch_size,
+                move_function = move_function,
+                follow_symlinks = follow_symlinks,
+                jobs = self.jobs,
+                hash_cache = hash_cache,
+                verify_hashes = self.verify,
+            )
             importer = get_importer(*self.importer.split())
             do_import(self.parent.config.local_repo(), import_config, dataset, importer, files_or_directories)
 
 def do_import(remote: Repo, import_config: ImportConfig, dataset: Dataset, importer: importers.ImporterBase, files_or_directories: Iterable[str]):
+    """
+    Import files into the annex and record them in the dataset.
+
+    Directories are listed by import_config.jobs threads, and files are hashed and matched to rows by as many
+    worker threads, so hashing starts as soon as the first directory has been listed. Rows are recorded on the calling thread in the order the files were found,
+    so the flush hooks that move files into the annex only run after the rows for those files are written.
+    """
+    check_move_function(import_config.move_function, files_or_directories, remote.files_dir())
+
     key_paths: Dict[str, Dict[Path, AnnexKey]] = {}
     for table_name, table in dataset.tables.items():
         key_paths[table_name] = {}
         table.add_flush_hook(move_files, remote, import_config.move_function, key_paths[table_name])
-    
-    def import_path(file_or_directory: Path):
-        """Import a file or directory into the annex"""
+
+    def walk_path(file_or_directory: Path) -> Iterator[WalkEntry]:
+        """Yield each file in a file or directory"""
         if file_or_directory.is_file():
-            import_file(file_or_directory)
+            yield WalkEntry(file_or_directory, file_or_directory.is_symlink())
         elif file_or_directory.is_dir():
-            import_directory(file_or_directory)
+            logger.debug(f"Importing directory {file_or_directory}")
+            yield from walk_files(file_or_directory, import_config.jobs)
         else:
             raise ValueError(f"Path {file_or_directory} is not a file or directory")
 
-    def import_directory(path: Path):
-        """Import a directory into the annex"""
-        logger.debug(f"Importing directory {path}")
-        for root, _, files in os.walk(path):
-            root_path = Path(root)
-            for file in files:
-                import_file(root_path / file)
+    def all_files() -> Iterator[WalkEntry]:
+        for file_or_directory in files_or_directories:
+            yield from walk_path(Path(file_or_directory))
 
-    def import_file(path: Path):
-        """Import a file into the annex"""
+    def prepare_file(entry: WalkEntry) -> Optional[ImportedFile]:
+        """Hash a file and find its row. Returns None if the file should be skipped."""
+        path = entry.path
         extension = path.suffix[1:]
         if len(extension) > dataset.MAX_EXTENSION_LENGTH+1:
-            return
+            return None
         # catch both regular symlinks and windows shortcuts
-        is_symlink = path.is_symlink() or extension == '.lnk'
+        is_symlink = entry.is_symlink or extension == '.lnk'
         if is_symlink:
             if not import_config.follow_symlinks:
-                return
+                return None
             else:
                 path = path.readlink()
         if importer and importer.skip(path):
-            return
+            return None
         logger.debug(f"Importing file {path}")
         abs_path = Path(path)
-        key = key_from_file(abs_path, importer.extension(path))
+        key = key_from_file(abs_path, importer.extension(path), import_config.hash_cache, import_config.verify_hashes)
 
         if importer:
             key_columns = importer.key_columns(path)
-            if key_columns:
-                table_name = importer.table_name(path)
-                table = dataset.get_table(table_name)
-                table.insert_file_source(key_columns, key, remote.uuid)
-                key_paths[table_name][abs_path] = key
             if not key_columns:
                 raise ImportError("Importer did not produce a set of key columns, it is not safe to import")
-
+            return ImportedFile(abs_path, key, importer.table_name(path), key_columns)
+        return None
+
+    for imported in pipelined(all_files(), prepare_file, import_config.batch_size, import_config.jobs):
+        if imported is None:
+            continue
+        table = dataset.get_table(imported.table_name)
+        table.insert_file_source(imported.key_columns, imported.key, remote.uuid)
+        key_paths[imported.table_name][imported.path] = imported.key
+
+def check_move_function(move_function: MoveFunction, files_or_directories: Iterable[str], files_dir: Path):
+    """
+    Check that files can be moved into the annex with reflink or hardlink before anything is imported, so that an unsupported filesystem
+    fails the import up front instead of when the first batch is moved. Each source filesystem is probed once, with the first file found on it.
+    """
+    probed = set()
     for file_or_directory in files_or_directories:
-        import_path(Path(file_or_directory))
+        path = Path(file_or_directory)
+        if not path.exists() or path.stat().st_dev in probed:
+            continue
+        probed.add(path.stat().st_dev)
+        if path.is_dir():
+            source = next((Path(root) / name for root, _, names in os.walk(path) for name in names), None)
+        else:
+            source = path
+        if source is None:
+            continue
+        try:
+            move_functions.check_link_support(move_function, source, files_dir)
+        except OSError as e:
+            raise ImportError(f"Can't {move_function.__name__} files from {path} into {files_dir}: {e}") from e
 
 def move_files(remote: Repo, move: MoveFunction, files: Dict[Path, AnnexKey]):
     """Move files to the annex"""
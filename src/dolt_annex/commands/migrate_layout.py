@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Convert a filestore from the legacy abc/def/KEY/KEY layout to the current abc/def/KEY layout.
+
+Once a filestore has been fully migrated, its layout is recorded as "current",
+and transfers to and from it only try a single path per key.
+"""
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+import json
+import os
+from pathlib import Path
+import re
+import stat
+
+from typing_extensions import List, Optional, Tuple
+
+from plumbum import cli # type: ignore
+
+from dolt_annex.application import Application
+from dolt_annex.commands.sync import SftpPool, SshSettings, sftp_connector
+from dolt_annex.datatypes import Repo
+from dolt_annex.filestore import CURRENT_LAYOUT
+from dolt_annex.logger import logger
+from dolt_annex.pipeline import pipelined
+
+# A key is moved out of its legacy directory under this temporary name, so that the directory can be removed.
+# If a migration is interrupted, the next one finishes moving any keys left with this suffix.
+MIGRATING_SUFFIX = ".migrating"
+
+BUCKET_PATTERN = re.compile("[0-9a-f]{3}")
+
+class Filestore(ABC):
+    """The directory operations needed to migrate a filestore, with paths relative to its root."""
+
+    @abstractmethod
+    def list_dir(self, path: str) -> List[Tuple[str, bool]]:
+        """Returns the (name, is_directory) pairs for each entry in a directory."""
+
+    @abstractmethod
+    def rename(self, src: str, dst: str):
+        ...
+
+    @abstractmethod
+    def remove_dir(self, path: str):
+        ...
+
+class LocalFilestore(Filestore):
+    root: Path
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def list_dir(self, path: str) -> List[Tuple[str, bool]]:
+        with os.scandir(self.root / path) as entries:
+            return [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in entries]
+
+    def rename(self, src: str, dst: str):
+        os.rename(self.root / src, self.root / dst)
+
+    def remove_dir(self, path: str):
+        os.rmdir(self.root / path)
+
+class SftpFilestore(Filestore):
+    pool: SftpPool
+    root: Path
+
+    def __init__(self, pool: SftpPool):
+        self.pool = pool
+        self.root = Path(pool.run(lambda sftp: sftp.getcwd()))
+
+    def list_dir(self, path: str) -> List[Tuple[str, bool]]:
+        attrs = self.pool.run(lambda sftp: sftp.listdir_attr((self.root / path).as_posix()))
+        return [(attr.filename, stat.S_ISDIR(attr.st_mode or 0)) for attr in attrs]
+
+    def rename(self, src: str, dst: str):
+        self.pool.run(lambda sftp: sftp.rename((self.root / src).as_posix(), (self.root / dst).as_posix()))
+
+    def remove_dir(self, path: str):
+        self.pool.run(lambda sftp: sftp.rmdir((self.root / path).as_posix()))
+
+@dataclass
+class MigrationResults:
+    # Keys that are stored in the legacy layout, and were migrated unless this is a dry run.
+    legacy: int = 0
+    # Legacy directories that contain something other than their key, and were left alone.
+    skipped: int = 0
+
+    def __iadd__(self, other: 'MigrationResults') -> 'MigrationResults':
+        self.legacy += other.legacy
+        self.skipped += other.skipped
+        return self
+
+class MigrateLayout(cli.Application):
+    """Convert a filestore from the legacy KEY/KEY layout to the current layout, and record its layout"""
+
+    parent: Application
+
+    remote = cli.SwitchAttr(
+        "--remote",
+        str,
+        help="The name of the remote whose filestore is migrated. If unset, the local filestore is migrated.",
+        default = None,
+    )
+
+    jobs = cli.SwitchAttr(
+        "--jobs",
+        cli.Range(1, 64),
+        help="The number of buckets to migrate concurrently. SFTP remotes open one session per job.",
+        default = 1,
+    )
+
+    dry_run = cli.Flag(
+        "--dry-run",
+        help="Count the keys stored in the legacy layout without moving them",
+    )
+
+    ssh_config = cli.SwitchAttr(
+        "--ssh-config",
+        cli.ExistingFile,
+        help="The path to the ssh config file",
+        default = "~/.ssh/config",
+    )
+
+    known_hosts = cli.SwitchAttr(
+        "--known-hosts",
+        cli.ExistingFile,
+        help="The path to the known hosts file",
+        default = None,
+    )
+
+    def main(self, *args) -> int:
+        """Entrypoint for migrate-layout command"""
+        if self.remote is None:
+            results = migrate_filestore(LocalFilestore(Path(self.parent.config.files_dir)), self.jobs, self.dry_run)
+            if is_migrated(results, self.dry_run) and not self.dry_run:
+                record_local_layout(self.parent.config_path)
+            return 0
+
+        remote = Repo.must_load(self.remote)
+        if '@' in remote.files_url:
+            ssh_settings = SshSettings.create(ssh_config=self.ssh_config, known_hosts=self.known_hosts)
+            with SftpPool(sftp_connector(remote, ssh_settings), self.jobs) as pool:
+                results = migrate_filestore(SftpFilestore(pool), self.jobs, self.dry_run)
+        else:
+            results = migrate_filestore(LocalFilestore(remote.files_dir()), self.jobs, self.dry_run)
+        if is_migrated(results, self.dry_run) and not self.dry_run:
+            remote.layout = CURRENT_LAYOUT
+            remote.save_as(remote.name)
+            logger.info(f"Recorded the layout of {remote.name} as {CURRENT_LAYOUT}")
+        return 0
+
+def is_migrated(results: MigrationResults, dry_run: bool) -> bool:
+    """Whether every key in the filestore is now stored in the current layout, or would be after a dry run."""
+    remaining = results.legacy if dry_run else results.skipped
+    logger.info(f"{results.legacy} keys stored in the legacy layout, {results.skipped} directories skipped")
+    return remaining == 0
+
+def record_local_layout(config_path: Optional[Path]):
+    if config_path is None:
+        logger.info(f'The local filestore uses the current layout. Set "files_layout": "{CURRENT_LAYOUT}" in the config file to use it.')
+        return
+    with open(config_path, encoding="utf-8") as f:
+        config_json = json.load(f)
+    config_json["files_layout"] = CURRENT_LAYOUT
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config_json, f, ensure_ascii=False, indent=4)
+    logger.info(f"Recorded the layout of the local filestore as {CURRENT_LAYOUT} in {config_path}")
+
+def migrate_filestore(filestore: Filestore, jobs: int, dry_run: bool) -> MigrationResults:
+    """Migrate every key in a filestore, processing top level buckets in parallel."""
+    buckets = [name for name, is_dir in filestore.list_dir(".") if is_dir and BUCKET_PATTERN.fullmatch(name)]
+    results = MigrationResults()
+    for bucket_results in pipelined(buckets, lambda bucket: migrate_bucket(filestore, bucket, dry_run), len(buckets) or 1, jobs):
+        results += bucket_results
+    return results
+
+def migrate_bucket(filestore: Filestore, bucket: str, dry_run: bool) -> MigrationResults:
+    results = MigrationResults()
+    for sub_bucket, is_dir in filestore.list_dir(bucket):
+        if is_dir and BUCKET_PATTERN.fullmatch(sub_bucket):
+            results += migrate_directory(filestore, f"{bucket}/{sub_bucket}", dry_run)
+    return results
+
+def migrate_directory(filestore: Filestore, directory: str, dry_run: bool) -> MigrationResults:
+    """Move each abc/def/KEY/KEY in a directory to abc/def/KEY."""
+    results = MigrationResults()
+    entries = filestore.list_dir(directory)
+    key_dirs = {name for name, is_dir in entries if is_dir}
+    # Finish migrating keys that were interrupted after being moved out of their directory.
+    for name, is_dir in entries:
+        if is_dir or not name.endswith(MIGRATING_SUFFIX):
+            continue
+        key = name[:-len(MIGRATING_SUFFIX)]
+        results.legacy += 1
+        if dry_run:
+            continue
+        if key in key_dirs:
+            filestore.remove_dir(f"{directory}/{key}")
+            key_dirs.remove(key)
+        filestore.rename(f"{directory}/{name}", f"{directory}/{key}")
+
+    for key in key_dirs:
+        contents = filestore.list_dir(f"{directory}/{key}")
+        if contents != [(key, False)]:
+            logger.warning(f"Skipping {directory}/{key}: expected it to only contain {key}, found {[name for name, _ in contents]}")
+            results.skipped += 1
+            continue
+        results.legacy += 1
+        if dry_run:
+            continue
+        migrating_path = f"{directory}/{key}{MIGRATING_SUFFIX}"
+        filestore.rename(f"{directory}/{key}/{key}", migrating_path)
+        filestore.remove_dir(f"{directory}/{key}")
+        filestore.rename(migrating_path, f"{directory}/{key}")
+    return results
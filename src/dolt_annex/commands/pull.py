@@ -1,19 +1,27 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from pathlib import Path
+import threading
+import time
 from uuid import UUID
 
-from typing_extensions import Iterable, Optional, Tuple, List
+from typing_extensions import Dict, Iterable, Iterator, Optional, Set, Tuple, List
 
 from plumbum import cli # type: ignore
 
 from dolt_annex.datatypes.table import DatasetSchema
 from dolt_annex.table import Dataset, FileTable
-from dolt_annex.commands.sync import SshSettings, TableFilter
+from dolt_annex.commands.sync import SESSION_ERRORS, RowFilter, ShardFilter, SshSettings, TableFilter, transfer_keys
 from dolt_annex.application import Application
-from dolt_annex.commands.push import FileMover, file_mover, diff_keys
-from dolt_annex.filestore import get_old_relative_annex_key_path, get_key_path
+from dolt_annex.commands.push import FileMover, file_mover, diff_keys, merge_diffs, record_watermark
+from dolt_annex.diff import DIFF_ENGINES
+from dolt_annex.file_keys import key_size
+from dolt_annex.filestore.pack import PACK_MAX_KEYS, plan_packs
+from dolt_annex.pipeline import pipelined
+from dolt_annex.watermarks import SyncWatermarks
 from dolt_annex.logger import logger
 from dolt_annex.datatypes import AnnexKey, TableRow, Repo
 from dolt_annex import context
@@ -54,7 +62,14 @@ class Pull(cli.Application):
     remote = cli.SwitchAttr(
         "--remote",
         str,
-        help="The name of the dolt-annex remote",
+        list = True,
+        help="The name of a dolt-annex remote. Repeat to pull each file from whichever of several remotes has it.",
+    )
+
+    all_remotes = cli.Flag(
+        "--all-remotes",
+        help="Pull each file from whichever configured remote has it",
+        excludes = ["--remote"],
     )
 
     dataset = cli.SwitchAttr(
@@ -63,6 +78,20 @@ class Pull(cli.Application):
         help="The name of the dataset being pulled",
     )
 
+    jobs = cli.SwitchAttr(
+        "--jobs",
+        cli.Range(1, 64),
+        help="The number of files to transfer concurrently. SFTP remotes open one session per job.",
+        default = 1,
+    )
+
+    diff_engine = cli.SwitchAttr(
+        "--diff-engine",
+        cli.Set(*DIFF_ENGINES),
+        help="How to find the files that the local repository is missing",
+        default = "merge",
+    )
+
     @cli.switch(
         "--where",
         str,
@@ -76,53 +105,215 @@ class Pull(cli.Application):
             column_name, column_value = filter_string.split('=', maxsplit=1)
             self.filters.append(TableFilter(column_name, column_value))
 
-    filters: List[TableFilter] = []
+    @cli.switch(
+        "--shard",
+        str,
+        help="Only transfer keys in shard i of N, written i/N with 0 <= i < N. Runs with different shards of the same N never transfer the same key.",
+    )
+    def shard(self, shard: str):
+        self.filters.append(ShardFilter.parse(shard))
+
+    filters: List[RowFilter] = []
 
     def main(self, *args) -> int:
         """Entrypoint for pull command"""
         dataset = DatasetSchema.must_load(self.dataset)
-        remote_name = self.remote or self.parent.config.dolt_remote
-        remote = Repo.must_load(remote_name)
+        if self.all_remotes:
+            local_uuid = self.parent.config.local_uuid
+            remotes = [remote for remote in Repo.load_all() if remote.uuid != local_uuid]
+        else:
+            remote_names = self.remote or [self.parent.config.dolt_remote]
+            remotes = [Repo.must_load(remote_name) for remote_name in remote_names]
         ssh_settings = SshSettings(Path(self.ssh_config), Path(self.known_hosts))
 
         with Dataset.connect(self.parent.config, self.batch_size, dataset) as downloader:
-            pull_dataset(downloader, remote, ssh_settings, self.filters, self.limit)
+            if len(remotes) == 1:
+                pull_dataset(downloader, remotes[0], ssh_settings, self.filters, self.limit, diff_engine=self.diff_engine, jobs=self.jobs)
+            else:
+                pull_dataset_from_remotes(downloader, remotes, ssh_settings, self.filters, self.limit, diff_engine=self.diff_engine, jobs=self.jobs)
         return 0
     
-def pull_submissions_and_keys(keys_and_submissions: Iterable[Tuple[AnnexKey, TableRow]], downloader: FileTable, mover: FileMover, local_uuid: UUID, files_pulled: List[AnnexKey]) -> bool:
+def pull_submissions_and_keys(keys_and_submissions: Iterable[Tuple[AnnexKey, TableRow]], downloader: FileTable, mover: FileMover, local_uuid: UUID, files_pulled: List[AnnexKey], out_missing: Optional[List[AnnexKey]] = None) -> bool:
+    """
+    Pull each file and record it in the local branch.
+
+    Diff pages are read, files are transferred and rows are flushed to Dolt concurrently.
+    Up to mover.jobs transfers run at once, and small files are received in packs if the remote supports them.
+    Rows are recorded in a deterministic order, and a row is only recorded after its file has been transferred.
+    Keys whose transfer failed are appended to out_missing, if it's given.
+    """
     has_more = False
-    for key, table_row in keys_and_submissions:
+    for key, table_row in transfer_keys(keys_and_submissions, mover.get_keys, mover, downloader.batch_size, out_missing):
         has_more = True
-        logger.info(f"pulling {table_row}: {key}")
-        rel_key_path = get_key_path(key)
-        old_rel_key_path = get_old_relative_annex_key_path(key)
-        if not mover.get(old_rel_key_path, rel_key_path):
-            mover.get(rel_key_path, rel_key_path)
+        logger.info(f"pulled {table_row}: {key}")
         downloader.insert_file_source(table_row, key, local_uuid)
         files_pulled.append(key)
     downloader.flush()
     return has_more
 
-def pull_dataset(dataset: Dataset, file_remote: Repo, ssh_settings: SshSettings, where: List[TableFilter], limit: Optional[int] = None, out_pulled_keys: Optional[List[AnnexKey]] = None) -> List[AnnexKey]:
+def pull_dataset(dataset: Dataset, file_remote: Repo, ssh_settings: SshSettings, where: List[RowFilter], limit: Optional[int] = None, out_pulled_keys: Optional[List[AnnexKey]] = None, diff_engine: str = "merge", jobs: int = 1) -> List[AnnexKey]:
     if out_pulled_keys is None:
         out_pulled_keys = []
     dataset.pull_from(file_remote)
     for table in dataset.tables.values():
-        pull_table(table, file_remote, ssh_settings, where, limit, out_pulled_keys)
+        pull_table(table, file_remote, ssh_settings, where, limit, out_pulled_keys, diff_engine, jobs)
     return out_pulled_keys
 
-def pull_table(table: FileTable, file_remote: Repo, ssh_settings: SshSettings, where: List[TableFilter], limit: Optional[int] = None, out_pulled_keys: Optional[List[AnnexKey]] = None) -> List[AnnexKey]:
+def pull_table(table: FileTable, file_remote: Repo, ssh_settings: SshSettings, where: List[RowFilter], limit: Optional[int] = None, out_pulled_keys: Optional[List[AnnexKey]] = None, diff_engine: str = "merge", jobs: int = 1) -> List[AnnexKey]:
     if out_pulled_keys is None:
         out_pulled_keys = []
     dolt = table.dolt
     local_uuid = context.local_uuid.get()
     remote_uuid = file_remote.uuid
 
-    with file_mover(file_remote, ssh_settings) as mover:
-        while True:
-            keys_and_submissions = list(diff_keys(dolt, str(remote_uuid), str(local_uuid), table.dataset_name, table.schema, where, limit))
-            has_more = pull_submissions_and_keys(keys_and_submissions, table, mover, local_uuid, out_pulled_keys)
-            if not has_more:
-                break
+    watermarks = SyncWatermarks()
+    with file_mover(file_remote, ssh_settings, jobs) as mover:
+        keys_and_submissions = diff_keys(dolt, str(remote_uuid), str(local_uuid), table.dataset_name, table.schema, where, limit, table.batch_size, watermarks, diff_engine)
+        missing: List[AnnexKey] = []
+        pull_submissions_and_keys(keys_and_submissions, table, mover, local_uuid, out_pulled_keys, missing)
+    if missing:
+        # Keys that failed to transfer must be diffed again, so the watermark can't move past them.
+        logger.warning(f"{len(missing)} keys couldn't be pulled from {file_remote.name}")
+        return out_pulled_keys
+    record_watermark(watermarks, keys_and_submissions, str(remote_uuid), str(local_uuid), table.dataset_name, where, limit)
     return out_pulled_keys
 
+def pull_dataset_from_remotes(dataset: Dataset, file_remotes: List[Repo], ssh_settings: SshSettings, where: List[RowFilter], limit: Optional[int] = None, out_pulled_keys: Optional[List[AnnexKey]] = None, diff_engine: str = "merge", jobs: int = 1) -> List[AnnexKey]:
+    if out_pulled_keys is None:
+        out_pulled_keys = []
+    for file_remote in file_remotes:
+        dataset.pull_from(file_remote)
+    for table in dataset.tables.values():
+        pull_table_from_remotes(table, file_remotes, ssh_settings, where, limit, out_pulled_keys, diff_engine, jobs)
+    return out_pulled_keys
+
+def pull_table_from_remotes(table: FileTable, file_remotes: List[Repo], ssh_settings: SshSettings, where: List[RowFilter], limit: Optional[int] = None, out_pulled_keys: Optional[List[AnnexKey]] = None, diff_engine: str = "merge", jobs: int = 1) -> List[AnnexKey]:
+    """
+    Pull a table's files from several remotes at once.
+
+    Each remote's diff against the local branch is computed separately, and the diffs are merged so that each
+    missing row is visited once, along with the remotes that hold it. Each key is fetched from one of its holders.
+    Watermarks are only recorded if every key was fetched, since a key that no holder could provide must be diffed again.
+    """
+    if out_pulled_keys is None:
+        out_pulled_keys = []
+    dolt = table.dolt
+    local_uuid = context.local_uuid.get()
+
+    watermarks = SyncWatermarks()
+    with ExitStack() as stack:
+        movers = [stack.enter_context(file_mover(file_remote, ssh_settings, jobs)) for file_remote in file_remotes]
+        diffs = [diff_keys(dolt, str(file_remote.uuid), str(local_uuid), table.dataset_name, table.schema, where, limit, table.batch_size, watermarks, diff_engine)
+                 for file_remote in file_remotes]
+        missing: List[AnnexKey] = []
+        for key, table_row in fetch_from_sources(merge_diffs(diffs), movers, table.batch_size, missing):
+            logger.info(f"pulled {table_row}: {key}")
+            table.insert_file_source(table_row, key, local_uuid)
+            out_pulled_keys.append(key)
+        table.flush()
+    if missing:
+        logger.warning(f"{len(missing)} keys couldn't be pulled from any remote")
+        return out_pulled_keys
+    for file_remote, diff in zip(file_remotes, diffs):
+        record_watermark(watermarks, diff, str(file_remote.uuid), str(local_uuid), table.dataset_name, where, limit)
+    return out_pulled_keys
+
+class SourceBalancer:
+    """
+    Chooses which remote to fetch each key from.
+
+    Each key goes to the holder that is expected to finish it soonest, given the bytes already assigned to each remote
+    and each remote's measured throughput. Remotes that haven't finished a transfer yet are assumed to be as fast as
+    the average measured remote, so every remote gets work until it has been measured.
+    """
+    # Bytes per second of each remote, as an exponential moving average. None until a transfer from the remote finishes.
+    throughput: List[Optional[float]]
+    # Bytes assigned to each remote that haven't finished transferring.
+    in_flight: List[int]
+    lock: threading.Lock
+
+    # The weight given to the most recent transfer in the moving average.
+    SMOOTHING = 0.3
+
+    def __init__(self, remotes: int):
+        self.throughput = [None] * remotes
+        self.in_flight = [0] * remotes
+        self.lock = threading.Lock()
+
+    def assign(self, holders: Iterable[int], size: int) -> int:
+        """Choose a remote for a key of the given size, and count it as in flight on that remote."""
+        with self.lock:
+            measured = [rate for rate in self.throughput if rate is not None]
+            default_rate = sum(measured) / len(measured) if measured else 1.0
+            def expected_finish(remote: int) -> float:
+                rate = self.throughput[remote]
+                return (self.in_flight[remote] + size) / (default_rate if rate is None else rate)
+            remote = min(holders, key=expected_finish)
+            self.in_flight[remote] += size
+            return remote
+
+    def finish(self, remote: int, size: int, landed_size: int, seconds: float):
+        """Record that keys of the given total size, assigned to a remote, finished transferring, and how much of it landed.
+        A remote that fails quickly is measured as slow, not fast."""
+        with self.lock:
+            self.in_flight[remote] -= size
+            if seconds <= 0:
+                return
+            # Keeps failing remotes from being measured at zero, so that they can still be chosen if they are the only holder.
+            rate = max(landed_size / seconds, 1.0)
+            previous = self.throughput[remote]
+            self.throughput[remote] = rate if previous is None else previous + self.SMOOTHING * (rate - previous)
+
+def fetch_from_sources[T](items: Iterable[Tuple[AnnexKey, T, List[int]]], movers: List[FileMover], rows_in_flight: int, out_missing: List[AnnexKey]) -> Iterator[Tuple[AnnexKey, T]]:
+    """
+    Fetch the key of each (key, row, holders) item from one of the listed remotes' movers, yielding the items whose keys landed.
+
+    Keys in a batch are spread across their holders by a SourceBalancer, and each remote's share is fetched concurrently.
+    If a remote fails or doesn't provide a key, the key fails over to another holder. Keys that no holder could provide
+    are appended to out_missing. Batching works like transfer_keys.
+    """
+    jobs = min(mover.jobs for mover in movers)
+    if all(mover.supports_packs for mover in movers):
+        batches = plan_packs(items, lambda item: item[0])
+        queue_size = max(jobs, rows_in_flight // PACK_MAX_KEYS)
+    else:
+        batches = ([item] for item in items)
+        queue_size = rows_in_flight
+    balancer = SourceBalancer(len(movers))
+
+    def fetch(remote: int, keys: List[AnnexKey]) -> Set[AnnexKey]:
+        start = time.monotonic()
+        landed: Set[AnnexKey] = set()
+        try:
+            landed = set(movers[remote].get_keys(keys))
+        except (OSError, *SESSION_ERRORS) as e:
+            logger.warning(f"Failed to pull {len(keys)} keys from {movers[remote].remote_cwd}: {e}")
+        balancer.finish(remote, sum(key_size(key) or 0 for key in keys), sum(key_size(key) or 0 for key in landed), time.monotonic() - start)
+        return landed
+
+    with ThreadPoolExecutor(max_workers=jobs * len(movers)) as executor:
+        def transfer_batch(batch: List[Tuple[AnnexKey, T, List[int]]]) -> List[Tuple[AnnexKey, T]]:
+            holders: Dict[AnnexKey, Set[int]] = {}
+            for key, _, remotes in batch:
+                holders.setdefault(key, set()).update(remotes)
+            tried: Dict[AnnexKey, Set[int]] = {key: set() for key in holders}
+            landed: Set[AnnexKey] = set()
+            pending = list(holders)
+            while pending:
+                assignments: Dict[int, List[AnnexKey]] = {}
+                for key in pending:
+                    candidates = sorted(holders[key] - tried[key])
+                    if not candidates:
+                        out_missing.append(key)
+                        continue
+                    remote = balancer.assign(candidates, key_size(key) or 0)
+                    tried[key].add(remote)
+                    assignments.setdefault(remote, []).append(key)
+                futures = [executor.submit(fetch, remote, keys) for remote, keys in assignments.items()]
+                for future in futures:
+                    landed |= future.result()
+                pending = [key for keys in assignments.values() for key in keys if key not in landed]
+            return [(key, row) for key, row, _ in batch if key in landed]
+
+        for batch in pipelined(batches, transfer_batch, queue_size, jobs):
+            yield from batch
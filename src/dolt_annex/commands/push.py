@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import heapq
+import itertools
 from uuid import UUID
 
-from typing_extensions import List, Iterable, Optional, Tuple
+from typing_extensions import Dict, List, Iterable, Iterator, Optional, Set, Tuple
 
 from plumbum import cli # type: ignore
 
@@ -12,10 +16,13 @@ from dolt_annex.config import get_config
 from dolt_annex.datatypes.table import DatasetSchema, DatasetSource
 from dolt_annex.dolt import DoltSqlServer
 from dolt_annex.table import Dataset, FileTable
-from dolt_annex.filestore import get_old_relative_annex_key_path, get_key_path
 from dolt_annex.datatypes import AnnexKey, FileTableSchema, Repo, TableRow
 from dolt_annex.logger import logger
-from dolt_annex.commands.sync import SshSettings, TableFilter, file_mover, FileMover, diff_query
+from dolt_annex.commands.sync import RowFilter, ShardFilter, SshSettings, TableFilter, file_mover, FileMover
+from dolt_annex.diff import DIFF_ENGINES, AntiJoinCursor, DiffCursor, DiffRows
+from dolt_annex.filestore.pack import PACK_MAX_KEYS, is_packable, plan_packs, read_members
+from dolt_annex.pipeline import pipelined
+from dolt_annex.watermarks import SyncWatermarks
 
 class Push(cli.Application):
     """Push imported files to a remote repository"""
@@ -53,7 +60,8 @@ class Push(cli.Application):
     remote = cli.SwitchAttr(
         "--remote",
         str,
-        help="The name of the dolt-annex remote",
+        list = True,
+        help="The name of a dolt-annex remote. Repeat to push to several remotes at once, reading each file once.",
     )
 
     dataset = cli.SwitchAttr(
@@ -62,6 +70,20 @@ class Push(cli.Application):
         help="The name of the dataset being pushed",
     )
 
+    jobs = cli.SwitchAttr(
+        "--jobs",
+        cli.Range(1, 64),
+        help="The number of files to transfer concurrently. SFTP remotes open one session per job.",
+        default = 1,
+    )
+
+    diff_engine = cli.SwitchAttr(
+        "--diff-engine",
+        cli.Set(*DIFF_ENGINES),
+        help="How to find the files that the remote is missing",
+        default = "merge",
+    )
+
     @cli.switch(
         "--where",
         str,
@@ -75,77 +97,212 @@ class Push(cli.Application):
             column_name, column_value = filter_string.split('=', maxsplit=1)
             self.filters.append(TableFilter(column_name, column_value))
 
-    filters: List[TableFilter] = []
+    @cli.switch(
+        "--shard",
+        str,
+        help="Only transfer keys in shard i of N, written i/N with 0 <= i < N. Runs with different shards of the same N never transfer the same key.",
+    )
+    def shard(self, shard: str):
+        self.filters.append(ShardFilter.parse(shard))
+
+    filters: List[RowFilter] = []
 
     def main(self, *args) -> int:
         """Entrypoint for push command"""
         dataset_schema = DatasetSchema.must_load(self.dataset)
-        remote_name = self.remote or self.parent.config.dolt_remote
-        remote = Repo.must_load(remote_name)
+        remote_names = self.remote or [self.parent.config.dolt_remote]
+        remotes = [Repo.must_load(remote_name) for remote_name in remote_names]
         with Dataset.connect(self.parent.config, self.batch_size, dataset_schema) as dataset:
             ssh_settings = SshSettings.create(
                 ssh_config=self.ssh_config,
                 known_hosts=self.known_hosts
             )
-            remote_source = DatasetSource(dataset_schema, remote)
-            remote_source.initialize(dataset.dolt)
-            push_dataset(dataset, remote, ssh_settings, self.filters, self.limit)
+            for remote in remotes:
+                remote_source = DatasetSource(dataset_schema, remote)
+                remote_source.initialize(dataset.dolt)
+            push_dataset_to_remotes(dataset, remotes, ssh_settings, self.filters, self.limit, diff_engine=self.diff_engine, jobs=self.jobs)
         return 0
 
-def push_dataset(dataset: Dataset, file_remote: Repo, ssh_settings: SshSettings, where: List[TableFilter], limit: Optional[int] = None, out_pushed_files: Optional[List[AnnexKey]] = None) -> List[AnnexKey]:
+def push_dataset(dataset: Dataset, file_remote: Repo, ssh_settings: SshSettings, where: List[RowFilter], limit: Optional[int] = None, out_pushed_files: Optional[List[AnnexKey]] = None, diff_engine: str = "merge", jobs: int = 1) -> List[AnnexKey]:
+    return push_dataset_to_remotes(dataset, [file_remote], ssh_settings, where, limit, out_pushed_files, diff_engine, jobs)
+
+def push_dataset_to_remotes(dataset: Dataset, file_remotes: List[Repo], ssh_settings: SshSettings, where: List[RowFilter], limit: Optional[int] = None, out_pushed_files: Optional[List[AnnexKey]] = None, diff_engine: str = "merge", jobs: int = 1) -> List[AnnexKey]:
     if out_pushed_files is None:
         out_pushed_files = []
-    dataset.pull_from(file_remote)
+    for file_remote in file_remotes:
+        dataset.pull_from(file_remote)
     for table in dataset.tables.values():
-        push_table(table, file_remote, ssh_settings, where, limit, out_pushed_files)
+        push_table_to_remotes(table, file_remotes, ssh_settings, where, limit, out_pushed_files, diff_engine, jobs)
     return out_pushed_files
 
-def push_table(table: FileTable, file_remote: Repo, ssh_settings: SshSettings, where: List[TableFilter], limit: Optional[int] = None, out_pushed_files: Optional[List[AnnexKey]] = None) -> List[AnnexKey]:
+def push_table(table: FileTable, file_remote: Repo, ssh_settings: SshSettings, where: List[RowFilter], limit: Optional[int] = None, out_pushed_files: Optional[List[AnnexKey]] = None, diff_engine: str = "merge", jobs: int = 1) -> List[AnnexKey]:
+    return push_table_to_remotes(table, [file_remote], ssh_settings, where, limit, out_pushed_files, diff_engine, jobs)
+
+def push_table_to_remotes(table: FileTable, file_remotes: List[Repo], ssh_settings: SshSettings, where: List[RowFilter], limit: Optional[int] = None, out_pushed_files: Optional[List[AnnexKey]] = None, diff_engine: str = "merge", jobs: int = 1) -> List[AnnexKey]:
+    """
+    Push a table's files to several remotes in a single pass.
+
+    Each remote's diff is computed separately, and the diffs are merged so that each row is visited once,
+    along with the remotes that are missing it. Each remote's branch and watermark are recorded independently.
+    """
     if out_pushed_files is None:
         out_pushed_files = []
     dolt = table.dolt
-    remote_uuid = file_remote.uuid
-    local_uuid = get_config().local_uuid
-    with file_mover(file_remote, ssh_settings) as mover:
-        while True:
-            keys_and_submissions = list(diff_keys(dolt, str(local_uuid), str(remote_uuid), table.dataset_name, table.schema, where, limit))
-            has_more = push_submissions_and_keys(keys_and_submissions, table, mover, remote_uuid, out_pushed_files)
-            if not has_more:
-                break
+    local_uuid = str(get_config().local_uuid)
+    watermarks = SyncWatermarks()
+    with ExitStack() as stack:
+        movers = [stack.enter_context(file_mover(file_remote, ssh_settings, jobs)) for file_remote in file_remotes]
+        diffs = [diff_keys(dolt, local_uuid, str(file_remote.uuid), table.dataset_name, table.schema, where, limit, table.batch_size, watermarks, diff_engine)
+                 for file_remote in file_remotes]
+        missing: List[Tuple[AnnexKey, int]] = []
+        push_submissions_and_keys(merge_diffs(diffs), table, movers, [file_remote.uuid for file_remote in file_remotes], out_pushed_files, missing)
     table.flush()
+    incomplete = {remote for _, remote in missing}
+    for remote, (file_remote, diff) in enumerate(zip(file_remotes, diffs)):
+        # Keys that failed to transfer must be diffed again, so the watermark can't move past them.
+        if remote in incomplete:
+            logger.warning(f"{sum(1 for _, r in missing if r == remote)} keys couldn't be pushed to {file_remote.name}")
+            continue
+        record_watermark(watermarks, diff, local_uuid, str(file_remote.uuid), table.dataset_name, where, limit)
 
     return out_pushed_files
 
-def push_submissions_and_keys(keys_and_submissions: Iterable[Tuple[AnnexKey, TableRow]], downloader: FileTable, mover: FileMover, remote_uuid: UUID, files_pushed: List[AnnexKey]) -> bool:
+def merge_diffs(diffs: List[Iterable[Tuple[AnnexKey, TableRow]]]) -> Iterator[Tuple[AnnexKey, TableRow, List[int]]]:
+    """
+    Merge several remotes' diffs, which are each in primary key order, into a single stream.
+    Yields each (key, row) once, with the indexes of the remotes whose diffs contain it.
+    """
+    def entries(index: int, diff: Iterable[Tuple[AnnexKey, TableRow]]) -> Iterator[Tuple[TableRow, AnnexKey, int]]:
+        for key, row in diff:
+            yield row, key, index
+
+    merged = heapq.merge(*(entries(index, diff) for index, diff in enumerate(diffs)))
+    for (row, key), group in itertools.groupby(merged, key=lambda entry: entry[:2]):
+        yield key, row, [index for _, _, index in group]
+
+def push_submissions_and_keys(keys_and_submissions: Iterable[Tuple[AnnexKey, TableRow, List[int]]], downloader: FileTable, movers: List[FileMover], remote_uuids: List[UUID], files_pushed: List[AnnexKey], out_missing: Optional[List[Tuple[AnnexKey, int]]] = None) -> bool:
+    """
+    Push each file to the remotes that are missing it, and record it in each of those remotes' branches.
+
+    Diff pages are read, files are transferred and rows are flushed to Dolt concurrently.
+    Up to jobs transfers run at once per remote, and small files are sent in packs if the remotes support them.
+    Rows are recorded in a deterministic order, and a row is only recorded for a remote after its file has been transferred there.
+    (key, remote) pairs whose transfer failed are appended to out_missing, if it's given.
+    """
     has_more = False
-    for key, submission in keys_and_submissions:
+    for key, submission, remotes in fan_out_keys(keys_and_submissions, movers, downloader.batch_size, out_missing):
         has_more = True
-        logger.info(f"pushing {submission}: {key}")
-        rel_key_path = get_key_path(key)
-        old_rel_key_path = get_old_relative_annex_key_path(key)
-        if not mover.put(old_rel_key_path, rel_key_path):
-            mover.put(rel_key_path, rel_key_path)
-        downloader.insert_file_source(submission, key, remote_uuid)
+        logger.info(f"pushed {submission}: {key}")
+        for remote in remotes:
+            downloader.insert_file_source(submission, key, remote_uuids[remote])
         files_pushed.append(key)
     downloader.flush()
     return has_more
 
-def diff_keys(dolt: DoltSqlServer, in_ref: str, not_in_ref: str, dataset_name: str, file_key_table: FileTableSchema, filters: List[TableFilter], limit = None) -> Iterable[Tuple[AnnexKey, TableRow]]:
+def fan_out_keys[T](items: Iterable[Tuple[AnnexKey, T, List[int]]], movers: List[FileMover], rows_in_flight: int, out_missing: Optional[List[Tuple[AnnexKey, int]]] = None) -> Iterator[Tuple[AnnexKey, T, List[int]]]:
+    """
+    Transfer the key of each (key, row, remotes) item to each listed remote's mover, yielding each item with the remotes it landed on.
+    Items that didn't land anywhere are dropped. The (key, remote) pairs that didn't land are appended to out_missing, if it's given.
+
+    Each batch is sent to all of the remotes that need it at the same time. If every remote can take packs that were already read
+    into memory, each packed file is read once, and the same bytes are sent to every remote that doesn't have it yet.
+    At most one pack per worker is held in memory. Files too large to pack are read by each remote's mover separately.
+    Batching works like transfer_keys.
+    """
+    jobs = min(mover.jobs for mover in movers)
+    shares_reads = all(mover.put_members_function is not None for mover in movers)
+    if all(mover.supports_packs for mover in movers):
+        batches = plan_packs(items, lambda item: item[0])
+        queue_size = max(jobs, rows_in_flight // PACK_MAX_KEYS)
+    else:
+        batches = ([item] for item in items)
+        queue_size = rows_in_flight
+
+    with ThreadPoolExecutor(max_workers=jobs * len(movers)) as executor:
+        def put_shared_pack(wanted: Dict[int, List[AnnexKey]]) -> Dict[int, Set[AnnexKey]]:
+            present_futures = {remote: executor.submit(movers[remote].present_keys, keys) for remote, keys in wanted.items()}
+            present = {remote: future.result() for remote, future in present_futures.items()}
+            needed = {key for remote, keys in wanted.items() for key in keys if key not in present[remote]}
+            # Every mover reads from the same local filestore.
+            sources = ((key, movers[0].local_source(key)) for key in needed)
+            members = read_members((key, path) for key, path in sources if path is not None)
+            futures = {}
+            for remote, keys in wanted.items():
+                remote_members = [(key, members[key]) for key in keys if key not in present[remote] and key in members]
+                if remote_members:
+                    futures[remote] = executor.submit(movers[remote].put_members, remote_members)
+            return {remote: present[remote].union(futures[remote].result() if remote in futures else []) for remote in wanted}
+
+        def transfer_batch(batch: List[Tuple[AnnexKey, T, List[int]]]) -> Tuple[List[Tuple[AnnexKey, T, List[int]]], List[Tuple[AnnexKey, int]]]:
+            wanted = {}
+            for remote in range(len(movers)):
+                keys = [key for key, _, remotes in batch if remote in remotes]
+                if keys:
+                    wanted[remote] = keys
+            if shares_reads and all(is_packable(key) for key, _, _ in batch):
+                landed = put_shared_pack(wanted)
+            else:
+                futures = {remote: executor.submit(movers[remote].put_keys, keys) for remote, keys in wanted.items()}
+                landed = {remote: set(future.result()) for remote, future in futures.items()}
+            results = []
+            missing = []
+            for key, row, remotes in batch:
+                landed_remotes = [remote for remote in remotes if key in landed[remote]]
+                missing.extend((key, remote) for remote in remotes if key not in landed[remote])
+                if landed_remotes:
+                    results.append((key, row, landed_remotes))
+            return results, missing
+
+        for batch, missing in pipelined(batches, transfer_batch, queue_size, jobs):
+            if out_missing is not None:
+                out_missing.extend(missing)
+            yield from batch
+
+def diff_keys(dolt: DoltSqlServer, in_ref: str, not_in_ref: str, dataset_name: str, file_key_table: FileTableSchema, filters: List[RowFilter], limit = None, page_size: int = 1000, watermarks: Optional[SyncWatermarks] = None, engine: str = "merge") -> DiffRows:
+    """
+    Returns the rows that exist in in_ref's branch of the dataset but not in not_in_ref's branch.
+
+    With the "antijoin" engine, the branches' tables are compared directly, without merging or committing,
+    a page of page_size rows at a time.
+    With the "merge" engine, if watermarks records a commit of in_ref's branch that was already fully transferred, only rows changed
+    since that commit are diffed, and rows that already exist in not_in_ref's branch are excluded.
+    Otherwise, both branches are merged into a union branch, and the diff between the current head of
+    not_in_ref's branch and the union branch is streamed.
+    """
+    in_ref_branch = f"{in_ref}-{dataset_name}"
+    not_in_ref_branch = f"{not_in_ref}-{dataset_name}"
+
+    if engine == "antijoin":
+        return AntiJoinCursor(dolt.session(in_ref_branch), file_key_table, f"{dolt.db_name}/{in_ref_branch}", f"{dolt.db_name}/{not_in_ref_branch}", filters, page_size, limit)
+    if engine != "merge":
+        raise ValueError(f"Unknown diff engine: {engine}")
+
+    watermark = watermarks.get(in_ref, not_in_ref, dataset_name, file_key_table.name) if watermarks else None
+    if watermark is not None:
+        in_ref_head = dolt.commit_working_set(in_ref_branch)
+        # The watermark is only valid if the branch hasn't been rewritten since it was recorded.
+        if dolt.is_ancestor(watermark, in_ref_head):
+            not_in_ref_head = dolt.commit_working_set(not_in_ref_branch)
+            logger.debug(f"Diffing {in_ref_branch} incrementally from {watermark}")
+            return DiffCursor(dolt, f"{dolt.db_name}/{in_ref_branch}", file_key_table, watermark, in_ref_head, filters, limit,
+                              exclude_database=f"{dolt.db_name}/{not_in_ref_head}", source_commit=in_ref_head)
+        logger.debug(f"Watermark {watermark} is not an ancestor of {in_ref_branch}, diffing all rows")
+
     refs = [in_ref, not_in_ref]
     refs.sort()
     union_branch_name = f"union-{refs[0]}-{refs[1]}-{dataset_name}"
     
-    in_ref_branch = f"{in_ref}-{dataset_name}"
-    not_in_ref_branch = f"{not_in_ref}-{dataset_name}"
     # Create the union branch if it doesn't exist
     with dolt.maybe_create_branch(union_branch_name, in_ref_branch):
         dolt.merge(in_ref_branch)
         dolt.merge(not_in_ref_branch)
-        query = diff_query(file_key_table, filters)
-        if limit is not None:
-            query += " LIMIT %s"
-            query_results = dolt.query(query, (not_in_ref_branch, union_branch_name, limit))
-        else:
-            query_results = dolt.query(query, (not_in_ref_branch, union_branch_name))
-        for (annex_key, _, *key_parts) in query_results:
-            yield (AnnexKey(annex_key), TableRow(key_parts))
\ No newline at end of file
+    from_commit = dolt.get_revision(not_in_ref_branch)
+    to_commit = dolt.get_revision(union_branch_name)
+    return DiffCursor(dolt, f"{dolt.db_name}/{union_branch_name}", file_key_table, from_commit, to_commit, filters, limit,
+                      source_commit=dolt.get_revision(in_ref_branch))
+
+def record_watermark(watermarks: SyncWatermarks, diff: DiffRows, in_ref: str, not_in_ref: str, dataset_name: str, filters: List[RowFilter], limit: Optional[int]):
+    """After every row of an unfiltered diff has been transferred and flushed, record its source commit as a watermark."""
+    if filters or limit is not None or diff.source_commit is None:
+        return
+    watermarks.set(in_ref, not_in_ref, dataset_name, diff.schema.name, diff.source_commit)
@@ -14,7 +14,7 @@ import paramiko
 
 from dolt_annex.application import Application
 from dolt_annex.logger import logger
-from dolt_annex.server import AnnexSftpServer, AnnexSshServer
+from dolt_annex.server import AnnexPackServer, AnnexSftpServer, AnnexSshServer, PACK_SUBSYSTEM
 
 class Server(cli.Application):
     """Starts a remote sandboxed SSH server"""
@@ -74,8 +74,10 @@ def run_transport(connection: socket.socket, key: paramiko.PKey, authorized_keys
     transport = paramiko.Transport(connection)
     transport.add_server_key(key)
     transport.set_subsystem_handler('sftp', paramiko.SFTPServer, AnnexSftpServer)
+    transport.set_subsystem_handler(PACK_SUBSYSTEM, AnnexPackServer)
     transport.start_server(server=ssh_server)
-    transport.accept()
+    # Subsystem handlers hold on to their own channels. Accepting a channel here and dropping it
+    # would close it, so channels are left for the handlers, and the transport keeps running in its own thread.
 
 
 def start_server(host, port, key, authorized_keys_dir, terminate_event=None):
@@ -1,16 +1,22 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from contextlib import contextmanager
+from abc import ABC, abstractmethod
+from contextlib import closing, contextmanager
 from dataclasses import dataclass, field
 import os
 from uuid import UUID
+import errno
 import getpass
+import queue
 import sys
 from pathlib import Path
+import threading
+import time
 
-from typing_extensions import List, Iterable, Optional, Generator, Tuple, Any
+from typing_extensions import BinaryIO, Callable, Dict, List, Iterable, Iterator, Optional, Generator, Set, Tuple, Any
 
+import paramiko # type: ignore
 import sftpretty # type: ignore
 from plumbum import cli # type: ignore
 
@@ -18,17 +24,51 @@ from dolt_annex.application import Application
 from dolt_annex.config import get_config
 from dolt_annex.dolt import DoltSqlServer
 from dolt_annex.table import Dataset, FileTable
-from dolt_annex.filestore import get_old_relative_annex_key_path, get_key_path
+from dolt_annex.filestore import MIXED_LAYOUT, get_key_path, key_paths
+from dolt_annex.filestore.pack import PACK_MAX_KEYS, copy_verified, first_existing, plan_packs, read_pack, store_members, write_pack, write_pack_members
+from dolt_annex.server import PACK_SUBSYSTEM
 from dolt_annex import move_functions
 from dolt_annex.move_functions import MoveFunction
 from dolt_annex.datatypes import Repo, AnnexKey, TableRow, FileTableSchema
 from dolt_annex.logger import logger
+from dolt_annex.pipeline import pipelined
+
+class RowFilter(ABC):
+    """A condition on the rows of a file table that are transferred."""
+
+    @abstractmethod
+    def condition(self, schema: FileTableSchema, prefix: str) -> Tuple[str, Tuple]:
+        """Returns a SQL condition and its parameters, for a query whose table columns are named with prefix."""
 
 @dataclass
-class TableFilter:
+class TableFilter(RowFilter):
     column_name: str
     column_value: Any
 
+    def condition(self, schema: FileTableSchema, prefix: str) -> Tuple[str, Tuple]:
+        return f"{prefix}{self.column_name} = %s", (self.column_value,)
+
+@dataclass
+class ShardFilter(RowFilter):
+    """
+    Restricts a transfer to the keys in one of several shards, so that separate processes or hosts can
+    split a transfer without overlapping. The shard is computed in SQL, so each shard's diff only returns its own rows.
+    Matches get_key_shard.
+    """
+    index: int
+    count: int
+
+    @staticmethod
+    def parse(shard: str) -> 'ShardFilter':
+        """Parse a shard written as i/N, where 0 <= i < N"""
+        index, _, count = shard.partition('/')
+        if not index.isdigit() or not count.isdigit() or not 0 <= int(index) < int(count):
+            raise ValueError(f"Invalid shard {shard}: expected i/N with 0 <= i < N")
+        return ShardFilter(int(index), int(count))
+
+    def condition(self, schema: FileTableSchema, prefix: str) -> Tuple[str, Tuple]:
+        return f"MOD(CONV(LEFT(MD5({prefix}{schema.file_column}), 8), 16, 10), %s) = %s", (self.count, self.index)
+
 @dataclass
 class SshSettings:
     ssh_config: Path
@@ -65,14 +105,29 @@ class FileMover:
     remote_cwd: Path
     put_function: MoveFunction
     get_function: MoveFunction
-
-    def __init__(self, put_function: MoveFunction, get_function: MoveFunction, remote_cwd: str, local_cwd = None) -> None:
+    # The number of put or get calls that can safely run concurrently.
+    jobs: int
+    local_layout: str
+    remote_layout: str
+    # Transfer many keys in a single pack, returning the keys that landed. None if the remote doesn't support packs.
+    put_pack_function: Optional[Callable[[List[Tuple[AnnexKey, Path]]], List[AnnexKey]]] = None
+    get_pack_function: Optional[Callable[[List[AnnexKey]], List[AnnexKey]]] = None
+    # Transfer many keys whose files were already read into memory in a single pack, returning the keys that landed.
+    put_members_function: Optional[Callable[[List[Tuple[AnnexKey, bytes]]], List[AnnexKey]]] = None
+    # Returns which of many keys the remote already has, in a single request. None if the remote can't answer in batches.
+    has_keys_function: Optional[Callable[[List[AnnexKey]], List[AnnexKey]]] = None
+
+    def __init__(self, put_function: MoveFunction, get_function: MoveFunction, remote_cwd: str, local_cwd = None, jobs: int = 1,
+                 local_layout: str = MIXED_LAYOUT, remote_layout: str = MIXED_LAYOUT) -> None:
         if local_cwd is None:
             local_cwd = os.getcwd()
         self.local_cwd = Path(local_cwd)
         self.remote_cwd = Path(remote_cwd)
         self.put_function = put_function
         self.get_function = get_function
+        self.jobs = jobs
+        self.local_layout = local_layout
+        self.remote_layout = remote_layout
 
     def put(self, local_path: Path, remote_path: Path) -> bool:
         """Move a file from the local filesystem to the remote filesystem"""
@@ -92,6 +147,65 @@ class FileMover:
             abs_remote_path,
             abs_local_path)
 
+    def put_key(self, key: AnnexKey) -> bool:
+        """Move a key to the remote, trying each path the local filestore's layout may store it at"""
+        remote_path = get_key_path(key)
+        return any(self.put(local_path, remote_path) for local_path in key_paths(key, self.local_layout))
+
+    def get_key(self, key: AnnexKey) -> bool:
+        """Move a key from the remote, trying each path the remote filestore's layout may store it at"""
+        local_path = get_key_path(key)
+        return any(self.get(local_path, remote_path) for remote_path in key_paths(key, self.remote_layout))
+
+    @property
+    def supports_packs(self) -> bool:
+        return self.put_pack_function is not None and self.get_pack_function is not None
+
+    def local_source(self, key: AnnexKey) -> Optional[Path]:
+        """The local path a key is stored at, or None if it isn't stored locally."""
+        return first_existing(self.local_cwd / path for path in key_paths(key, self.local_layout))
+
+    def present_keys(self, keys: List[AnnexKey]) -> Set[AnnexKey]:
+        """Which of many keys the remote already has, if it can check them in a single request. Otherwise, none of them."""
+        present: Set[AnnexKey] = set()
+        if len(keys) > 1 and self.has_keys_function is not None:
+            present = set(self.has_keys_function(keys))
+            if present:
+                logger.info(f"Skipping {len(present)} keys that {self.remote_cwd} already has")
+        return present
+
+    def put_keys(self, keys: List[AnnexKey]) -> List[AnnexKey]:
+        """
+        Move keys to the remote, in a single pack if the remote supports it. Returns the keys that are now on the remote.
+        If the remote can check many keys at once, keys it already has are skipped without being read.
+        """
+        present = self.present_keys(keys)
+        missing = [key for key in keys if key not in present]
+        if len(missing) <= 1 or self.put_pack_function is None:
+            landed = present.union(key for key in missing if self.put_key(key))
+        else:
+            sources = []
+            for key in missing:
+                path = self.local_source(key)
+                if path is not None:
+                    sources.append((key, path))
+            logger.info(f"Moving {len(sources)} keys to {self.remote_cwd} in a pack")
+            landed = present.union(self.put_pack_function(sources))
+        return [key for key in keys if key in landed]
+
+    def put_members(self, members: List[Tuple[AnnexKey, bytes]]) -> List[AnnexKey]:
+        """Move keys whose files were already read into memory to the remote in a single pack. Returns the keys that are now on the remote."""
+        assert self.put_members_function is not None
+        logger.info(f"Moving {len(members)} keys to {self.remote_cwd} in a pack")
+        return self.put_members_function(members)
+
+    def get_keys(self, keys: List[AnnexKey]) -> List[AnnexKey]:
+        """Move keys from the remote, in a single pack if the remote supports it. Returns the keys that are now stored locally."""
+        if len(keys) == 1 or self.get_pack_function is None:
+            return [key for key in keys if self.get_key(key)]
+        logger.info(f"Moving {len(keys)} keys from {self.remote_cwd} in a pack")
+        return self.get_pack_function(keys)
+
     @contextmanager
     def cd(self, local_path: Optional[str] = None, remote_path: Optional[str] = None):
         """Change the remote directory"""
@@ -105,52 +219,335 @@ class FileMover:
         self.local_cwd = old_local_cwd
         self.remote_cwd = old_remote_cwd
 
+def transfer_keys[T](items: Iterable[Tuple[AnnexKey, T]], transfer: Callable[[List[AnnexKey]], List[AnnexKey]], mover: FileMover, rows_in_flight: int, out_missing: Optional[List[AnnexKey]] = None) -> Iterator[Tuple[AnnexKey, T]]:
+    """
+    Transfer the key of each (key, row) item with mover.jobs workers, yielding the items whose keys landed.
+    Keys that didn't land are appended to out_missing, if it's given.
+
+    If the remote supports packs, small keys are transferred in packs. Items are yielded in a deterministic order,
+    and about rows_in_flight items are buffered between reading the input and consuming the output.
+    """
+    if mover.supports_packs:
+        batches = plan_packs(items, lambda item: item[0])
+        queue_size = max(mover.jobs, rows_in_flight // PACK_MAX_KEYS)
+    else:
+        batches = ([item] for item in items)
+        queue_size = rows_in_flight
+
+    def transfer_batch(batch: List[Tuple[AnnexKey, T]]) -> Tuple[List[Tuple[AnnexKey, T]], List[AnnexKey]]:
+        landed = set(transfer([key for key, _ in batch]))
+        return [item for item in batch if item[0] in landed], [key for key, _ in batch if key not in landed]
+
+    for batch, missing in pipelined(batches, transfer_batch, queue_size, mover.jobs):
+        if out_missing is not None:
+            out_missing.extend(missing)
+        yield from batch
+
+# Errors that mean an SFTP session is broken, so the transfer should be retried on a new session.
+SESSION_ERRORS = (EOFError, ConnectionError, TimeoutError, paramiko.SSHException)
+# Network errors that Python doesn't raise as ConnectionError, but that also mean the session is gone.
+SESSION_ERRNOS = {errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED, errno.ENOTCONN, errno.ETIMEDOUT,
+                  errno.ENETDOWN, errno.ENETUNREACH, errno.ENETRESET, errno.EHOSTDOWN, errno.EHOSTUNREACH}
+TRANSFER_ATTEMPTS = 3
+RETRY_DELAY = 1.0
+
+class SftpPool:
+    """A pool of independent SFTP sessions to the same remote, so that transfers can run concurrently.
+
+    Each transfer borrows a session for its duration. If a session breaks during a transfer,
+    only that session is reopened, and the transfer is retried on the new session.
+    A session that couldn't be reopened leaves an empty slot in the pool, which the next transfer to borrow it reopens.
+    """
+    connect: Callable[[], sftpretty.Connection]
+    # Open sessions, and None for each session that needs to be reopened.
+    sessions: queue.Queue
+
+    def __init__(self, connect: Callable[[], sftpretty.Connection], size: int):
+        self.connect = connect
+        self.sessions = queue.Queue()
+        try:
+            for _ in range(size):
+                self.sessions.put(connect())
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        while not self.sessions.empty():
+            sftp = self.sessions.get_nowait()
+            if sftp is not None:
+                close_session(sftp)
+
+    def run[R](self, transfer: Callable[[sftpretty.Connection], R]) -> R:
+        sftp = self.sessions.get()
+        try:
+            attempt = 1
+            while True:
+                try:
+                    if sftp is None:
+                        sftp = self.connect()
+                    return transfer(sftp)
+                except (OSError, EOFError, paramiko.SSHException) as e:
+                    if not is_session_error(e):
+                        raise
+                    if sftp is not None:
+                        close_session(sftp)
+                        sftp = None
+                    if attempt >= TRANSFER_ATTEMPTS:
+                        raise
+                    logger.warning(f"SFTP session failed ({e}), retrying on a new session")
+                    time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+                    attempt += 1
+        finally:
+            # Only live sessions are returned to the pool.
+            self.sessions.put(sftp)
+
+def is_session_error(e: BaseException) -> bool:
+    """Whether an error means that an SFTP session is broken, rather than that a single operation failed."""
+    return isinstance(e, SESSION_ERRORS) or (isinstance(e, OSError) and e.errno in SESSION_ERRNOS)
+
+def close_session(sftp: sftpretty.Connection):
+    try:
+        sftp.close()
+    except (OSError, EOFError, paramiko.SSHException) as e:
+        logger.debug(f"Error closing SFTP session: {e}")
+
+class RemoteDirectoryCache:
+    """Remembers the contents of remote key buckets, so that pushing a file costs one round trip per bucket
+    instead of several per file.
+
+    The first time a file is pushed into a bucket, the bucket is listed (or created, if it doesn't exist),
+    and later existence checks in that bucket are answered from the listing. The cache is shared by all of
+    the sessions in a pool. Servers that don't support listing directories fall back to checking each file.
+    """
+    # The size of each file in each listed bucket.
+    buckets: Dict[str, Dict[str, int]]
+    # Directories known to exist.
+    directories: Set[str]
+    listing_supported: bool
+    lock: threading.Lock
+
+    def __init__(self):
+        self.buckets = {}
+        self.directories = set()
+        self.listing_supported = True
+        self.lock = threading.Lock()
+
+    def bucket(self, sftp: sftpretty.Connection, directory: str) -> Optional[Dict[str, int]]:
+        """Return the sizes of the files in a remote directory, creating the directory if it doesn't exist.
+        Returns None if the server can't list directories."""
+        with self.lock:
+            if not self.listing_supported:
+                return None
+            if directory in self.buckets:
+                return self.buckets[directory]
+        try:
+            files = {attr.filename: attr.st_size for attr in sftp.listdir_attr(directory)}
+        except FileNotFoundError:
+            self.make_directory(sftp, directory)
+            files = {}
+        except (OSError, EOFError, paramiko.SSHException) as e:
+            if is_session_error(e):
+                raise
+            logger.debug(f"Remote can't list {directory} ({e}), checking files individually")
+            with self.lock:
+                self.listing_supported = False
+            return None
+        with self.lock:
+            self.directories.add(directory)
+            return self.buckets.setdefault(directory, files)
+
+    def make_directory(self, sftp: sftpretty.Connection, directory: str):
+        """Create a directory and any missing parents, assuming that directories seen before still exist."""
+        with self.lock:
+            if directory in self.directories:
+                return
+        try:
+            sftp.mkdir(directory)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                self.make_directory(sftp, Path(directory).parent.as_posix())
+                sftp.mkdir(directory)
+            elif not sftp.isdir(directory):
+                # Anything other than another session having created the directory concurrently.
+                raise
+        with self.lock:
+            self.directories.add(directory)
+
+    def add(self, directory: str, filename: str, size: int):
+        with self.lock:
+            if directory in self.buckets:
+                self.buckets[directory][filename] = size
+
+def sftp_put(sftp: sftpretty.Connection, local_path: Path, remote_path: Path, cache: RemoteDirectoryCache) -> bool:
+    """Move a file from the local filesystem to the remote filesystem using SFTP"""
+    if not local_path.exists():
+        return False
+    size = local_path.stat().st_size
+    directory = remote_path.parent.as_posix()
+    bucket = cache.bucket(sftp, directory)
+    if bucket is None:
+        try:
+            sftp.mkdir_p(directory)
+        except OSError:
+            # Another session may have created the directory concurrently.
+            if not sftp.isdir(directory):
+                raise
+        exists = sftp.exists(remote_path.as_posix()) and sftp.stat(remote_path.as_posix()).st_size == size
+    else:
+        exists = bucket.get(remote_path.name) == size
+    # A file of a different size is left over from an interrupted transfer, and is overwritten.
+    if exists:
+        logger.info(f"File {remote_path} already exists, skipping")
+        return True
+    sftp.put(local_path.as_posix(), remote_path.as_posix())
+    cache.add(directory, remote_path.name, size)
+    return True
+
+def sftp_get(sftp: sftpretty.Connection, remote_path: Path, local_path: Path) -> bool:
+    """Move a file from the remote filesystem to the local filesystem using SFTP"""
+    local_path.parent.mkdir(parents=True, exist_ok=True)
+    if not sftp.exists(remote_path.as_posix()):
+        return False
+    if local_path.exists():
+        logger.info(f"File {local_path} already exists, skipping")
+        return True
+    # Download to a temporary name, so that an interrupted transfer never leaves a partial file at the key's path.
+    partial_path = local_path.with_name(local_path.name + ".part")
+    sftp.get(remote_path.as_posix(), partial_path.as_posix())
+    os.replace(partial_path, local_path)
+    return True
+
+def open_pack_channel(sftp: sftpretty.Connection) -> paramiko.Channel:
+    """Open a channel to the remote's pack subsystem. Raises paramiko.SSHException if the remote isn't a dolt-annex server."""
+    # sftpretty doesn't expose its transport, but the subsystem needs a channel on the same SSH connection.
+    channel = sftp._transport.open_session() # pylint: disable=protected-access
+    try:
+        channel.invoke_subsystem(PACK_SUBSYSTEM)
+    except paramiko.SSHException:
+        channel.close()
+        raise
+    return channel
+
+def pack_commands(sftp: sftpretty.Connection) -> Set[str]:
+    """Ask the remote which pack subsystem commands it supports. Returns an empty set if the remote isn't a dolt-annex server."""
+    try:
+        channel = open_pack_channel(sftp)
+    except paramiko.SSHException:
+        return set()
+    with closing(channel):
+        with channel.makefile("wb") as wfile:
+            wfile.write(b"HELLO\n")
+            wfile.flush()
+        channel.shutdown_write()
+        with channel.makefile("rb") as rfile:
+            return set(rfile.readline().decode("utf-8").split())
+
+def sftp_has_keys(sftp: sftpretty.Connection, keys: List[AnnexKey]) -> List[AnnexKey]:
+    """Ask a dolt-annex server which of the keys it has, in a single request."""
+    with closing(open_pack_channel(sftp)) as channel:
+        with channel.makefile("wb") as wfile:
+            wfile.write(("HAS\n" + "".join(f"{key}\n" for key in keys) + "\n").encode("utf-8"))
+            wfile.flush()
+        channel.shutdown_write()
+        with channel.makefile("rb") as rfile:
+            return [AnnexKey(line.decode("utf-8").strip()) for line in rfile if line.strip()]
+
+def sftp_put_pack(sftp: sftpretty.Connection, sources: List[Tuple[AnnexKey, Path]]) -> List[AnnexKey]:
+    """Send keys to a dolt-annex server in a single pack. Returns the keys that the server stored."""
+    return sftp_send_pack(sftp, lambda wfile: write_pack(sources, wfile))
+
+def sftp_put_pack_members(sftp: sftpretty.Connection, members: List[Tuple[AnnexKey, bytes]]) -> List[AnnexKey]:
+    """Send keys whose files were already read into memory to a dolt-annex server in a single pack. Returns the keys that the server stored."""
+    return sftp_send_pack(sftp, lambda wfile: write_pack_members(members, wfile))
+
+def sftp_send_pack(sftp: sftpretty.Connection, write: Callable[[BinaryIO], Any]) -> List[AnnexKey]:
+    """Send a pack written by write to a dolt-annex server. Returns the keys that the server stored."""
+    with closing(open_pack_channel(sftp)) as channel:
+        with channel.makefile("wb") as wfile:
+            wfile.write(b"PUT\n")
+            write(wfile)
+            wfile.flush()
+        channel.shutdown_write()
+        with channel.makefile("rb") as rfile:
+            return [AnnexKey(line.decode("utf-8").strip()) for line in rfile if line.strip()]
+
+def sftp_get_pack(sftp: sftpretty.Connection, keys: List[AnnexKey], local_root: Path) -> List[AnnexKey]:
+    """Receive keys from a dolt-annex server in a single pack, storing them under local_root. Returns the keys that were stored."""
+    with closing(open_pack_channel(sftp)) as channel:
+        with channel.makefile("wb") as wfile:
+            wfile.write(("GET\n" + "".join(f"{key}\n" for key in keys) + "\n").encode("utf-8"))
+            wfile.flush()
+        channel.shutdown_write()
+        with channel.makefile("rb") as rfile:
+            return read_pack(rfile, local_root)
+
+def sftp_connector(remote: Repo, ssh_settings: SshSettings) -> Callable[[], sftpretty.Connection]:
+    """Returns a function that opens a new SFTP session to a remote whose files_url is user@host:path."""
+    user, rest = remote.files_url.split('@', maxsplit=1)
+    host, path = rest.split(':', maxsplit=1)
+
+    cnopts = sftpretty.CnOpts(config=ssh_settings.ssh_config, knownhosts=ssh_settings.known_hosts)
+    cnopts.log_level = 'error'
+
+    extra_opts = {}
+    if get_config().encrypted_ssh_key:
+        extra_opts["private_key_pass"] = getpass.getpass("Enter passphrase for private key: ")
+
+    def connect() -> sftpretty.Connection:
+        return sftpretty.Connection(host, cnopts=cnopts, username = user, default_path = path, **extra_opts)
+    return connect
+
 @contextmanager
-def file_mover(remote: Repo, ssh_settings: SshSettings) -> Generator[FileMover, None, None]:
+def file_mover(remote: Repo, ssh_settings: SshSettings, jobs: int = 1) -> Generator[FileMover, None, None]:
+    """
+    Connect to a remote's file store.
+
+    The returned mover can run up to jobs transfers concurrently. For SFTP remotes, that many sessions are opened.
+    For file:// remotes, each transfer is an independent local copy, which keeps fast or networked filesystems busy.
+    """
     base_config = get_config()
     local_path = os.path.abspath(base_config.files_dir)
     if '@' in remote.files_url:
-        user, rest = remote.files_url.split('@', maxsplit=1)
-        host, path = rest.split(':', maxsplit=1)
-
-        cnopts = sftpretty.CnOpts(config=ssh_settings.ssh_config, knownhosts=ssh_settings.known_hosts)
-        cnopts.log_level = 'error'
-
-        extra_opts = {}
-        if base_config.encrypted_ssh_key:
-            extra_opts["private_key_pass"] = getpass.getpass("Enter passphrase for private key: ")
-
-        with sftpretty.Connection(host, cnopts=cnopts, username = user, default_path = path, **extra_opts) as sftp:
-            def sftp_put(
-                local_path: Path,
-                remote_path: Path,
-            ) -> bool:
-                """Move a file from the local filesystem to the remote filesystem using SFTP"""
-                if not local_path.exists():
-                    return False
-                sftp.mkdir_p(remote_path.parent.as_posix())
-                if sftp.exists(remote_path.as_posix()):
-                    logger.info(f"File {remote_path} already exists, skipping")
-                    return True
-                sftp.put(local_path.as_posix(), remote_path.as_posix())
-                return True
-            def sftp_get(
-                remote_path: Path,
-                local_path: Path,
-            ) -> bool:
-                """Move a file from the remote filesystem to the local filesystem using SFTP"""
-                local_path.parent.mkdir(parents=True, exist_ok=True)
-                if not sftp.exists(remote_path.as_posix()):
-                    return False
-                if local_path.exists():
-                    logger.info(f"File {local_path} already exists, skipping")
-                    return True
-                sftp.get(remote_path.as_posix(), local_path.as_posix())
-                return True
-            yield FileMover(sftp_put, sftp_get, sftp.getcwd(), local_path)
+        with SftpPool(sftp_connector(remote, ssh_settings), jobs) as pool:
+            remote_cwd = pool.run(lambda sftp: sftp.getcwd())
+            directory_cache = RemoteDirectoryCache()
+            mover = FileMover(
+                lambda local_path, remote_path: pool.run(lambda sftp: sftp_put(sftp, local_path, remote_path, directory_cache)),
+                lambda remote_path, local_path: pool.run(lambda sftp: sftp_get(sftp, remote_path, local_path)),
+                remote_cwd,
+                local_path,
+                jobs,
+                base_config.files_layout,
+                remote.layout,
+            )
+            # Plain SFTP servers don't have the pack subsystem, so every key is transferred individually.
+            commands = pool.run(pack_commands)
+            if {"PUT", "GET"} <= commands:
+                mover.put_pack_function = lambda sources: pool.run(lambda sftp: sftp_put_pack(sftp, sources))
+                mover.put_members_function = lambda members: pool.run(lambda sftp: sftp_put_pack_members(sftp, members))
+                mover.get_pack_function = lambda keys: pool.run(lambda sftp: sftp_get_pack(sftp, keys, Path(local_path)))
+            if "HAS" in commands:
+                mover.has_keys_function = lambda keys: pool.run(lambda sftp: sftp_has_keys(sftp, keys))
+            yield mover
     elif remote.files_url.startswith("file://"):
         # Remote path may be relative to the local git directory
-        yield FileMover(move_functions.copy, move_functions.copy, remote.files_url[7:], local_path)
+        mover = FileMover(move_functions.fast_copy, move_functions.fast_copy, remote.files_url[7:], local_path, jobs, base_config.files_layout, remote.layout)
+        # Local copies don't have a per-file round trip to amortize, but small keys are still verified as if they were unpacked.
+        mover.put_pack_function = lambda sources: copy_verified(sources, mover.remote_cwd)
+        mover.put_members_function = lambda members: store_members(members, mover.remote_cwd)
+        def get_pack(keys: List[AnnexKey]) -> List[AnnexKey]:
+            sources = [(key, first_existing(mover.remote_cwd / path for path in key_paths(key, mover.remote_layout))) for key in keys]
+            return copy_verified(((key, source) for key, source in sources if source is not None), mover.local_cwd)
+        mover.get_pack_function = get_pack
+        mover.has_keys_function = lambda keys: [key for key in keys if first_existing(mover.remote_cwd / path for path in key_paths(key, mover.remote_layout))]
+        yield mover
     else:
         raise ValueError(f"Unknown remote URL format: {remote.files_url}")
     
@@ -201,6 +598,13 @@ class Sync(cli.Application):
         help="The name of the table being synced",
     )
 
+    jobs = cli.SwitchAttr(
+        "--jobs",
+        cli.Range(1, 64),
+        help="The number of files to transfer concurrently. SFTP remotes open one session per job.",
+        default = 1,
+    )
+
     @cli.switch(
         "--where",
         str,
@@ -214,7 +618,15 @@ class Sync(cli.Application):
             column_name, column_value = filter_string.split('=', maxsplit=1)
             self.filters.append(TableFilter(column_name, column_value))
 
-    filters: List[TableFilter] = []
+    @cli.switch(
+        "--shard",
+        str,
+        help="Only transfer keys in shard i of N, written i/N with 0 <= i < N. Runs with different shards of the same N never transfer the same key.",
+    )
+    def shard(self, shard: str):
+        self.filters.append(ShardFilter.parse(shard))
+
+    filters: List[RowFilter] = []
 
     def main(self, *args) -> int:
         """Entrypoint for sync command"""
@@ -225,26 +637,27 @@ class Sync(cli.Application):
         remote = Repo.must_load(remote_name)
         with Dataset.connect(self.parent.config, table, self.batch_size) as dataset:
             ssh_settings = SshSettings(Path(self.ssh_config), Path(self.known_hosts))
-            sync_dataset(dataset, remote, ssh_settings, self.table, self.filters, self.limit)
+            sync_dataset(dataset, remote, ssh_settings, self.table, self.filters, limit=self.limit, jobs=self.jobs)
         return 0
 
-def sync_dataset(dataset: Dataset, file_remote: Repo, ssh_settings: SshSettings, file_key_table: FileTableSchema, where: List[TableFilter], diff_type: str = "", limit: Optional[int] = None, sync_results: Optional[SyncResults] = None) -> SyncResults:
+def sync_dataset(dataset: Dataset, file_remote: Repo, ssh_settings: SshSettings, file_key_table: FileTableSchema, where: List[RowFilter], diff_type: str = "", limit: Optional[int] = None, sync_results: Optional[SyncResults] = None, jobs: int = 1) -> SyncResults:
     if sync_results is None:
         sync_results = SyncResults()
     dataset.pull_from(file_remote)
     for table in dataset.tables.values():
-        sync_table(table, file_remote, ssh_settings, file_key_table, where, diff_type, limit, sync_results)
+        sync_table(table, file_remote, ssh_settings, file_key_table, where, diff_type, limit, sync_results, jobs)
     return sync_results
 
-def sync_table(table: FileTable, file_remote: Repo, ssh_settings: SshSettings, file_key_table: FileTableSchema, where: List[TableFilter], diff_type: str = "", limit: Optional[int] = None, sync_results: Optional[SyncResults] = None) -> SyncResults:
+def sync_table(table: FileTable, file_remote: Repo, ssh_settings: SshSettings, file_key_table: FileTableSchema, where: List[RowFilter], diff_type: str = "", limit: Optional[int] = None, sync_results: Optional[SyncResults] = None, jobs: int = 1) -> SyncResults:
     dolt = table.dolt
     remote_uuid = file_remote.uuid
     local_uuid = get_config().local_uuid
 
-    with file_mover(file_remote, ssh_settings) as mover:
+    with file_mover(file_remote, ssh_settings, jobs) as mover:
         total_files_synced = SyncResults()
         while True:
-            keys_and_submissions = diff_keys(dolt, str(local_uuid), str(remote_uuid), file_key_table, where, limit)
+            # The diff runs on the main connection, which flushing also uses, so it's read before transfers start.
+            keys_and_submissions = list(diff_keys(dolt, str(local_uuid), str(remote_uuid), file_key_table, where, limit))
             has_more = sync_keys(keys_and_submissions, table, mover, remote_uuid, total_files_synced)
             if not has_more:
                 break
@@ -253,23 +666,29 @@ def sync_table(table: FileTable, file_remote: Repo, ssh_settings: SshSettings, f
     return total_files_synced
 
 def sync_keys(keys: Iterable[Tuple[AnnexKey, str, TableRow]], downloader: FileTable, mover: FileMover, remote_uuid: UUID, files_synced: SyncResults) -> bool:
-    has_more = False
-    for key, diff_type, table_row in keys:
-        has_more = True
-        rel_key_path = get_key_path(key)
+    """
+    Transfer each key in whichever direction its diff type needs, and record a row only once its file was transferred.
+    Returns whether any file was transferred, so that rows whose transfers failed aren't retried forever.
+    """
+    def sync_file(key_and_row: Tuple[AnnexKey, str, TableRow]) -> Tuple[bool, Tuple[AnnexKey, str, TableRow]]:
+        key, diff_type, _ = key_and_row
         match diff_type:
             case 'added':
-                old_rel_key_path = get_old_relative_annex_key_path(key)
-                if not mover.put(old_rel_key_path, rel_key_path):
-                    mover.put(rel_key_path, rel_key_path)
+                transferred = mover.put_key(key)
             case 'removed':
-                if not mover.get(rel_key_path, rel_key_path):
-                    old_rel_key_path = get_old_relative_annex_key_path(key)
-                    mover.get(old_rel_key_path, rel_key_path)
+                transferred = mover.get_key(key)
             case 'modified':
                 raise FileModifiedError(key)
             case _:
                 raise ValueError(f"Unknown diff type returned: {diff_type}")
+        return transferred, key_and_row
+
+    has_more = False
+    for transferred, (key, _, table_row) in pipelined(keys, sync_file, downloader.batch_size, mover.jobs):
+        if not transferred:
+            logger.warning(f"Failed to transfer {key}, not recording it")
+            continue
+        has_more = True
         downloader.insert_file_source(table_row, key, remote_uuid)
         files_synced.files_pushed.append(key)
     downloader.flush()
@@ -279,18 +698,19 @@ def pull_personal_branch(dolt: DoltSqlServer, remote: Repo) -> None:
     """Fetch the personal branch for the remote"""
     dolt.pull_branch(str(remote.uuid), remote)
 
-def diff_keys(dolt: DoltSqlServer, local_ref: str, remote_ref: str, file_key_table: FileTableSchema, filters: List[TableFilter], limit = None) -> Iterable[Tuple[AnnexKey, str, TableRow]]:
+def diff_keys(dolt: DoltSqlServer, local_ref: str, remote_ref: str, file_key_table: FileTableSchema, filters: List[RowFilter], limit = None) -> Iterable[Tuple[AnnexKey, str, TableRow]]:
     query = diff_query(file_key_table, filters)
+    values = tuple(value for f in filters for value in f.condition(file_key_table, "to_")[1])
     
     if limit is not None:
         query += " LIMIT %s"
-        query_results = dolt.query(query, (remote_ref, local_ref, limit))
+        query_results = dolt.query(query, (remote_ref, local_ref, *values, limit))
     else:
-        query_results = dolt.query(query, (remote_ref, local_ref))
+        query_results = dolt.query(query, (remote_ref, local_ref, *values))
     for (annex_key, diff_type, *key_parts) in query_results:
         yield (AnnexKey(annex_key), diff_type, TableRow(*key_parts))
 
-def diff_query(file_key_table: FileTableSchema, filters: List[TableFilter]) -> str:
+def diff_query(file_key_table: FileTableSchema, filters: List[RowFilter]) -> str:
     """
     Generates a SQL query to identify the files that exist on one remote but not another.
     Note that generating a SQL query this way is not safe from SQL injection, but SQL injection
@@ -302,6 +722,6 @@ def diff_query(file_key_table: FileTableSchema, filters: List[TableFilter]) -> s
             to_{file_key_table.file_column}, `diff_type`, {",".join("to_" + col for col in file_key_table.key_columns)}
         FROM dolt_commit_diff_{file_key_table.name}
         WHERE from_commit = HASHOF(%s) AND to_commit = HASHOF(%s)
-        {''.join(f" AND to_{f.column_name} = %s" for f in filters)}
+        {''.join(f" AND {f.condition(file_key_table, 'to_')[0]}" for f in filters)}
         """
 
@@ -20,6 +20,7 @@ class Config:
     email: str
     name: str
     spawn_dolt_server: bool = True
+    shared_dolt_server: bool = False
     dolt_host: str = "localhost"
     dolt_server_socket: str = "/tmp/mysql.sock"
     annexcommitmessage: str = "update git-annex"
@@ -27,6 +28,10 @@ class Config:
     uuid: Optional[UUID] = None
     encrypted_ssh_key: bool = False
     dolt_port: Optional[int] = None
+    files_layout: str = "mixed"
+    slow_query_threshold: Optional[float] = None
+    slow_query_log: Optional[Path] = None
+    query_stats: Optional[Path] = None
 
     @property
     def local_uuid(self) -> UUID:
@@ -46,6 +51,7 @@ class Config:
             name="local",
             uuid=self.local_uuid,
             files_url=self.files_dir.as_posix(),
+            layout=self.files_layout,
         )
 
 config = ContextVar[Config]('config')
@@ -3,7 +3,7 @@
 
 import json
 from pathlib import Path
-from typing_extensions import Self, Optional
+from typing_extensions import List, Self, Optional
 
 from dataclass_wizard import fromdict, asdict
 
@@ -39,6 +39,13 @@ def Loadable(extension: str, config_dir = Path(".")):
                 raise ValueError(f"Could not load {name}")
             return result
         
+        @classmethod
+        def load_all(cls) -> List[Self]:
+            """
+            Returns every instance that has a JSON file, ordered by name.
+            """
+            return [cls.must_load(path.name[:-len(f".{extension}")]) for path in sorted(config_dir.glob(f"*.{extension}"))]
+
         def save_as(self, name: str):
             """
             Saves the instance to a JSON file.
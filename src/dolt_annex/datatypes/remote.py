@@ -16,6 +16,9 @@ class Repo(Loadable("remote")):
     uuid: UUID
     files_url: str
     dolt_remote: str = ""
+    # How keys are arranged in the repository's filestore. See filestore.LAYOUTS.
+    # Until a filestore has been migrated with migrate-layout, it may contain keys in either layout.
+    layout: str = "mixed"
 
     def files_dir(self) -> Path:
         """
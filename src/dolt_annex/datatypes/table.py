@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from dataclasses import dataclass
-from typing_extensions import List
+from typing_extensions import List, Optional
 
 from dolt_annex.dolt import DoltSqlServer
 
@@ -19,13 +19,35 @@ class FileTableSchema(Loadable("table")):
     file_column: str
     key_columns: List[str]
 
-    def insert_sql(self) -> str:
+    def qualified_name(self, database: Optional[str] = None) -> str:
+        """
+        Returns the name of the table, qualified with the database if one is provided
+        (such as a branch-qualified database `db/branch`).
+        """
+        return f"`{database}`.{self.name}" if database else self.name
+
+    def columns(self) -> List[str]:
+        """
+        Returns the columns written by inserts: the file column followed by the key columns.
+        """
+        return [self.file_column] + self.key_columns
+
+    def insert_sql(self, database: Optional[str] = None) -> str:
         """
         Returns the SQL statement to insert a row into the table.
         """
-        cols = ", ".join([self.file_column] + self.key_columns)
-        placeholders = ", ".join(["%s"] * (1 + len(self.key_columns)))
-        return f"REPLACE INTO {self.name} ({cols}) VALUES ({placeholders})"
+        cols = ", ".join(self.columns())
+        placeholders = ", ".join(["%s"] * len(self.columns()))
+        return f"REPLACE INTO {self.qualified_name(database)} ({cols}) VALUES ({placeholders})"
+
+    def load_data_sql(self, database: Optional[str] = None) -> str:
+        """
+        Returns the SQL statement to load a tab-separated file of rows into the table.
+        The path of the file is the statement's only parameter.
+        """
+        cols = ", ".join(self.columns())
+        return (f"LOAD DATA LOCAL INFILE %s REPLACE INTO TABLE {self.qualified_name(database)} "
+                f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({cols})")
     
 @dataclass
 class DatasetSchema(Loadable("dataset")):
@@ -56,6 +78,6 @@ class DatasetSource:
         """
         Ensures that the Dolt repo contains the necessary branches for this dataset.
         """
-        dolt.maybe_create_branch(f"{self.repo.uuid}-{self.schema.name}", self.schema.empty_table_ref)
+        dolt.create_branch_if_missing(f"{self.repo.uuid}-{self.schema.name}", self.schema.empty_table_ref)
 
     
\ No newline at end of file
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Functionality for finding the files that exist on one remote but not another."""
+
+from abc import ABC, abstractmethod
+
+from typing_extensions import Iterator, List, Optional, Tuple
+
+from dolt_annex.dolt import DoltSession, DoltSqlServer
+from dolt_annex.datatypes import AnnexKey, FileTableSchema, TableRow
+from dolt_annex.logger import logger
+
+# "merge" diffs against a union branch that both branches are merged into.
+# "antijoin" compares the two branches' tables directly, and never writes to the database.
+DIFF_ENGINES = ["merge", "antijoin"]
+
+class DiffRows(ABC):
+    """
+    The rows of (file key, *key columns) that one branch of a file table has and another doesn't, in primary key order.
+
+    source_commit is the commit of the source branch whose rows are all covered, if there is one.
+    Once every row has been consumed, it can be recorded as a watermark for later incremental diffs.
+    """
+    schema: FileTableSchema
+    filters: List
+    limit: Optional[int]
+    source_commit: Optional[str] = None
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[Tuple[AnnexKey, TableRow]]:
+        ...
+
+class KeysetCursor(DiffRows):
+    """
+    Pages through rows using keyset pagination.
+    Each page resumes after the last key of the previous page, so no rows are returned twice, even if rows are written while paging.
+
+    Subclasses provide the query for each page.
+    """
+    session: DoltSession
+    page_size: int
+
+    @abstractmethod
+    def query(self, after_key: Optional[TableRow]) -> Tuple[str, Tuple]:
+        """Returns the SQL query and parameters for the page following after_key. The page size is appended as the final parameter."""
+
+    def pages(self) -> Iterator[List[Tuple[AnnexKey, TableRow]]]:
+        """Yield the rows a page at a time."""
+        after_key: Optional[TableRow] = None
+        remaining = self.limit
+        while remaining is None or remaining > 0:
+            page_size = self.page_size if remaining is None else min(self.page_size, remaining)
+            query, values = self.query(after_key)
+            page = [(AnnexKey(annex_key), TableRow(key_parts)) for (annex_key, *key_parts) in self.session.query(query, values + (page_size,))]
+            if not page:
+                return
+            logger.debug(f"diff page of {len(page)} rows after {after_key}")
+            yield page
+            if len(page) < page_size:
+                return
+            after_key = page[-1][1]
+            if remaining is not None:
+                remaining -= len(page)
+
+    def __iter__(self) -> Iterator[Tuple[AnnexKey, TableRow]]:
+        for page in self.pages():
+            yield from page
+
+class DiffCursor(DiffRows):
+    """
+    Streams the rows of a file table that were added or modified between two commits.
+
+    The diff is computed once, by a single query whose rows are read from the server as they're consumed,
+    on a connection of its own so that other statements can run while it's open. Because the diff is between
+    two fixed commit hashes, rows written meanwhile (such as records of files that were just pushed) don't change it.
+    Iterating again runs the query again. Closing the iterator early aborts the query on the server.
+
+    If exclude_database is set, rows that already exist with the same file in that database's copy
+    of the table (such as a revision database `db/<commit>`) are left out of the diff.
+    """
+    dolt: DoltSqlServer
+    database: str
+    from_commit: str
+    to_commit: str
+    exclude_database: Optional[str]
+
+    def __init__(self, dolt: DoltSqlServer, database: str, schema: FileTableSchema, from_commit: str, to_commit: str, filters: List, limit: Optional[int] = None,
+                 exclude_database: Optional[str] = None, source_commit: Optional[str] = None):
+        self.dolt = dolt
+        self.database = database
+        self.schema = schema
+        self.from_commit = from_commit
+        self.to_commit = to_commit
+        self.filters = filters
+        self.limit = limit
+        self.exclude_database = exclude_database
+        self.source_commit = source_commit
+
+    def query(self) -> Tuple[str, Tuple]:
+        """Returns the SQL query and parameters for the whole diff."""
+        key_columns = ", ".join(f"to_{col}" for col in self.schema.key_columns)
+        conditions = ["from_commit = %s", "to_commit = %s", "diff_type != 'removed'"]
+        values: Tuple = (self.from_commit, self.to_commit)
+        for f in self.filters:
+            condition, condition_values = f.condition(self.schema, "to_")
+            conditions.append(condition)
+            values += condition_values
+        if self.exclude_database is not None:
+            matches = " AND ".join(f"existing.{col} = to_{col}" for col in self.schema.columns())
+            conditions.append(f"NOT EXISTS (SELECT 1 FROM {self.schema.qualified_name(self.exclude_database)} AS existing WHERE {matches})")
+        query = f"""
+            SELECT to_{self.schema.file_column}, {key_columns}
+            FROM dolt_commit_diff_{self.schema.name}
+            WHERE {" AND ".join(conditions)}
+            ORDER BY {key_columns}
+            """
+        if self.limit is not None:
+            query += "LIMIT %s\n"
+            values += (self.limit,)
+        return query, values
+
+    def __iter__(self) -> Iterator[Tuple[AnnexKey, TableRow]]:
+        query, values = self.query()
+        for annex_key, *key_parts in self.dolt.query(query, values, stream=True, database=self.database):
+            yield AnnexKey(annex_key), TableRow(key_parts)
+
+class AntiJoinCursor(KeysetCursor):
+    """
+    Pages through the rows of a file table in one database that don't exist with the same file in another.
+
+    Unlike a DiffCursor over a union branch, this reads the two branch-qualified tables directly with an
+    anti-join on the primary key, so it never merges or commits anything. Because branch-qualified tables
+    include uncommitted changes, rows written while paging are visible to later pages, but each page resumes
+    after the last key of the previous page, so rows that were just recorded are never revisited.
+    """
+    source_database: str
+    exclude_database: str
+
+    def __init__(self, session: DoltSession, schema: FileTableSchema, source_database: str, exclude_database: str, filters: List, page_size: int, limit: Optional[int] = None):
+        self.session = session
+        self.schema = schema
+        self.source_database = source_database
+        self.exclude_database = exclude_database
+        self.filters = filters
+        self.page_size = page_size
+        self.limit = limit
+
+    def query(self, after_key: Optional[TableRow]) -> Tuple[str, Tuple]:
+        key_columns = ", ".join(f"source.{col}" for col in self.schema.key_columns)
+        matches = " AND ".join(f"existing.{col} = source.{col}" for col in self.schema.columns())
+        conditions = [f"NOT EXISTS (SELECT 1 FROM {self.schema.qualified_name(self.exclude_database)} AS existing WHERE {matches})"]
+        values: Tuple = ()
+        for f in self.filters:
+            condition, condition_values = f.condition(self.schema, "source.")
+            conditions.append(condition)
+            values += condition_values
+        if after_key is not None:
+            conditions.append(f"({key_columns}) > ({', '.join(['%s'] * len(after_key))})")
+            values += tuple(after_key)
+        query = f"""
+            SELECT source.{self.schema.file_column}, {key_columns}
+            FROM {self.schema.qualified_name(self.source_database)} AS source
+            WHERE {" AND ".join(conditions)}
+            ORDER BY {key_columns}
+            LIMIT %s
+            """
+        return query, values
@@ -3,17 +3,39 @@
 
 """Functionality for interacting with the Dolt server."""
 
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import json
+import os
 from pathlib import Path
+import signal
+import socket
+import subprocess
+import threading
 import time
 
-from typing_extensions import Any, Dict, Tuple
+from typing_extensions import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 from plumbum import local # type: ignore
 import pymysql
 
 from dolt_annex.logger import logger
+from dolt_annex.query_stats import InstrumentedCursor, InstrumentedSSCursor, QueryStats
 from dolt_annex.datatypes.remote import Repo
 
+if os.name != 'nt':
+    import fcntl
+
+# Readiness polling starts with a short delay and backs off up to a maximum,
+# so that a fast server is detected almost immediately.
+SERVER_POLL_INITIAL_DELAY = 0.01
+SERVER_POLL_MAX_DELAY = 0.25
+SERVER_START_TIMEOUT = 60
+SERVER_STOP_TIMEOUT = 30
+
+# The number of rows read from the server at a time when iterating over query results.
+QUERY_FETCH_SIZE = 1000
+
 class DoltSqlServer:
     """A connection to a Dolt SQL server."""
     db_config: Dict[str, Any]
@@ -21,16 +43,36 @@ class DoltSqlServer:
     cursor: pymysql.cursors.Cursor
     active_branch: str
     db_name: str
+    branches: Set[str]
+    sessions: Dict[str, 'DoltSession']
+    sessions_lock: threading.Lock
+    merged_heads: Dict[Tuple[str, str], str]
+    query_stats: QueryStats
+    query_stats_path: Optional[Path]
 
-    def __init__(self, dolt_dir: Path, dolt_db_name: str, db_config: Dict[str, Any], spawn_dolt_server: bool):
+    def __init__(self, dolt_dir: Path, dolt_db_name: str, db_config: Dict[str, Any], spawn_dolt_server: bool, shared_dolt_server: bool = False,
+                 query_stats: Optional[QueryStats] = None, query_stats_path: Optional[Path] = None):
+        db_config = {**db_config, "cursorclass": InstrumentedCursor}
         self.db_config = db_config
+        self.query_stats = query_stats or QueryStats()
+        self.query_stats_path = query_stats_path
         self.db_name = dolt_db_name
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.merged_heads = {}
+        self.dolt_server_process = None
+        self.shared_server = None
 
-        if spawn_dolt_server:
+        if shared_dolt_server:
+            self.shared_server = SharedDoltServer(dolt_dir, db_config)
+            self.db_config = self.shared_server.db_config
+            self.connection = self.shared_server.attach()
+        elif spawn_dolt_server:
             self.dolt_server_process, self.connection = self.spawn_dolt_server(dolt_dir)
         else:
-            self.dolt_server_process = None
             self.connection = pymysql.connect(**db_config)
+        self.query_stats.db_config = self.db_config
+        setattr(self.connection, "query_stats", self.query_stats)
 
         self.cursor = self.connection.cursor()
 
@@ -39,31 +81,47 @@ class DoltSqlServer:
         assert res is not None
         self.active_branch = res[0]
 
+        self.cursor.execute("SELECT name FROM dolt_branches")
+        self.branches = {name for (name,) in self.cursor.fetchall()}
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        with self.sessions_lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+        self.connection.close()
         if self.dolt_server_process:
             self.dolt_server_process.terminate()
+        if self.shared_server:
+            self.shared_server.detach()
+        if self.query_stats.statements:
+            logger.info(f"Dolt statement latencies:\n{self.query_stats.summary()}")
+        if self.query_stats_path:
+            self.query_stats.write_json(self.query_stats_path)
+
+    def session(self, branch: str) -> 'DoltSession':
+        """
+        Return the pooled session pinned to the given branch, opening it if necessary.
+
+        Unlike set_branch, this doesn't change the active branch of the main connection,
+        so sessions for different branches can be used concurrently from different threads.
+        """
+        with self.sessions_lock:
+            session = self.sessions.get(branch)
+            if session is None:
+                session = DoltSession(self, branch)
+                self.sessions[branch] = session
+            return session
 
     def spawn_dolt_server(self, dolt_dir: Path) -> Tuple[Any, pymysql.connections.Connection]:
-        dolt = local.cmd.dolt.with_cwd(dolt_dir)
-        args = []
-        if "port" in self.db_config:
-            args.extend(["-P", str(self.db_config["port"])])
-        if "unix_socket" in self.db_config:
-            args.extend(["--socket", self.db_config["unix_socket"]])
-        dolt_server_process = dolt.popen(["sql-server", *args])
-        while True:
-            try:
-                return dolt_server_process, pymysql.connect(**self.db_config)
-            except Exception as e:
-                logger.info(f"Waiting for SQL server: {str(e)}")
-                time.sleep(1)
+        dolt_server_process = start_dolt_server(dolt_dir, self.db_config)
+        return dolt_server_process, wait_for_dolt_server(self.db_config, lambda: dolt_server_process.poll() is not None)
 
     def executemany(self, sql: str, values):
         self.cursor.executemany(sql, values)
-        self.cursor.execute("COMMIT;")
         self.connection.commit()
     
     def execute(self, sql: str, values):
@@ -72,17 +130,60 @@ class DoltSqlServer:
         self.cursor.execute("COMMIT;")
         self.connection.commit()
     
-    def query(self, sql: str, values = ()):
-        cursor = self.connection.cursor()
-        cursor.execute(sql, values)
-        res = cursor.fetchmany()
-        while res:
-            yield from res
-            res = cursor.fetchmany()
-        cursor.execute("COMMIT;")
+    def query(self, sql: str, values = (), stream: bool = False, database: Optional[str] = None):
+        """
+        Run a query and yield its results.
+
+        By default, pymysql reads the entire result set into memory before the first row is returned.
+        If stream is set, the query runs with an unbuffered cursor on its own connection to database
+        (or the default database), so rows are read from the server as they are consumed, and the main connection
+        stays free for other statements meanwhile. Closing the generator before it's exhausted aborts the query on the server.
+        """
+        if stream:
+            yield from self.stream(sql, values, database)
+            return
+        with self.connection.cursor(InstrumentedCursor) as cursor:
+            cursor.execute(sql, values)
+            res = cursor.fetchmany(QUERY_FETCH_SIZE)
+            while res:
+                yield from res
+                res = cursor.fetchmany(QUERY_FETCH_SIZE)
         self.connection.commit()
 
-    def commit(self, amend: bool = False):
+    def stream(self, sql: str, values = (), database: Optional[str] = None) -> Iterator[Tuple]:
+        """Run a query on a dedicated connection with an unbuffered cursor, yielding rows as they arrive. See query."""
+        connection = pymysql.connect(**{**self.db_config, "database": database or self.db_config.get("database")})
+        setattr(connection, "query_stats", self.query_stats)
+        try:
+            cursor = connection.cursor(InstrumentedSSCursor)
+            exhausted = False
+            try:
+                cursor.execute(sql, values)
+                res = cursor.fetchmany(QUERY_FETCH_SIZE)
+                while res:
+                    yield from res
+                    res = cursor.fetchmany(QUERY_FETCH_SIZE)
+                exhausted = True
+            finally:
+                if not exhausted:
+                    self.abort_query(connection)
+                try:
+                    cursor.close()
+                except pymysql.err.MySQLError as e:
+                    # Closing an aborted stream reads the error the server sent in place of the remaining rows.
+                    logger.debug(f"Closed aborted query: {e}")
+        finally:
+            connection.close()
+
+    def abort_query(self, connection: pymysql.connections.Connection):
+        """Kill the statement that a connection is currently running, using a separate connection."""
+        try:
+            with pymysql.connect(**self.db_config) as killer, killer.cursor() as cursor:
+                cursor.execute("KILL QUERY %s", (connection.thread_id(),))
+        except pymysql.err.MySQLError as e:
+            logger.warning(f"Failed to abort query: {e}")
+
+    def commit(self, amend: bool = False, message: str = "partial import"):
         logger.debug("dolt add")
         self.cursor.execute("call DOLT_ADD('.');")
         logger.debug("dolt commit")
@@ -90,31 +191,46 @@ class DoltSqlServer:
             if amend:
                 self.cursor.execute("call DOLT_COMMIT('--amend');")
             else:
-                self.cursor.execute("call DOLT_COMMIT('-m', 'partial import');")
+                self.cursor.execute("call DOLT_COMMIT('-m', %s);", (message,))
         except pymysql.err.OperationalError as e:
             if "nothing to commit" not in str(e):
                 raise
 
-    def maybe_create_branch(self, branch: str, start_point: str = "HEAD"):
+    def create_branch_if_missing(self, branch: str, start_point: str = "HEAD"):
         """
-        Return the named branch, creating it from start_point if it doesn't exist.
+        Create the named branch from start_point if it doesn't exist.
 
-        The returned branch can be used as a context manager to switch back to the original branch
-        when done. This is useful for creating a branch and then switching to it.
+        Branches that are already known to exist are skipped without contacting the server,
+        and creating a branch doesn't change the active branch.
         """
-        # Kind of a hack, but we may need to pull the start point branch from upstream if it doesn't exist locally.
-        # But the start point may also not be a branch, so...
-        try:
-            with DoltBranch(self, start_point):
-                pass
-        except pymysql.err.OperationalError as e:
-            raise DoltException(f"Failed to find start point {start_point}") from e
-
+        if branch in self.branches:
+            return
         try:
             self.cursor.execute("call DOLT_BRANCH(%s, %s);", (branch, start_point))
         except pymysql.err.OperationalError as e:
             if "already exists" not in str(e):
-                raise DoltException(f"Failed to create branch {branch} from {start_point}") from e
+                # The start point may only exist upstream. Checking it out creates the local branch,
+                # but the start point may also not be a branch, so only do this when branching fails.
+                try:
+                    with DoltBranch(self, start_point):
+                        pass
+                except pymysql.err.OperationalError as e:
+                    raise DoltException(f"Failed to find start point {start_point}") from e
+                try:
+                    self.cursor.execute("call DOLT_BRANCH(%s, %s);", (branch, start_point))
+                except pymysql.err.OperationalError as e:
+                    if "already exists" not in str(e):
+                        raise DoltException(f"Failed to create branch {branch} from {start_point}") from e
+        self.branches.add(branch)
+
+    def maybe_create_branch(self, branch: str, start_point: str = "HEAD"):
+        """
+        Return the named branch, creating it from start_point if it doesn't exist.
+
+        The returned branch can be used as a context manager to switch back to the original branch
+        when done. This is useful for creating a branch and then switching to it.
+        """
+        self.create_branch_if_missing(branch, start_point)
         return DoltBranch(self, branch)
         
     def set_branch(self, branch: str):
@@ -152,10 +268,51 @@ class DoltSqlServer:
         assert res is not None
         return res[0]
 
+    def has_uncommitted_changes(self, branch: str) -> bool:
+        """Check whether the working set of the given branch has changes that haven't been committed."""
+        self.cursor.execute(f"SELECT COUNT(*) FROM `{self.db_name}/{branch}`.dolt_status")
+        res = self.cursor.fetchone()
+        assert res is not None
+        return res[0] > 0
+
+    def commit_working_set(self, branch: str) -> str:
+        """
+        Commit any uncommitted changes on the branch, and return the hash of its head.
+
+        The changes get a new commit instead of being amended into the last one, because the last commit may have been
+        recorded as a sync watermark, which is only usable while it's still an ancestor of the branch.
+        """
+        if self.has_uncommitted_changes(branch):
+            with self.set_branch(branch):
+                self.commit(message=f"Commit working set of {branch}")
+        return self.get_revision(branch)
+
+    def is_ancestor(self, commit: str, ref: str) -> bool:
+        """Check whether the commit with the given hash is reachable from ref."""
+        self.cursor.execute("SELECT DOLT_MERGE_BASE(%s, %s);", (commit, ref))
+        res = self.cursor.fetchone()
+        assert res is not None
+        return res[0] == commit
+
+    def is_merged(self, branch: str, head: str) -> bool:
+        """Check whether the given head of a branch has already been merged into the current branch."""
+        if self.merged_heads.get((self.active_branch, branch)) == head:
+            return True
+        # The head may have been merged by another process, in which case it's an ancestor of the current branch.
+        return self.is_ancestor(head, self.active_branch)
+
     def merge(self, branch: str):
-        """Merge the given branch into the current branch."""
-        with self.set_branch(branch):
-            self.commit(amend=True)
+        """
+        Merge the given branch into the current branch.
+
+        Any uncommitted changes on the branch are committed first.
+        The head of each merged branch is remembered, so that merging a branch whose head hasn't moved is skipped.
+        """
+        head = self.commit_working_set(branch)
+        if self.is_merged(branch, head):
+            logger.debug(f"{branch} is already merged into {self.active_branch} at {head}")
+            self.merged_heads[(self.active_branch, branch)] = head
+            return
         try:
             self.cursor.execute("call DOLT_MERGE(%s);", (branch,))
         except pymysql.err.OperationalError as e:
@@ -167,6 +324,259 @@ class DoltSqlServer:
         if conflicts > 0:
             self.cursor.execute("call DOLT_MERGE('--abort');")
             raise DoltException(f"Failed to merge {branch} into {self.active_branch}: unresolvable conflicts detected")
+        self.merged_heads[(self.active_branch, branch)] = head
+
+def start_dolt_server(dolt_dir: Path, db_config: Dict[str, Any], **popen_args):
+    """Start a dolt sql-server listening on the port and socket in db_config."""
+    dolt = local.cmd.dolt.with_cwd(dolt_dir)
+    args = []
+    if "port" in db_config:
+        args.extend(["-P", str(db_config["port"])])
+    if "unix_socket" in db_config:
+        args.extend(["--socket", db_config["unix_socket"]])
+    return dolt.popen(["sql-server", *args], **popen_args)
+
+def wait_for_dolt_server(db_config: Dict[str, Any], server_exited: Optional[Callable[[], bool]] = None) -> pymysql.connections.Connection:
+    """
+    Connect to a Dolt server that is starting up, returning as soon as it accepts connections.
+
+    server_exited, if provided, is used to stop waiting if the server process dies.
+    """
+    delay = SERVER_POLL_INITIAL_DELAY
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while True:
+        if server_exited is not None and server_exited():
+            raise DoltException("Dolt server exited before accepting connections")
+        # Checking whether the socket accepts is much cheaper than a failed MySQL handshake.
+        if server_socket_accepts(db_config):
+            try:
+                return pymysql.connect(**db_config)
+            except pymysql.err.OperationalError as e:
+                logger.debug(f"Waiting for SQL server: {str(e)}")
+        if time.monotonic() > deadline:
+            raise DoltException(f"Timed out waiting for Dolt server after {SERVER_START_TIMEOUT} seconds")
+        time.sleep(delay)
+        delay = min(delay * 2, SERVER_POLL_MAX_DELAY)
+
+def wait_for_dolt_server_exit(pid: int, db_config: Dict[str, Any]) -> bool:
+    """
+    Wait for a Dolt server that was asked to shut down to exit or stop accepting connections.
+    Returns False if it's still running after SERVER_STOP_TIMEOUT seconds.
+    """
+    delay = SERVER_POLL_INITIAL_DELAY
+    deadline = time.monotonic() + SERVER_STOP_TIMEOUT
+    while server_is_running(pid) and server_socket_accepts(db_config):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, SERVER_POLL_MAX_DELAY)
+    return True
+
+def server_socket_accepts(db_config: Dict[str, Any]) -> bool:
+    """Check whether the server's UNIX socket (or TCP port, if there is no socket) accepts connections."""
+    try:
+        if "unix_socket" in db_config:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(db_config["unix_socket"])
+        else:
+            socket.create_connection((db_config.get("host", "localhost"), db_config.get("port", 3306)), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+# Shared servers started by this process. A server that was shut down by another process
+# remains a zombie until it's reaped, which would otherwise make it look like it was still running.
+spawned_servers: List[Any] = []
+
+def reap_spawned_servers():
+    spawned_servers[:] = [process for process in spawned_servers if process.poll() is None]
+
+def pid_is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def server_is_running(pid: int) -> bool:
+    """
+    Check whether pid is still a running dolt sql-server, rather than an unrelated process that was given the same pid
+    after the server exited. Without /proc, such as on macOS, only whether the pid is running can be checked.
+    A server spawned by this process is checked with poll(), since it remains a zombie after exiting until it's reaped.
+    """
+    for process in spawned_servers:
+        if process.pid == pid:
+            return process.poll() is None
+    if not pid_is_running(pid):
+        return False
+    try:
+        cmdline = Path(f"/proc/{pid}/cmdline").read_bytes()
+        # The state follows the command name, which is in parentheses and may itself contain them.
+        state = Path(f"/proc/{pid}/stat").read_bytes().rpartition(b")")[2].split()[0]
+    except FileNotFoundError:
+        return not Path("/proc/self").exists()
+    except (OSError, IndexError):
+        return True
+    # A zombie, which another process hasn't reaped yet, also has an empty command line.
+    if state == b"Z":
+        return False
+    # A process that is still starting up can briefly have an empty command line.
+    return not cmdline or b"sql-server" in cmdline.split(b"\0")
+
+@dataclass
+class ServerLease:
+    """The contents of a shared server's lease file."""
+    server_pid: Optional[int] = None
+    clients: List[int] = field(default_factory=list)
+
+class SharedDoltServer:
+    """A dolt sql-server that is shared by every dolt-annex process using the same Dolt directory.
+
+    The server listens on a well-known socket next to the Dolt directory. The first process to attach
+    starts the server, and later processes connect to the running server. A lease file next to the socket
+    records the server's pid and the pids of the attached processes, and the last process to detach
+    shuts the server down. Processes that exited without detaching are pruned whenever the lease is updated.
+    The lease file is only modified while holding an exclusive lock on a separate lock file.
+    """
+    dolt_dir: Path
+    db_config: Dict[str, Any]
+    lease_path: Path
+    lock_path: Path
+    log_path: Path
+
+    def __init__(self, dolt_dir: Path, db_config: Dict[str, Any]):
+        if os.name == 'nt':
+            raise DoltException("Shared Dolt servers require UNIX sockets, which are not supported on Windows")
+        self.dolt_dir = dolt_dir
+        self.db_config = {**db_config, "unix_socket": str(shared_server_path(dolt_dir, "sock"))}
+        self.lease_path = shared_server_path(dolt_dir, "lease")
+        self.lock_path = shared_server_path(dolt_dir, "lock")
+        self.log_path = shared_server_path(dolt_dir, "log")
+
+    @contextmanager
+    def locked_lease(self):
+        """Hold the lock on the lease file, yielding the current lease. Changes to the lease are saved on exit."""
+        with open(self.lock_path, "a", encoding="utf-8") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                reap_spawned_servers()
+                lease = ServerLease()
+                if self.lease_path.exists():
+                    lease = ServerLease(**json.loads(self.lease_path.read_text(encoding="utf-8")))
+                lease.clients = [pid for pid in lease.clients if pid_is_running(pid)]
+                yield lease
+                if lease.server_pid is None:
+                    self.lease_path.unlink(missing_ok=True)
+                else:
+                    self.lease_path.write_text(json.dumps(lease.__dict__), encoding="utf-8")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def attach(self) -> pymysql.connections.Connection:
+        """Register this process with the shared server, starting the server if it isn't running, and connect to it."""
+        with self.locked_lease() as lease:
+            if lease.server_pid is None or not server_is_running(lease.server_pid):
+                logger.debug(f"Starting shared Dolt server on {self.db_config['unix_socket']}, logging to {self.log_path}")
+                Path(self.db_config["unix_socket"]).unlink(missing_ok=True)
+                # The server runs in its own session so that it outlives this process if another process is still attached.
+                # Its output goes to a log file, since nothing would read a pipe once this process has exited.
+                with open(self.log_path, "ab") as log_file:
+                    process = start_dolt_server(self.dolt_dir, self.db_config, start_new_session=True,
+                                                stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT)
+                spawned_servers.append(process)
+                lease.server_pid = process.pid
+                lease.clients = []
+            else:
+                logger.debug(f"Attaching to shared Dolt server {lease.server_pid}")
+            lease.clients.append(os.getpid())
+            server_pid = lease.server_pid
+        return wait_for_dolt_server(self.db_config, lambda: not server_is_running(server_pid))
+
+    def detach(self):
+        """Unregister this process from the shared server, shutting the server down if no other process is attached."""
+        with self.locked_lease() as lease:
+            if os.getpid() in lease.clients:
+                lease.clients.remove(os.getpid())
+            if not lease.clients and lease.server_pid is not None:
+                logger.debug(f"Stopping shared Dolt server {lease.server_pid}")
+                # The server may have exited on its own, and its pid been reused by an unrelated process.
+                if server_is_running(lease.server_pid):
+                    os.kill(lease.server_pid, signal.SIGTERM)
+                    # A process that attaches while the server is still shutting down would otherwise connect to it,
+                    # or start a second server on the same Dolt directory.
+                    if not wait_for_dolt_server_exit(lease.server_pid, self.db_config):
+                        logger.warning(f"Shared Dolt server {lease.server_pid} didn't shut down within {SERVER_STOP_TIMEOUT} seconds")
+                        return
+                lease.server_pid = None
+
+def shared_server_path(dolt_dir: Path, extension: str) -> Path:
+    """The well-known path of the shared server's socket, lease, lock, or log file for the given Dolt directory."""
+    dolt_dir = dolt_dir.absolute()
+    return dolt_dir.parent / f".{dolt_dir.name}.sql-server.{extension}"
+
+class DoltSession:
+    """A pooled connection to a Dolt SQL server that is pinned to a single branch.
+
+    The connection uses the branch-qualified database `db/branch` as its default database,
+    so it never needs to call DOLT_CHECKOUT. Access to the connection is serialized with a lock,
+    so a session can be shared between threads.
+    """
+    branch: str
+    connection: pymysql.connections.Connection
+    lock: threading.Lock
+    load_data_supported: bool
+    # A second connection that allows LOAD DATA LOCAL INFILE, opened the first time it's needed.
+    # Allowing it lets the server read any file the client can, so no other statements run on this connection.
+    load_data_connection: Optional[pymysql.connections.Connection]
+    db_config: Dict[str, Any]
+    query_stats: QueryStats
+
+    def __init__(self, dolt: DoltSqlServer, branch: str):
+        self.branch = branch
+        self.lock = threading.Lock()
+        self.load_data_supported = True
+        self.load_data_connection = None
+        self.db_config = {**dolt.db_config, "database": f"{dolt.db_name}/{branch}"}
+        self.query_stats = dolt.query_stats
+        self.connection = pymysql.connect(**self.db_config)
+        setattr(self.connection, "query_stats", dolt.query_stats)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+            if self.load_data_connection is not None:
+                self.load_data_connection.close()
+
+    def executemany(self, sql: str, values):
+        with self.lock, self.connection.cursor() as cursor:
+            cursor.executemany(sql, values)
+            self.connection.commit()
+
+    def execute(self, sql: str, values):
+        with self.lock, self.connection.cursor() as cursor:
+            cursor.execute(sql, values)
+            cursor.fetchall()
+            self.connection.commit()
+
+    def load_data(self, sql: str, path: str):
+        """Run a LOAD DATA LOCAL INFILE statement whose only parameter is the path of the local file to load."""
+        with self.lock:
+            if self.load_data_connection is None:
+                self.load_data_connection = pymysql.connect(**{**self.db_config, "local_infile": True})
+                setattr(self.load_data_connection, "query_stats", self.query_stats)
+            with self.load_data_connection.cursor() as cursor:
+                cursor.execute(sql, (path,))
+            self.load_data_connection.commit()
+
+    def query(self, sql: str, values = ()) -> List[Tuple]:
+        """Run a query and return all of its results. The results are fetched before the session is released."""
+        with self.lock, self.connection.cursor() as cursor:
+            cursor.execute(sql, values)
+            res = list(cursor.fetchall())
+            self.connection.commit()
+            return res
 
 class DoltException(Exception):
     """Exception raised for errors when executing Dolt commands."""
@@ -189,6 +599,8 @@ class DoltBranch:
         self.previous_branches.append(self.dolt.active_branch)
         self.dolt.cursor.execute("call DOLT_CHECKOUT(%s, '--')", self.branch)
         self.dolt.active_branch = self.branch
+        # Checking out a branch that only exists upstream creates it locally.
+        self.dolt.branches.add(self.branch)
         return self.dolt.set_branch(self.branch)
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -8,3 +8,4 @@ But other schemes could be added in the future.
 """
 
 from .common import *
+from .hash_cache import HASH_CACHE_FILE, HashCache
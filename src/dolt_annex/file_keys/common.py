@@ -1,14 +1,94 @@
 import hashlib
+import mmap
+import os
 from pathlib import Path
-from typing_extensions import Optional
+import re
+import threading
+import time
+from typing_extensions import Optional, Tuple
 
 from dolt_annex.datatypes import AnnexKey
+from dolt_annex.logger import logger
+from .hash_cache import HashCache, unchanged
 
-def key_from_file(key_path: Path, extension: Optional[str] = None) -> AnnexKey:
-    """Generate an AnnexKey from the hash of a file."""
+# Files at least this large are hashed through a memory map instead of being read into a buffer.
+MMAP_THRESHOLD = 64 * 1024 * 1024
+# How much of a file is passed to the hasher at once. hashlib releases the GIL while hashing each chunk.
+HASH_CHUNK_SIZE = 1024 * 1024
+# Files modified this recently before they were hashed aren't cached. Filesystems store modification times with limited
+# precision (two seconds on FAT), so a file could be rewritten right after it was hashed without its mtime changing.
+RACY_INTERVAL_NS = 2_000_000_000
+
+# Each thread reuses a single read buffer, so hashing many small files doesn't allocate a buffer per file.
+_buffers = threading.local()
+
+def key_from_file(key_path: Path, extension: Optional[str] = None, cache: Optional[HashCache] = None, verify: bool = False) -> AnnexKey:
+    """
+    Generate an AnnexKey from the hash of a file.
+
+    If a cache is given, files that haven't changed since they were last hashed aren't hashed again.
+    With verify, every file is hashed, and cache entries that don't match are corrected.
+    """
     if extension is None:
         extension = key_path.suffix[1:]  # Get the file extension without the dot
-    with open(key_path, 'rb') as f:
-        data = f.read()
-    data_hash = hashlib.sha256(data).hexdigest()
-    return AnnexKey(f"SHA256E-s{len(data)}--{data_hash}.{extension}")
+    if cache is None:
+        size, data_hash = hash_file(key_path)
+        return AnnexKey(f"SHA256E-s{size}--{data_hash}.{extension}")
+
+    abs_path = Path(os.path.abspath(key_path))
+    started_ns = time.time_ns()
+    before = os.stat(abs_path)
+    cached_hash = cache.get(abs_path, before)
+    if cached_hash is not None and not verify:
+        return AnnexKey(f"SHA256E-s{before.st_size}--{cached_hash}.{extension}")
+    size, data_hash = hash_file(abs_path)
+    if cached_hash is not None and cached_hash != data_hash:
+        logger.warning(f"Cached hash of {abs_path} was wrong, correcting it")
+    # A file that changed while it was being hashed may have been hashed partway through a write, so it isn't cached.
+    # Neither is a file whose mtime is too recent to tell it apart from a later write.
+    if size == before.st_size and unchanged(before, os.stat(abs_path)) and before.st_mtime_ns < started_ns - RACY_INTERVAL_NS:
+        cache.put(abs_path, before, data_hash)
+    return AnnexKey(f"SHA256E-s{size}--{data_hash}.{extension}")
+
+def hash_file(path: Path) -> Tuple[int, str]:
+    """
+    Returns the size and SHA256 hex digest of a file.
+
+    The file is hashed in fixed-size chunks, so memory use doesn't grow with the size of the file.
+    Large files are memory mapped, which hashes them straight from the page cache without copying.
+    Smaller files are read into a reused buffer.
+    """
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(mapped) as view:
+                    for offset in range(0, len(view), HASH_CHUNK_SIZE):
+                        hasher.update(view[offset:offset + HASH_CHUNK_SIZE])
+                size = len(mapped)
+        else:
+            buffer = getattr(_buffers, "buffer", None)
+            if buffer is None:
+                buffer = _buffers.buffer = bytearray(HASH_CHUNK_SIZE)
+            size = 0
+            with memoryview(buffer) as view:
+                while length := f.readinto(buffer):
+                    hasher.update(view[:length])
+                    size += length
+    return size, hasher.hexdigest()
+
+# The keys that key_from_file generates. The extension may not contain path separators.
+KEY_PATTERN = re.compile(r"SHA256E-s(?P<size>[0-9]+)--(?P<hash>[0-9a-f]{64})(?P<extension>\.[^/\\\0]*)?")
+
+def key_size(key: AnnexKey) -> Optional[int]:
+    """Returns the size of the file encoded in a key, or None if the key isn't a SHA256E key."""
+    match = KEY_PATTERN.fullmatch(key)
+    return int(match["size"]) if match else None
+
+def key_matches(key: AnnexKey, size: int, sha256: str) -> bool:
+    """Whether a file with the given size and SHA256 hash matches a key."""
+    match = KEY_PATTERN.fullmatch(key)
+    return match is not None and int(match["size"]) == size and match["hash"] == sha256
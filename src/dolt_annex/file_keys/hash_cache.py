@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+A persistent cache of file hashes, so that rerunning an import doesn't rehash files that haven't changed.
+
+Entries are keyed on a file's absolute path, and are only used if the file's device, inode, size and
+modification time all still match the values recorded when it was hashed. Any change to the file
+(rewriting it, replacing it with another file, or moving another file to its path) changes at least one of them.
+That's only true of writes made long enough after the previous one for the mtime to differ, so key_from_file
+doesn't cache files that were modified shortly before they were hashed.
+"""
+
+import os
+from pathlib import Path
+import sqlite3
+import threading
+
+from typing_extensions import Optional
+
+# The name of the cache file, which is stored next to the repository's uuid file.
+HASH_CACHE_FILE = "hash_cache.sqlite"
+
+# Entries are committed in batches, so that a crash loses at most this many hashes.
+COMMIT_INTERVAL = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+)
+"""
+
+class HashCache:
+    """
+    Maps (path, device, inode, size, mtime_ns) to the SHA256 of a file's contents.
+    Safe to use from several threads at once.
+    """
+    connection: sqlite3.Connection
+    lock: threading.Lock
+    uncommitted: int
+
+    def __init__(self, path: Path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+        self.lock = threading.Lock()
+        self.uncommitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+    def get(self, path: Path, stat: os.stat_result) -> Optional[str]:
+        """Returns the cached hash of a file, or None if it isn't cached or the file has changed since it was hashed."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT sha256 FROM file_hashes WHERE path = ? AND device = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+                (str(path), stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, path: Path, stat: os.stat_result, sha256: str):
+        """Record the hash of a file, given its stat from before it was hashed."""
+        with self.lock:
+            self.connection.execute(
+                "REPLACE INTO file_hashes (path, device, inode, size, mtime_ns, sha256) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(path), stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, sha256),
+            )
+            self.uncommitted += 1
+            if self.uncommitted >= COMMIT_INTERVAL:
+                self.connection.commit()
+                self.uncommitted = 0
+
+def unchanged(before: os.stat_result, after: os.stat_result) -> bool:
+    """Whether a file was left alone between two stat calls."""
+    return (before.st_dev, before.st_ino, before.st_size, before.st_mtime_ns) == (after.st_dev, after.st_ino, after.st_size, after.st_mtime_ns)
@@ -4,6 +4,8 @@
 import hashlib
 from pathlib import Path
 
+from typing_extensions import List
+
 from dolt_annex import config
 from dolt_annex.datatypes import AnnexKey
 
@@ -11,6 +13,11 @@ def get_key_path(key: AnnexKey) -> Path:
     md5 = hashlib.md5(key.encode('utf-8')).hexdigest()
     return Path(f"{md5[:3]}/{md5[3:6]}/{key}")
         
+def get_key_shard(key: AnnexKey, shard_count: int) -> int:
+    """Returns which of shard_count shards a key belongs to, from the first 32 bits of the same md5 as its path."""
+    md5 = hashlib.md5(key.encode('utf-8')).hexdigest()
+    return int(md5[:8], 16) % shard_count
+
 def get_old_relative_annex_key_path(key: AnnexKey) -> Path:
     md5 = hashlib.md5(key.encode('utf-8')).hexdigest()
     return Path(f"{md5[:3]}/{md5[3:6]}/{key}/{key}")
@@ -19,4 +26,22 @@ def get_absolute_file_path(path: Path) -> Path:
     if not path.is_absolute():
         return (Path(config.get_config().files_dir) / path).resolve()
     return path
-    
\ No newline at end of file
+    
+# How keys are arranged in a filestore. Files are always written in the current layout, abc/def/KEY.
+# Older filestores used the legacy layout, abc/def/KEY/KEY, and a mixed filestore may contain either,
+# so both paths have to be tried for every key.
+CURRENT_LAYOUT = "current"
+LEGACY_LAYOUT = "legacy"
+MIXED_LAYOUT = "mixed"
+LAYOUTS = [CURRENT_LAYOUT, LEGACY_LAYOUT, MIXED_LAYOUT]
+
+def key_paths(key: AnnexKey, layout: str) -> List[Path]:
+    """Returns the relative paths where a key may be stored in a filestore with the given layout, in the order they should be tried."""
+    match layout:
+        case "current":
+            return [get_key_path(key)]
+        case "legacy":
+            return [get_old_relative_annex_key_path(key)]
+        case "mixed":
+            return [get_old_relative_annex_key_path(key), get_key_path(key)]
+    raise ValueError(f"Unknown filestore layout: {layout}")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Packs bundle many small keys into a single tar stream, so that transferring them costs
+one round trip instead of one per file.
+
+Each member of a pack is named after its key. The receiver stores each member at its key's path
+and verifies its size and hash against the key, so a corrupted member is never stored.
+Because the size of each file is encoded in its key, packs can be planned without stat calls.
+"""
+
+import hashlib
+import io
+import os
+from pathlib import Path
+import tarfile
+import tempfile
+
+from typing_extensions import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dolt_annex.datatypes import AnnexKey
+from dolt_annex.file_keys import KEY_PATTERN, key_matches, key_size
+from dolt_annex.logger import logger
+from .common import get_key_path
+
+# Keys whose files are at most this many bytes are transferred in packs.
+PACK_THRESHOLD = 64 * 1024
+# The largest number of keys, and the largest total size of the files, in a single pack.
+PACK_MAX_KEYS = 1000
+PACK_MAX_BYTES = 64 * 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+def plan_packs[T](items: Iterable[T], get_key: Callable[[T], AnnexKey]) -> Iterator[List[T]]:
+    """
+    Group items into transfer batches. Items with small keys are grouped into packs, and every other item is a batch of its own.
+    Items are yielded in a deterministic order, but large items may be yielded before small items that preceded them.
+    """
+    pack: List[T] = []
+    pack_bytes = 0
+    for item in items:
+        size = key_size(get_key(item))
+        if size is None or size > PACK_THRESHOLD:
+            yield [item]
+            continue
+        if len(pack) >= PACK_MAX_KEYS or pack_bytes + size > PACK_MAX_BYTES:
+            yield pack
+            pack, pack_bytes = [], 0
+        pack.append(item)
+        pack_bytes += size
+    if pack:
+        yield pack
+
+def is_packable(key: AnnexKey) -> bool:
+    """Whether a key is small enough to be transferred in a pack."""
+    size = key_size(key)
+    return size is not None and size <= PACK_THRESHOLD
+
+def write_pack(sources: Iterable[Tuple[AnnexKey, Path]], fileobj: BinaryIO) -> List[AnnexKey]:
+    """Write each (key, path) to fileobj as a streamed tar. Keys whose files don't exist are skipped. Returns the keys written."""
+    written = []
+    with tarfile.open(fileobj=fileobj, mode="w|") as tar:
+        for key, path in sources:
+            try:
+                f = open(path, "rb")
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            with f:
+                info = tarfile.TarInfo(key)
+                info.size = os.fstat(f.fileno()).st_size
+                tar.addfile(info, f)
+            written.append(key)
+    return written
+
+def write_pack_members(members: List[Tuple[AnnexKey, bytes]], fileobj: BinaryIO) -> List[AnnexKey]:
+    """Write each (key, data) that has already been read into memory to fileobj as a streamed tar. Returns the keys written."""
+    with tarfile.open(fileobj=fileobj, mode="w|") as tar:
+        for key, data in members:
+            info = tarfile.TarInfo(key)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return [key for key, _ in members]
+
+def read_pack(fileobj: BinaryIO, root: Path) -> List[AnnexKey]:
+    """Store each member of a streamed tar at its key's path under root. Returns the keys that are now stored, including keys that already existed."""
+    stored = []
+    with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+        for member in tar:
+            key = AnnexKey(member.name)
+            if not member.isfile() or not KEY_PATTERN.fullmatch(key):
+                logger.warning(f"Ignoring pack member {member.name}, which is not a key")
+                continue
+            data = tar.extractfile(member)
+            assert data is not None
+            if store_key(key, data, root):
+                stored.append(key)
+    return stored
+
+def store_key(key: AnnexKey, data: BinaryIO, root: Path) -> bool:
+    """
+    Store a file at its key's path under root, if its size and hash match the key.
+    The file is written to a temporary name first, so a partial or invalid file is never stored.
+    Returns whether the key is now stored.
+    """
+    path = root / get_key_path(key)
+    if path.exists():
+        # The data still has to be consumed, but it doesn't need to be written.
+        while data.read(CHUNK_SIZE):
+            pass
+        return True
+    path.parent.mkdir(parents=True, exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=".", suffix=".part", delete=False) as f:
+        try:
+            while chunk := data.read(CHUNK_SIZE):
+                hasher.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    if not key_matches(key, size, hasher.hexdigest()):
+        logger.error(f"Received data for {key} doesn't match the key, discarding it")
+        os.unlink(f.name)
+        return False
+    os.replace(f.name, path)
+    return True
+
+def copy_verified(sources: Iterable[Tuple[AnnexKey, Path]], root: Path) -> List[AnnexKey]:
+    """Copy each (key, path) to its key's path under root, verifying it like an unpacked pack member. Returns the keys that are now stored."""
+    stored = []
+    for key, source in sources:
+        try:
+            f = open(source, "rb")
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with f:
+            if store_key(key, f, root):
+                stored.append(key)
+    return stored
+
+def store_members(members: Iterable[Tuple[AnnexKey, bytes]], root: Path) -> List[AnnexKey]:
+    """Store each (key, data) that has already been read into memory under root, verifying it like an unpacked pack member. Returns the keys that are now stored."""
+    return [key for key, data in members if store_key(key, io.BytesIO(data), root)]
+
+def read_members(sources: Iterable[Tuple[AnnexKey, Path]]) -> Dict[AnnexKey, bytes]:
+    """Read each (key, path) into memory. Keys whose files don't exist are skipped."""
+    members = {}
+    for key, path in sources:
+        try:
+            members[key] = path.read_bytes()
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+    return members
+
+def first_existing(paths: Iterable[Path]) -> Optional[Path]:
+    return next((path for path in paths if path.exists()), None)
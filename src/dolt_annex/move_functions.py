@@ -1,15 +1,36 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import errno
 import os
 from pathlib import Path
 import shutil
 
-from typing_extensions import Callable
+from typing_extensions import Callable, Set, Tuple
+
+from dolt_annex.logger import logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # type: ignore
 
 # MoveFunction is an interface for import and sync operations that attempts to move files and reports success or failure.
 MoveFunction = Callable[[Path, Path], bool]
 
+# The ioctl that clones one file's extents into another, from linux/fs.h.
+FICLONE = 0x40049409
+
+# Errors that mean a filesystem, or a pair of filesystems, doesn't support a copy method.
+UNSUPPORTED_ERRNOS = {errno.EOPNOTSUPP, errno.ENOTSUP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.ENOSYS, errno.EBADF}
+
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+# (source device, destination device) pairs that have been found not to support each copy method,
+# so that fast_copy only probes each pair of filesystems once.
+_no_reflink: Set[Tuple[int, int]] = set()
+_no_copy_file_range: Set[Tuple[int, int]] = set()
+
 def copy(src: Path, dst: Path):
     dst.parent.mkdir(parents=True, exist_ok=True)
     try:
@@ -18,10 +39,141 @@ def copy(src: Path, dst: Path):
     except (FileNotFoundError, NotADirectoryError, shutil.Error):
         return False
 
+def fast_copy(src: Path, dst: Path):
+    """
+    Copy a file the fastest way that the filesystems support, without the copy sharing anything mutable with the source.
+    Tries a reflink, which shares blocks copy-on-write, then an in-kernel copy_file_range, then a regular copy.
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        devices = (os.stat(src).st_dev, os.stat(dst.parent).st_dev)
+        if devices not in _no_reflink:
+            try:
+                clone_file(src, dst)
+                return True
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                logger.debug(f"Reflinks aren't supported from {src.parent} to {dst.parent}: {e}")
+                _no_reflink.add(devices)
+        if devices not in _no_copy_file_range:
+            if kernel_copy(src, dst):
+                return True
+            logger.debug(f"copy_file_range isn't supported from {src.parent} to {dst.parent}")
+            _no_copy_file_range.add(devices)
+        shutil.copy(src, dst)
+        return True
+    except (FileNotFoundError, NotADirectoryError, shutil.Error):
+        return False
+
+def reflink(src: Path, dst: Path):
+    """Copy a file by sharing its blocks copy-on-write. Raises OSError if the filesystem doesn't support reflinks, such as anything but btrfs or XFS."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        clone_file(src, dst)
+        return True
+    except (FileNotFoundError, NotADirectoryError, shutil.Error):
+        return False
+
+def hardlink(src: Path, dst: Path):
+    """
+    Link dst to the same file as src, without copying anything. Raises OSError if they're on different filesystems.
+    Both paths refer to a single file afterwards, so this is only safe if the source is never modified in place.
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dst)
+        return True
+    except FileExistsError:
+        # Files in the annex are named after their contents, so an existing file is already a copy.
+        return True
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+
+def check_link_support(move_function: MoveFunction, src: Path, dst_dir: Path):
+    """
+    Check that move_function can move src into dst_dir, if it's reflink or hardlink, by linking src to a temporary name in dst_dir and removing it.
+    Raises OSError if the filesystems don't support it. Every other move function works between any filesystems.
+    """
+    if move_function not in (reflink, hardlink):
+        return
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    probe = dst_dir / f".link-probe-{os.getpid()}"
+    try:
+        if move_function is reflink:
+            clone_file(src, probe)
+        else:
+            os.link(src, probe)
+    finally:
+        probe.unlink(missing_ok=True)
+
+def clone_file(src: Path, dst: Path):
+    """Create dst as a reflink of src, with src's permissions. Raises OSError if the filesystem can't."""
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, "Reflinks are only supported on Linux")
+    check_not_same_file(src, dst)
+    with open(src, "rb") as src_file:
+        try:
+            with open(dst, "wb") as dst_file:
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dst.unlink(missing_ok=True)
+            raise
+    shutil.copymode(src, dst)
+
+def kernel_copy(src: Path, dst: Path) -> bool:
+    """
+    Copy a file with copy_file_range, which copies inside the kernel and lets filesystems that can share blocks
+    or copy server-side do so. Returns False, without creating dst, if copy_file_range isn't supported.
+    Some filesystems, such as procfs and some FUSE filesystems, report that nothing is left to copy before the end of the file;
+    if fewer bytes than the source's size were copied, the copy is redone with shutil.copyfile.
+    """
+    check_not_same_file(src, dst)
+    if not hasattr(os, "copy_file_range"):
+        return False
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        copied = 0
+        try:
+            while chunk := os.copy_file_range(src_file.fileno(), dst_file.fileno(), COPY_CHUNK_SIZE):
+                copied += chunk
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS or copied != 0:
+                raise
+            unsupported = True
+        else:
+            unsupported = False
+        incomplete = copied != os.fstat(src_file.fileno()).st_size
+    if unsupported:
+        dst.unlink()
+        return False
+    if incomplete:
+        shutil.copyfile(src, dst)
+    shutil.copymode(src, dst)
+    return True
+
+def check_not_same_file(src: Path, dst: Path):
+    """
+    Raise shutil.SameFileError, like shutil.copy does, if dst is already src, such as a hardlink to it.
+    Opening dst for writing would otherwise truncate the source before anything was copied.
+    """
+    try:
+        same = os.path.samefile(src, dst)
+    except FileNotFoundError:
+        return
+    if same:
+        raise shutil.SameFileError(f"{src} and {dst} are the same file")
+
+def fast_copy_with_metadata(src: Path, dst: Path):
+    """Like shutil.copy2, but copies the data with fast_copy."""
+    if not fast_copy(Path(src), Path(dst)):
+        raise FileNotFoundError(errno.ENOENT, "No such file", str(src))
+    shutil.copystat(src, dst)
+    return dst
+
 def move_and_symlink(src: Path, dst: Path):
     dst.parent.mkdir(parents=True, exist_ok=True)
     try:
-        shutil.move(src, dst)
+        shutil.move(src, dst, copy_function=fast_copy_with_metadata)
         os.symlink(dst, src)
         return True
     except (FileNotFoundError, NotADirectoryError, shutil.Error):
@@ -30,7 +182,8 @@ def move_and_symlink(src: Path, dst: Path):
 def move(src: Path, dst: Path):
     dst.parent.mkdir(parents=True, exist_ok=True)
     try:
-        shutil.move(src, dst)
+        # Moves within a filesystem are renames. Across filesystems, the file is copied and the source deleted.
+        shutil.move(src, dst, copy_function=fast_copy_with_metadata)
         return True
     except (FileNotFoundError, NotADirectoryError, shutil.Error):
         return False
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+A staged pipeline that overlaps producing work items, processing them and consuming the results.
+
+Push and pull use this to keep the network and the Dolt server busy at the same time:
+one thread pages through the diff, worker threads transfer files, and the caller records the
+transferred rows in Dolt, flushing in batches while transfers continue.
+"""
+
+from dataclasses import dataclass
+import queue
+import threading
+
+from typing_extensions import Any, Callable, Dict, Iterable, Iterator
+
+# How long a blocked stage waits before checking whether the pipeline was stopped.
+POLL_INTERVAL = 0.1
+
+@dataclass
+class Failure:
+    """An exception raised in one stage, passed downstream so it can be re-raised in the consumer."""
+    error: BaseException
+
+class Done:
+    """Marks the end of a stage's output."""
+
+DONE = Done()
+
+def pipelined[T, R](items: Iterable[T], process: Callable[[T], R], queue_size: int, workers: int = 1) -> Iterator[R]:
+    """
+    Process items on background worker threads while they are produced on another, yielding results in input order.
+
+    At most queue_size items are in flight between the producer and the consumer, so a slow consumer applies
+    backpressure to the producer instead of buffering the entire input. A result is only yielded after process
+    has returned for its item, and results are yielded in the order their items were produced regardless of
+    which worker finishes first. If producing or processing an item raises, every result before it is yielded
+    and then the exception is re-raised from this generator. Closing the generator early stops the background threads.
+    """
+    inputs: queue.Queue = queue.Queue()
+    outputs: queue.Queue = queue.Queue()
+    in_flight = threading.Semaphore(max(queue_size, workers))
+    stopped = threading.Event()
+
+    def get(q: queue.Queue) -> Any:
+        while not stopped.is_set():
+            try:
+                return q.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return DONE
+
+    def produce():
+        sequence = 0
+        try:
+            for item in items:
+                while not in_flight.acquire(timeout=POLL_INTERVAL):
+                    if stopped.is_set():
+                        return
+                inputs.put((sequence, item))
+                sequence += 1
+        except BaseException as e: # pylint: disable=broad-exception-caught
+            inputs.put((sequence, Failure(e)))
+        finally:
+            for _ in range(workers):
+                inputs.put(DONE)
+
+    def work():
+        while True:
+            entry = get(inputs)
+            if isinstance(entry, Done):
+                outputs.put(DONE)
+                return
+            sequence, item = entry
+            if isinstance(item, Failure):
+                outputs.put(entry)
+                continue
+            try:
+                outputs.put((sequence, process(item)))
+            except BaseException as e: # pylint: disable=broad-exception-caught
+                outputs.put((sequence, Failure(e)))
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads += [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        # Results that finished ahead of an earlier item, keyed by their position in the input.
+        pending: Dict[int, Any] = {}
+        next_sequence = 0
+        finished_workers = 0
+        while True:
+            while next_sequence in pending:
+                result = pending.pop(next_sequence)
+                next_sequence += 1
+                if isinstance(result, Failure):
+                    raise result.error
+                yield result
+                in_flight.release()
+            if finished_workers == workers:
+                return
+            entry = outputs.get()
+            if isinstance(entry, Done):
+                finished_workers += 1
+                continue
+            sequence, result = entry
+            pending[sequence] = result
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
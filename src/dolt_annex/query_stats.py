@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Instrumentation for statements sent to the Dolt server.
+
+Every statement executed through an instrumented cursor is timed, and latencies are aggregated into
+histograms by statement kind (such as "CALL DOLT_MERGE", "SELECT dolt_commit_diff" or "REPLACE INTO").
+Statements slower than a threshold are written to a slow query log along with their EXPLAIN plan.
+For unbuffered cursors, only the time until the first row arrives is measured.
+"""
+
+from dataclasses import dataclass, field
+import json
+import math
+from pathlib import Path
+import threading
+import time
+
+from typing_extensions import Any, Dict, List, Optional
+
+import pymysql
+
+from dolt_annex.logger import logger
+
+# Upper bounds of the histogram buckets, in seconds.
+HISTOGRAM_BUCKETS = [0.001, 0.01, 0.1, 1.0, 10.0, math.inf]
+
+# Only these kinds of statements can be explained.
+EXPLAINABLE = ("SELECT", "REPLACE", "INSERT", "UPDATE", "DELETE")
+
+def statement_kind(sql: str) -> str:
+    """Classify a statement by its leading keyword, and by procedure name for stored procedure calls."""
+    words = sql.split(None, 2)
+    if not words:
+        return "EMPTY"
+    keyword = words[0].upper()
+    match keyword:
+        case "CALL" if len(words) > 1:
+            return f"CALL {words[1].split('(')[0].upper()}"
+        case "SELECT" if "dolt_commit_diff" in sql:
+            return "SELECT dolt_commit_diff"
+        case "SELECT" if "NOT EXISTS" in sql:
+            return "SELECT anti-join"
+        case "REPLACE" | "INSERT":
+            return f"{keyword} INTO"
+        case "LOAD":
+            return "LOAD DATA"
+    return keyword
+
+@dataclass
+class StatementStats:
+    """Latency statistics for one kind of statement."""
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    histogram: List[int] = field(default_factory=lambda: [0] * len(HISTOGRAM_BUCKETS))
+
+    def record(self, elapsed: float):
+        self.count += 1
+        self.total_seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if elapsed <= bound:
+                self.histogram[i] += 1
+                break
+
+class QueryStats:
+    """Aggregated latencies of the statements sent to a Dolt server, shared by all of its connections."""
+    statements: Dict[str, StatementStats]
+    slow_query_threshold: Optional[float]
+    slow_query_log: Optional[Path]
+    db_config: Dict[str, Any]
+    lock: threading.Lock
+
+    def __init__(self, slow_query_threshold: Optional[float] = None, slow_query_log: Optional[Path] = None):
+        self.statements = {}
+        self.slow_query_threshold = slow_query_threshold
+        self.slow_query_log = slow_query_log
+        self.db_config = {}
+        self.lock = threading.Lock()
+
+    def record(self, sql: str, elapsed: float, database: Optional[str], args: Any = None):
+        kind = statement_kind(sql)
+        with self.lock:
+            if kind not in self.statements:
+                self.statements[kind] = StatementStats()
+            self.statements[kind].record(elapsed)
+        if self.slow_query_threshold is not None and elapsed >= self.slow_query_threshold:
+            self.log_slow_query(kind, sql, elapsed, database, args)
+
+    def explain(self, sql: str, database: Optional[str], args: Any = None) -> str:
+        """
+        Return the query plan for a statement, with the arguments it was executed with.
+        A separate connection is used, so that the original connection's results aren't disturbed.
+        """
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return ""
+        try:
+            db_config = {**self.db_config, "database": database or self.db_config.get("database")}
+            with pymysql.connect(**db_config) as connection, connection.cursor() as cursor:
+                cursor.execute("EXPLAIN " + sql, args)
+                return "\n".join(" ".join(str(col) for col in row) for row in cursor.fetchall())
+        except pymysql.err.MySQLError as e:
+            return f"EXPLAIN failed: {e}"
+
+    def log_slow_query(self, kind: str, sql: str, elapsed: float, database: Optional[str], args: Any = None):
+        entry = f"# {time.strftime('%Y-%m-%d %H:%M:%S')} {kind} took {elapsed:.3f}s on {database}\n{sql.strip()}\n{self.explain(sql, database, args)}\n\n"
+        if self.slow_query_log is None:
+            logger.warning(entry)
+            return
+        with self.lock, open(self.slow_query_log, "a", encoding="utf-8") as f:
+            f.write(entry)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "buckets": [str(bound) for bound in HISTOGRAM_BUCKETS],
+                "statements": {kind: stats.__dict__.copy() for kind, stats in self.statements.items()},
+            }
+
+    def write_json(self, path: Path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, indent=4)
+
+    def summary(self) -> str:
+        """A table of the statement kinds, ordered by the total time spent in them."""
+        bucket_names = [f"<={bound * 1000:g}ms" if bound != math.inf else ">10s" for bound in HISTOGRAM_BUCKETS]
+        lines = [f"{'statement':<28} {'count':>8} {'total s':>9} {'mean ms':>9} {'max ms':>9} " + " ".join(f"{name:>9}" for name in bucket_names)]
+        with self.lock:
+            by_total = sorted(self.statements.items(), key=lambda item: item[1].total_seconds, reverse=True)
+            for kind, stats in by_total:
+                lines.append(f"{kind:<28} {stats.count:>8} {stats.total_seconds:>9.2f} {stats.total_seconds / stats.count * 1000:>9.2f} {stats.max_seconds * 1000:>9.2f} "
+                             + " ".join(f"{n:>9}" for n in stats.histogram))
+        return "\n".join(lines)
+
+class InstrumentedCursorMixin:
+    """Times each statement and records it in the QueryStats attached to the cursor's connection."""
+    _timing = False
+
+    def _timed(self, sql: str, sql_args, func, *args):
+        stats: Optional[QueryStats] = getattr(self.connection, "query_stats", None) # type: ignore
+        # executemany is implemented with execute, so only the outermost call is recorded.
+        if stats is None or self._timing:
+            return func(*args)
+        self._timing = True
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self._timing = False
+            database = self.connection.db # type: ignore
+            stats.record(sql, time.perf_counter() - start, database.decode() if isinstance(database, bytes) else database, sql_args)
+
+    def execute(self, query, args=None):
+        return self._timed(query, args, super().execute, query, args) # type: ignore
+
+    def executemany(self, query, args):
+        # A slow executemany is explained with its first row's arguments.
+        args = list(args) if args is not None else []
+        return self._timed(query, args[0] if args else None, super().executemany, query, args) # type: ignore
+
+class InstrumentedCursor(InstrumentedCursorMixin, pymysql.cursors.Cursor):
+    pass
+
+class InstrumentedSSCursor(InstrumentedCursorMixin, pymysql.cursors.SSCursor):
+    pass
@@ -1,2 +1,3 @@
 from .sftp import AnnexSftpServer
 from .ssh import AnnexSshServer
+from .pack import AnnexPackServer, PACK_SUBSYSTEM
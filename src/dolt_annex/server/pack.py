@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+
+import paramiko
+
+from dolt_annex.datatypes import AnnexKey
+from dolt_annex.file_keys import KEY_PATTERN
+from dolt_annex.filestore import MIXED_LAYOUT, key_paths
+from dolt_annex.filestore.pack import first_existing, read_pack, write_pack
+from dolt_annex.logger import logger
+
+PACK_SUBSYSTEM = "dolt-annex-pack"
+
+# The commands this server understands, reported to clients in response to HELLO.
+PACK_COMMANDS = ("HAS", "PUT", "GET")
+
+class AnnexPackServer(paramiko.SubsystemHandler):
+    """An SSH subsystem for checking and transferring many keys per request, instead of one file per SFTP round trip.
+
+    Each request is a single command line, followed by the command's input:
+    - HELLO: no input. The server replies with the commands it supports on one line, separated by spaces.
+    - HAS: keys, one per line, terminated by an empty line. The server replies with the keys it has, one per line.
+    - PUT: a pack. The server stores and verifies each member, then replies with the stored keys, one per line.
+    - GET: keys, one per line, terminated by an empty line. The server replies with a pack of the keys it has.
+
+    Like AnnexSftpServer, files are stored at their key's path, and existing files are never overwritten.
+    """
+
+    def start_subsystem(self, name, transport, channel):
+        with channel.makefile("rb") as rfile, channel.makefile("wb") as wfile:
+            handle_request(rfile, wfile, Path("."))
+            wfile.flush()
+
+def handle_request(rfile, wfile, root: Path):
+    """Read a single command from rfile and write its response to wfile, for the filestore at root."""
+    command = rfile.readline().strip()
+    match command:
+        case b"HELLO":
+            wfile.write((" ".join(PACK_COMMANDS) + "\n").encode("utf-8"))
+        case b"HAS":
+            keys = read_keys(rfile)
+            write_keys((key for key in keys if find_key(key, root) is not None), wfile)
+        case b"PUT":
+            write_keys(read_pack(rfile, root), wfile)
+        case b"GET":
+            keys = read_keys(rfile)
+            sources = ((key, find_key(key, root)) for key in keys)
+            write_pack(((key, path) for key, path in sources if path is not None), wfile)
+        case _:
+            logger.warning(f"Unknown pack command: {command!r}")
+
+def find_key(key: AnnexKey, root: Path):
+    """Returns the path of a key under root, in either layout, or None if it isn't stored or isn't a valid key."""
+    if not KEY_PATTERN.fullmatch(key):
+        return None
+    return first_existing(root / path for path in key_paths(key, MIXED_LAYOUT))
+
+def read_keys(rfile) -> list[AnnexKey]:
+    """Read keys, one per line, until an empty line. Lines that aren't keys are skipped, so that they can't name paths outside the filestore."""
+    keys = []
+    while line := rfile.readline().strip():
+        key = AnnexKey(line.decode("utf-8", errors="replace"))
+        if not KEY_PATTERN.fullmatch(key):
+            logger.warning(f"Ignoring requested key {key!r}, which is not a key")
+            continue
+        keys.append(key)
+    return keys
+
+def write_keys(keys, wfile):
+    wfile.write("".join(f"{key}\n" for key in keys).encode("utf-8"))
@@ -6,16 +6,20 @@
 from contextlib import contextmanager
 import os
 import random
+import tempfile
 import time
 from uuid import UUID
-from typing_extensions import Callable, Dict, List, Tuple, Iterable
+from typing_extensions import Any, Callable, Dict, List, Optional, Sequence, TextIO, Tuple, Iterable
+
+import pymysql
 
 from dolt_annex.config import Config
 from dolt_annex.datatypes.remote import Repo
 from dolt_annex.datatypes.table import DatasetSchema, DatasetSource
 
-from .dolt import DoltSqlServer
+from .dolt import DoltSqlServer, DoltSession
 from .logger import logger
+from .query_stats import QueryStats
 from .datatypes import AnnexKey, TableRow, FileTableSchema
 
 # We must prevent data loss in the event the process is interrupted:
@@ -31,6 +35,63 @@ from .datatypes import AnnexKey, TableRow, FileTableSchema
 # - After flushing the database cache, compute the new git-annex branch.
 # - Move the annex files in a batch.
 
+# Bulk writes pick a strategy based on the number of rows being written:
+# - "rows": executemany. pymysql batches these into multi-row statements of up to max_stmt_length bytes each.
+# - "load_data": the rows are spooled to a temporary TSV file and sent with a single LOAD DATA LOCAL INFILE.
+#   If the server rejects LOAD DATA, the session falls back to "rows" for the rest of its lifetime.
+WRITE_STRATEGIES = ["rows", "load_data"]
+# Low enough that a flush of the default import batch size uses LOAD DATA. benchmarks/bulk_insert.py compares the strategies.
+LOAD_DATA_THRESHOLD = 5000
+
+def choose_write_strategy(num_rows: int) -> str:
+    """Choose the cheapest strategy for writing the given number of rows."""
+    if num_rows >= LOAD_DATA_THRESHOLD:
+        return "load_data"
+    return "rows"
+
+def write_rows(session: DoltSession, schema: FileTableSchema, database: str, rows: Sequence[Tuple], strategy: Optional[str] = None):
+    """Write rows of (file key, *key columns) into the table in the given database, using the given strategy or the best strategy for the batch size."""
+    if not rows:
+        return
+    if strategy is None:
+        strategy = choose_write_strategy(len(rows))
+    if strategy == "load_data" and session.load_data_supported:
+        try:
+            load_data(session, schema, database, rows)
+            return
+        except pymysql.err.MySQLError as e:
+            logger.warning(f"LOAD DATA LOCAL INFILE failed, falling back to multi-row inserts: {e}")
+            session.load_data_supported = False
+        strategy = "rows"
+    match strategy:
+        case "rows" | "load_data":
+            session.executemany(schema.insert_sql(database), rows)
+        case _:
+            raise ValueError(f"Unknown write strategy: {strategy}")
+
+def load_data(session: DoltSession, schema: FileTableSchema, database: str, rows: Sequence[Tuple]):
+    """Spool the rows to a temporary TSV file and load it with LOAD DATA LOCAL INFILE."""
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="", suffix=".tsv", delete=False) as f:
+        tsv_path = f.name
+        write_tsv(rows, f)
+    try:
+        session.load_data(schema.load_data_sql(database), tsv_path)
+    finally:
+        os.remove(tsv_path)
+
+TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"})
+
+def tsv_field(value: Any) -> str:
+    """Format a value as a LOAD DATA field, using the default escape character."""
+    if value is None:
+        return "\\N"
+    return str(value).translate(TSV_ESCAPES)
+
+def write_tsv(rows: Iterable[Tuple], f: TextIO):
+    for row in rows:
+        f.write("\t".join(tsv_field(value) for value in row))
+        f.write("\n")
+
 class FileTable:
     """A table that exists on mutliple remotes. Allows for batched operations against the Dolt database."""
     urls: Dict[str, List[str]]
@@ -87,10 +148,11 @@ class FileTable:
         # This way, if the import process is interrupted, all incomplete files will still exist in the source directory.
         # Likewise, if a download process is interrupted, the database will still indicate which files have been downloaded.
 
+        # Rows are written directly to the branch-qualified table, so that flushing doesn't need to check out each branch.
         for source, rows in self.added_rows.items():
             branch = f"{source}-{self.dataset_name}"
-            with self.dolt.maybe_create_branch(branch, self.branch_start_point):
-                self.dolt.executemany(self.schema.insert_sql(), [(row[0], *row[1]) for row in rows])
+            self.dolt.create_branch_if_missing(branch, self.branch_start_point)
+            write_rows(self.dolt.session(branch), self.schema, f"{self.dolt.db_name}/{branch}", [(row[0], *row[1]) for row in rows])
 
         for hook in self.flush_hooks:
             hook()
@@ -110,11 +172,10 @@ class FileTable:
         self.flush()
 
     def has_row(self, uuid: UUID, key: TableRow) -> bool:
-        query_sql = f"SELECT 1 FROM `{self.dolt.db_name}/{uuid}-{self.dataset_name}`.{self.schema.name} WHERE " + " AND ".join([f"{col} = %s" for col, _ in zip(self.schema.key_columns, key)]) + " LIMIT 1"
-        results = self.dolt.query(query_sql, tuple(key))
-        for _ in results:
-            return True
-        return False
+        branch = f"{uuid}-{self.dataset_name}"
+        query_sql = f"SELECT 1 FROM `{self.dolt.db_name}/{branch}`.{self.schema.name} WHERE " + " AND ".join([f"{col} = %s" for col, _ in zip(self.schema.key_columns, key)]) + " LIMIT 1"
+        results = self.dolt.session(branch).query(query_sql, tuple(key))
+        return len(results) > 0
     
 class Dataset:
     """A version controlled branch that contains one or more file tables."""
@@ -165,7 +226,8 @@ class Dataset:
         """Context manager for creating a Dataset object by connecting to the Dolt server."""
         # If configuration sets a port, use that.
         # Otherwise, use default port for connecting to an existing server and random port if we're spawning a new server.
-        port = base_config.dolt_port or (random.randint(20000, 30000) if base_config.spawn_dolt_server else 3306)
+        spawns_server = base_config.spawn_dolt_server or base_config.shared_dolt_server
+        port = base_config.dolt_port or (random.randint(20000, 30000) if spawns_server else 3306)
         db_config = {
             "user": "root",
             "database": base_config.dolt_db,
@@ -182,7 +244,8 @@ class Dataset:
             repo=base_config.local_repo(),
         )
         with (
-            DoltSqlServer(base_config.dolt_dir, base_config.dolt_db, db_config, base_config.spawn_dolt_server) as dolt_server,
+            DoltSqlServer(base_config.dolt_dir, base_config.dolt_db, db_config, base_config.spawn_dolt_server, base_config.shared_dolt_server,
+                          QueryStats(base_config.slow_query_threshold, base_config.slow_query_log), base_config.query_stats) as dolt_server,
             Dataset(dolt_server, dataset_source, base_config.auto_push, db_batch_size) as dataset
         ):
             yield dataset
\ No newline at end of file
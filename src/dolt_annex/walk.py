@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Directory traversal built on os.scandir.
+
+On network filesystems, every stat is a round trip. os.scandir returns each entry's type along with its name,
+so files can be told apart from directories and symlinks without stat calls. Directories can also be listed
+by several threads at once, so that a large tree doesn't wait on one directory listing at a time,
+and files are streamed to the caller as soon as their directory has been listed.
+"""
+
+from dataclasses import dataclass
+import os
+from pathlib import Path
+import queue
+import threading
+
+from typing_extensions import Any, Iterator, List, Tuple
+
+from dolt_annex.logger import logger
+from dolt_annex.pipeline import DONE, POLL_INTERVAL, Done, Failure
+
+@dataclass
+class WalkEntry:
+    """A file found by walk_files, with the type information that scandir already provided."""
+    path: Path
+    is_symlink: bool
+
+def walk_files(root: Path, workers: int = 1) -> Iterator[WalkEntry]:
+    """
+    Yield every file under root, including symlinks to files, like the files lists of os.walk.
+
+    Symlinks to directories aren't followed, and directories that can't be listed are skipped with a warning.
+    With one worker, files are yielded in the same order as os.walk. With more, directories are listed
+    concurrently and files are yielded in the order their directories finished listing.
+    """
+    if workers <= 1:
+        directories = [root]
+        while directories:
+            files, subdirectories = scan_directory(directories.pop())
+            yield from files
+            directories.extend(reversed(subdirectories))
+        return
+    yield from walk_files_concurrently(root, workers)
+
+def scan_directory(directory: Path) -> Tuple[List[WalkEntry], List[Path]]:
+    """List a directory, returning its files and its subdirectories."""
+    files = []
+    subdirectories = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(Path(entry.path))
+                elif entry.is_symlink() and entry.is_dir():
+                    # os.walk lists symlinks to directories as directories, and doesn't descend into them.
+                    continue
+                else:
+                    files.append(WalkEntry(Path(entry.path), entry.is_symlink()))
+    except OSError as e:
+        logger.warning(f"Skipping {directory}: {e}")
+    return files, subdirectories
+
+def walk_files_concurrently(root: Path, workers: int) -> Iterator[WalkEntry]:
+    directories: queue.Queue = queue.Queue()
+    # Each directory's files are passed to the consumer together. The queue is bounded so that walking can't run
+    # arbitrarily far ahead of a slow consumer.
+    outputs: queue.Queue = queue.Queue(maxsize=workers * 4)
+    stopped = threading.Event()
+    lock = threading.Lock()
+    # Directories that have been queued but not yet listed. The walk is finished when this reaches zero.
+    unfinished = 1
+    directories.put(root)
+
+    def put_output(entry: Any):
+        while not stopped.is_set():
+            try:
+                outputs.put(entry, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def work():
+        nonlocal unfinished
+        while not stopped.is_set():
+            try:
+                directory = directories.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if isinstance(directory, Done):
+                return
+            try:
+                files, subdirectories = scan_directory(directory)
+                with lock:
+                    unfinished += len(subdirectories)
+                for subdirectory in subdirectories:
+                    directories.put(subdirectory)
+                if files:
+                    put_output(files)
+            except BaseException as e: # pylint: disable=broad-exception-caught
+                put_output(Failure(e))
+            with lock:
+                unfinished -= 1
+                finished = unfinished == 0
+            if finished:
+                for _ in range(workers):
+                    directories.put(DONE)
+                put_output(DONE)
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            entry = outputs.get()
+            if isinstance(entry, Done):
+                return
+            if isinstance(entry, Failure):
+                raise entry.error
+            yield from entry
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Bookkeeping for incremental pushes and pulls.
+
+After a push or pull has transferred every file in a table, the commit of the source branch that was
+diffed is recorded as a watermark. Every row in that commit is known to exist on the destination,
+so the next push or pull only needs to consider rows changed in commits made after the watermark.
+
+Watermarks are local state that refers to commits in the local Dolt repository, so they're stored
+in a SQLite database in the working directory instead of in Dolt itself.
+"""
+
+from contextlib import closing
+from pathlib import Path
+import sqlite3
+from uuid import UUID
+
+from typing_extensions import Optional
+
+WATERMARKS_PATH = Path("sync_watermarks.sqlite3")
+
+class SyncWatermarks:
+    """A persistent map from (source repo, destination repo, dataset, table) to the last fully reconciled source commit."""
+    path: Path
+
+    def __init__(self, path: Path = WATERMARKS_PATH):
+        self.path = path
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    source_uuid TEXT,
+                    destination_uuid TEXT,
+                    dataset TEXT,
+                    table_name TEXT,
+                    source_commit TEXT,
+                    PRIMARY KEY (source_uuid, destination_uuid, dataset, table_name)
+                )""")
+
+    def get(self, source_uuid: UUID | str, destination_uuid: UUID | str, dataset: str, table_name: str) -> Optional[str]:
+        """Returns the last source commit whose rows were all transferred to the destination, if any."""
+        with closing(sqlite3.connect(self.path)) as connection:
+            row = connection.execute(
+                "SELECT source_commit FROM watermarks WHERE source_uuid = ? AND destination_uuid = ? AND dataset = ? AND table_name = ?",
+                (str(source_uuid), str(destination_uuid), dataset, table_name)).fetchone()
+        return row[0] if row else None
+
+    def set(self, source_uuid: UUID | str, destination_uuid: UUID | str, dataset: str, table_name: str, source_commit: str):
+        """Record that every row in the source commit has been transferred to the destination."""
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            connection.execute(
+                "REPLACE INTO watermarks (source_uuid, destination_uuid, dataset, table_name, source_commit) VALUES (?, ?, ?, ?, ?)",
+                (str(source_uuid), str(destination_uuid), dataset, table_name, source_commit))
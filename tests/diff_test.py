@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from dolt_annex.datatypes import AnnexKey, FileTableSchema, TableRow
+from dolt_annex.diff import DiffCursor
+
+schema = FileTableSchema(name="submissions", file_column="annex_key", key_columns=["source", "id"])
+
+class RecordingDolt:
+    """Stands in for a DoltSqlServer, recording the queries that are run and returning fixed rows."""
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query(self, sql, values = (), stream = False, database = None):
+        self.queries.append((sql, values, stream, database))
+        yield from self.rows
+
+def test_diff_cursor_streams_one_query():
+    dolt = RecordingDolt([("key-a", "site", 1), ("key-b", "site", 2)])
+    diff = DiffCursor(dolt, "db/union", schema, "from", "to", [], limit=None) # type: ignore
+    assert list(diff) == [(AnnexKey("key-a"), TableRow(["site", 1])), (AnnexKey("key-b"), TableRow(["site", 2]))]
+    [(sql, values, stream, database)] = dolt.queries
+    assert stream and database == "db/union"
+    assert values == ("from", "to")
+    assert "LIMIT" not in sql
+
+    dolt = RecordingDolt([])
+    list(DiffCursor(dolt, "db/union", schema, "from", "to", [], limit=10)) # type: ignore
+    [(sql, values, _, _)] = dolt.queries
+    assert "LIMIT %s" in sql and values == ("from", "to", 10)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+
+from dolt_annex import move_functions
+from dolt_annex.commands import push
+from dolt_annex.commands.push import fan_out_keys, merge_diffs
+from dolt_annex.commands.sync import FileMover
+from dolt_annex.datatypes import AnnexKey, TableRow
+from dolt_annex.filestore import CURRENT_LAYOUT, get_key_path
+from dolt_annex.filestore.pack import copy_verified, read_members, store_members
+
+def make_key(data: bytes) -> AnnexKey:
+    return AnnexKey(f"SHA256E-s{len(data)}--{hashlib.sha256(data).hexdigest()}.txt")
+
+def test_merge_diffs():
+    a, b, c = (make_key(data) for data in (b"a", b"b", b"c"))
+    first = [(a, TableRow((1,))), (c, TableRow((3,)))]
+    second = [(b, TableRow((2,))), (c, TableRow((3,)))]
+    assert list(merge_diffs([first, second])) == [
+        (a, TableRow((1,)), [0]),
+        (b, TableRow((2,)), [1]),
+        (c, TableRow((3,)), [0, 1]),
+    ]
+
+def test_fan_out_keys(tmp_path):
+    local = tmp_path / "local"
+    keys = []
+    for i in range(5):
+        data = f"file {i}".encode()
+        key = make_key(data)
+        (local / get_key_path(key)).parent.mkdir(parents=True, exist_ok=True)
+        (local / get_key_path(key)).write_bytes(data)
+        keys.append(key)
+    missing = make_key(b"missing")
+    movers = [FileMover(move_functions.copy, move_functions.copy, str(tmp_path / name), local, 2, CURRENT_LAYOUT, CURRENT_LAYOUT)
+              for name in ("first", "second")]
+
+    items = [(key, i, [0, 1] if i % 2 else [1]) for i, key in enumerate(keys)] + [(missing, 5, [0, 1])]
+    failed = []
+    results = list(fan_out_keys(items, movers, 10, failed))
+
+    assert results == items[:5]
+    assert failed == [(missing, 0), (missing, 1)]
+    for key, _, remotes in results:
+        for remote, name in enumerate(("first", "second")):
+            assert (tmp_path / name / get_key_path(key)).exists() == (remote in remotes)
+
+def test_fan_out_reads_packed_files_once(tmp_path, monkeypatch):
+    local = tmp_path / "local"
+    keys = []
+    for i in range(5):
+        data = f"file {i}".encode()
+        key = make_key(data)
+        (local / get_key_path(key)).parent.mkdir(parents=True, exist_ok=True)
+        (local / get_key_path(key)).write_bytes(data)
+        keys.append(key)
+
+    def unused(*args):
+        raise AssertionError("packed keys should be sent from memory")
+    movers = []
+    for name in ("first", "second"):
+        mover = FileMover(unused, unused, str(tmp_path / name), local, 2, CURRENT_LAYOUT, CURRENT_LAYOUT)
+        mover.put_pack_function = unused
+        mover.get_pack_function = lambda keys: []
+        mover.put_members_function = lambda members, root=tmp_path / name: store_members(members, root)
+        mover.has_keys_function = lambda keys, root=tmp_path / name: [key for key in keys if (root / get_key_path(key)).exists()]
+        movers.append(mover)
+    # The second remote already has the first key, so only the first remote is sent it.
+    copy_verified([(keys[0], local / get_key_path(keys[0]))], tmp_path / "second")
+
+    reads = []
+    def counting_read_members(sources):
+        members = read_members(sources)
+        reads.extend(members)
+        return members
+    monkeypatch.setattr(push, "read_members", counting_read_members)
+
+    items = [(key, i, [0, 1]) for i, key in enumerate(keys)]
+    assert list(fan_out_keys(items, movers, 10)) == items
+    assert sorted(reads) == sorted(keys)
+    for key in keys:
+        for name in ("first", "second"):
+            assert (tmp_path / name / get_key_path(key)).exists()
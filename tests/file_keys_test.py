@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+
+import pytest
+
+from dolt_annex.file_keys import common, key_from_file
+
+@pytest.mark.parametrize("size", [0, 1, common.HASH_CHUNK_SIZE, 3 * common.HASH_CHUNK_SIZE + 17])
+@pytest.mark.parametrize("mmap_threshold", [1, common.MMAP_THRESHOLD])
+def test_key_from_file(tmp_path, monkeypatch, size, mmap_threshold):
+    monkeypatch.setattr(common, "MMAP_THRESHOLD", mmap_threshold)
+    data = os.urandom(size)
+    path = tmp_path / "file.png"
+    path.write_bytes(data)
+    assert key_from_file(path) == f"SHA256E-s{size}--{hashlib.sha256(data).hexdigest()}.png"
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import time
+
+from dolt_annex.file_keys import HashCache, common, key_from_file
+
+def expected_key(data: bytes) -> str:
+    return f"SHA256E-s{len(data)}--{hashlib.sha256(data).hexdigest()}.txt"
+
+def write_file(path, data: bytes, mtime_ns: int):
+    path.write_bytes(data)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_hash_cache(tmp_path, monkeypatch):
+    hashed = []
+    hash_file = common.hash_file
+    def counting_hash_file(path):
+        hashed.append(path)
+        return hash_file(path)
+    monkeypatch.setattr(common, "hash_file", counting_hash_file)
+
+    path = tmp_path / "file.txt"
+    # Files written just now aren't cached, because a second write might not change their mtime.
+    path.write_bytes(b"new")
+    with HashCache(tmp_path / "cache.sqlite") as cache:
+        assert key_from_file(path, cache=cache) == expected_key(b"new")
+        assert key_from_file(path, cache=cache) == expected_key(b"new")
+        assert len(hashed) == 2
+    hashed.clear()
+
+    mtime_ns = time.time_ns() - 60 * 1_000_000_000
+    write_file(path, b"first", mtime_ns)
+    with HashCache(tmp_path / "cache.sqlite") as cache:
+        assert key_from_file(path, cache=cache) == expected_key(b"first")
+        assert key_from_file(path, cache=cache) == expected_key(b"first")
+        assert len(hashed) == 1
+
+        # Changing the contents invalidates the entry, even if the size stays the same.
+        write_file(path, b"other", mtime_ns + 1_000_000_000)
+        assert key_from_file(path, cache=cache) == expected_key(b"other")
+        assert len(hashed) == 2
+
+        # So does touching the file.
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        key_from_file(path, cache=cache)
+        assert len(hashed) == 3
+
+    # Entries persist, and verify rehashes and corrects them.
+    with HashCache(tmp_path / "cache.sqlite") as cache:
+        cache.put(path.absolute(), path.stat(), "0" * 64)
+        assert key_from_file(path, cache=cache) == f"SHA256E-s5--{'0' * 64}.txt"
+        assert key_from_file(path, cache=cache, verify=True) == expected_key(b"other")
+        assert key_from_file(path, cache=cache) == expected_key(b"other")
+        assert len(hashed) == 4
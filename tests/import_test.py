@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from dataclasses import replace
 import os
 from pathlib import Path
 import random
@@ -52,7 +53,18 @@ def test_import_e621(tmp_path):
         return importers.MD5Importer("urls")
     do_test_import(tmp_path, "urls", importer_factory, expected_rows)
 
-def do_test_import(tmp_path_: str, table_name: str, importer_factory, expected_rows: Dict[str, TableRow]):
+def test_import_parallel(tmp_path):
+    """Test hashing files on several threads"""
+    expected_rows = {
+        "591785b794601e212b260e25925636fd.e621.txt": "591785b794601e212b260e25925636fd",
+        "b1946ac92492d2347c6235b4d2611184.e621.txt": "b1946ac92492d2347c6235b4d2611184",
+        "d8e8fca2dc0f896fd7cb4cb0031ba249.e621.txt": "d8e8fca2dc0f896fd7cb4cb0031ba249",
+    }
+    def importer_factory() -> importers.ImporterBase:
+        return importers.MD5Importer("urls")
+    do_test_import(tmp_path, "urls", importer_factory, expected_rows, replace(import_config, jobs=4))
+
+def do_test_import(tmp_path_: str, table_name: str, importer_factory, expected_rows: Dict[str, TableRow], config: ImportConfig = import_config):
     """Run and validate the importer"""
     tmp_path = Path(tmp_path_)
     print(f"Using temporary path {tmp_path}")
@@ -79,10 +91,10 @@ def do_test_import(tmp_path_: str, table_name: str, importer_factory, expected_r
     with (
         DoltSqlServer(base_config.dolt_dir, base_config.dolt_db, db_config, base_config.spawn_dolt_server) as dolt_server,
     ):
-        with Dataset(dolt_server, table_settings, base_config.auto_push, import_config.batch_size) as dataset:
+        with Dataset(dolt_server, table_settings, base_config.auto_push, config.batch_size) as dataset:
             table = dataset.get_table(table_name)
             importer = importer_factory()
-            do_import(local_remote, import_config, dataset, importer, ["import_data"])
+            do_import(local_remote, config, dataset, importer, ["import_data"])
         validate_import(table, table_settings, expected_rows)
 
 def validate_import(downloader: FileTable, table_settings: DatasetSource, expected_rows: Dict[str, TableRow]):
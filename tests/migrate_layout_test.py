@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+
+from dolt_annex.commands.migrate_layout import MIGRATING_SUFFIX, LocalFilestore, migrate_filestore
+from dolt_annex.datatypes import AnnexKey
+from dolt_annex.filestore import get_key_path, get_old_relative_annex_key_path
+
+keys = [AnnexKey(f"SHA256E-s{i}--{i:064x}.txt") for i in range(20)]
+
+def write(path: Path, contents: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(contents, encoding="utf-8")
+
+def test_migrate_layout(tmp_path):
+    for key in keys[:10]:
+        write(tmp_path / get_old_relative_annex_key_path(key), key)
+    for key in keys[10:]:
+        write(tmp_path / get_key_path(key), key)
+
+    results = migrate_filestore(LocalFilestore(tmp_path), 4, dry_run=True)
+    assert (results.legacy, results.skipped) == (10, 0)
+    assert (tmp_path / get_old_relative_annex_key_path(keys[0])).exists()
+
+    results = migrate_filestore(LocalFilestore(tmp_path), 4, dry_run=False)
+    assert (results.legacy, results.skipped) == (10, 0)
+    for key in keys:
+        assert (tmp_path / get_key_path(key)).read_text(encoding="utf-8") == key
+
+    results = migrate_filestore(LocalFilestore(tmp_path), 4, dry_run=True)
+    assert (results.legacy, results.skipped) == (0, 0)
+
+def test_migrate_layout_resumes_interrupted_keys(tmp_path):
+    key = keys[0]
+    key_path = tmp_path / get_key_path(key)
+    write(key_path.with_name(key + MIGRATING_SUFFIX), key)
+    key_path.mkdir()
+
+    results = migrate_filestore(LocalFilestore(tmp_path), 1, dry_run=False)
+    assert results.legacy == 1
+    assert key_path.read_text(encoding="utf-8") == key
+
+def test_migrate_layout_skips_unexpected_directories(tmp_path):
+    key = keys[0]
+    write(tmp_path / get_old_relative_annex_key_path(key), key)
+    write(tmp_path / get_key_path(key) / "other", "other")
+
+    results = migrate_filestore(LocalFilestore(tmp_path), 1, dry_run=False)
+    assert (results.legacy, results.skipped) == (0, 1)
+    assert (tmp_path / get_old_relative_annex_key_path(key)).exists()
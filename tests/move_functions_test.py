@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+
+import pytest
+
+from dolt_annex import move_functions
+
+@pytest.mark.parametrize("copy_function", [move_functions.fast_copy, move_functions.copy])
+def test_copies_are_independent(tmp_path, copy_function):
+    src = tmp_path / "src"
+    src.write_bytes(os.urandom(100_000))
+    dst = tmp_path / "a" / "b" / "dst"
+    assert copy_function(src, dst)
+    assert dst.read_bytes() == src.read_bytes()
+    assert not os.path.samefile(src, dst)
+
+    original = dst.read_bytes()
+    src.write_bytes(b"changed")
+    assert dst.read_bytes() == original
+
+    assert not copy_function(tmp_path / "missing", tmp_path / "other")
+
+def test_kernel_copy(tmp_path):
+    src = tmp_path / "src"
+    src.write_bytes(os.urandom(100_000))
+    if move_functions.kernel_copy(src, tmp_path / "dst"):
+        assert (tmp_path / "dst").read_bytes() == src.read_bytes()
+    else:
+        assert not (tmp_path / "dst").exists()
+
+def test_kernel_copy_short_copy(tmp_path, monkeypatch):
+    # Some filesystems report that nothing is left to copy before the end of the file.
+    monkeypatch.setattr(os, "copy_file_range", lambda *args: 0, raising=False)
+    src = tmp_path / "src"
+    src.write_bytes(os.urandom(100_000))
+    assert move_functions.kernel_copy(src, tmp_path / "dst")
+    assert (tmp_path / "dst").read_bytes() == src.read_bytes()
+
+def test_reflink(tmp_path):
+    src = tmp_path / "src"
+    src.write_bytes(os.urandom(100_000))
+    try:
+        assert move_functions.reflink(src, tmp_path / "dst")
+    except OSError as e:
+        # Most filesystems don't support reflinks, and no partial copy should be left behind.
+        assert e.errno in move_functions.UNSUPPORTED_ERRNOS
+        assert not (tmp_path / "dst").exists()
+    else:
+        assert (tmp_path / "dst").read_bytes() == src.read_bytes()
+
+def test_hardlink(tmp_path):
+    src = tmp_path / "src"
+    src.write_bytes(b"data")
+    assert move_functions.hardlink(src, tmp_path / "dst")
+    assert os.path.samefile(src, tmp_path / "dst")
+    assert move_functions.hardlink(src, tmp_path / "dst")
+    assert not move_functions.hardlink(tmp_path / "missing", tmp_path / "other")
+
+def test_check_link_support(tmp_path):
+    src = tmp_path / "src"
+    src.write_bytes(b"data")
+    move_functions.check_link_support(move_functions.hardlink, src, tmp_path / "files")
+    try:
+        move_functions.check_link_support(move_functions.reflink, src, tmp_path / "files")
+    except OSError as e:
+        assert e.errno in move_functions.UNSUPPORTED_ERRNOS
+    # The probe doesn't leave anything behind.
+    assert list((tmp_path / "files").iterdir()) == []
+
+@pytest.mark.parametrize("copy_function", [move_functions.fast_copy, move_functions.copy, move_functions.reflink])
+def test_copy_onto_itself(tmp_path, copy_function):
+    # A file imported with --hardlink is the same file as its source, and copying over it mustn't truncate both.
+    src = tmp_path / "src"
+    data = os.urandom(100_000)
+    src.write_bytes(data)
+    dst = tmp_path / "dst"
+    os.link(src, dst)
+    assert not copy_function(src, dst)
+    assert src.read_bytes() == data
+    with pytest.raises(shutil.SameFileError):
+        move_functions.kernel_copy(src, dst)
+    assert dst.read_bytes() == data
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+
+from dolt_annex import move_functions
+from dolt_annex.commands.pull import SourceBalancer, fetch_from_sources
+from dolt_annex.commands.sync import FileMover
+from dolt_annex.datatypes import AnnexKey
+from dolt_annex.filestore import CURRENT_LAYOUT, get_key_path
+
+def make_key(data: bytes) -> AnnexKey:
+    return AnnexKey(f"SHA256E-s{len(data)}--{hashlib.sha256(data).hexdigest()}.txt")
+
+def test_fetch_fails_over_to_other_holders(tmp_path):
+    keys = []
+    for i in range(6):
+        data = f"file {i}".encode()
+        key = make_key(data)
+        # Every key is recorded on both remotes, but the second remote is missing the even keys.
+        for name in ("first", "second") if i % 2 else ("first",):
+            (tmp_path / name / get_key_path(key)).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / name / get_key_path(key)).write_bytes(data)
+        keys.append(key)
+    lost = make_key(b"lost")
+    movers = [FileMover(move_functions.copy, move_functions.copy, str(tmp_path / name), tmp_path / "local", 2, CURRENT_LAYOUT, CURRENT_LAYOUT)
+              for name in ("first", "second")]
+
+    items = [(key, i, [0, 1]) for i, key in enumerate(keys)] + [(lost, 6, [0, 1])]
+    missing = []
+    results = list(fetch_from_sources(items, movers, 10, missing))
+
+    assert results == [(key, i) for i, key in enumerate(keys)]
+    assert missing == [lost]
+    for key in keys:
+        assert (tmp_path / "local" / get_key_path(key)).exists()
+
+def test_balancer_prefers_faster_remote():
+    balancer = SourceBalancer(2)
+    # Unmeasured remotes share the work.
+    assert {balancer.assign([0, 1], 100), balancer.assign([0, 1], 100)} == {0, 1}
+    balancer.finish(0, 100, 100, 1.0)
+    balancer.finish(1, 100, 100, 10.0)
+    assert [balancer.assign([0, 1], 100) for _ in range(5)] == [0] * 5
+    # A remote that failed is measured as slow.
+    balancer = SourceBalancer(2)
+    assert balancer.assign([0], 100) == 0
+    assert balancer.assign([1], 100) == 1
+    balancer.finish(0, 100, 0, 0.1)
+    balancer.finish(1, 100, 100, 1.0)
+    assert balancer.assign([0, 1], 100) == 1
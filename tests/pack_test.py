@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+
+from dolt_annex.datatypes import AnnexKey
+from dolt_annex.filestore import get_key_path
+from dolt_annex.filestore.pack import PACK_THRESHOLD, plan_packs, read_pack, write_pack, write_pack_members
+from dolt_annex.server.pack import find_key, handle_request
+
+def make_key(data: bytes) -> AnnexKey:
+    return AnnexKey(f"SHA256E-s{len(data)}--{hashlib.sha256(data).hexdigest()}.json")
+
+def test_pack_round_trip(tmp_path):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    sources = []
+    for i in range(10):
+        data = f'{{"id": {i}}}'.encode()
+        key = make_key(data)
+        (source_dir / key).write_bytes(data)
+        sources.append((key, source_dir / key))
+    missing = make_key(b"missing")
+    sources.append((missing, source_dir / missing))
+
+    pack = io.BytesIO()
+    written = write_pack(sources, pack)
+    assert written == [key for key, _ in sources[:10]]
+
+    pack.seek(0)
+    stored = read_pack(pack, tmp_path / "dest")
+    assert stored == written
+    for key, path in sources[:10]:
+        assert (tmp_path / "dest" / get_key_path(key)).read_bytes() == path.read_bytes()
+
+def test_pack_members_round_trip(tmp_path):
+    members = [(make_key(data), data) for data in (f'{{"id": {i}}}'.encode() for i in range(3))]
+    pack = io.BytesIO()
+    assert write_pack_members(members, pack) == [key for key, _ in members]
+
+    pack.seek(0)
+    assert read_pack(pack, tmp_path) == [key for key, _ in members]
+    for key, data in members:
+        assert (tmp_path / get_key_path(key)).read_bytes() == data
+
+def test_pack_rejects_mismatched_keys(tmp_path):
+    data = b'{"id": 1}'
+    wrong_key = make_key(b'{"id": 2}')
+    (tmp_path / "source").write_bytes(data)
+
+    pack = io.BytesIO()
+    write_pack([(wrong_key, tmp_path / "source")], pack)
+    pack.seek(0)
+    assert read_pack(pack, tmp_path / "dest") == []
+    assert not (tmp_path / "dest" / get_key_path(wrong_key)).exists()
+
+def test_plan_packs():
+    small = [AnnexKey(f"SHA256E-s100--{i:064x}.json") for i in range(3)]
+    large = AnnexKey(f"SHA256E-s{PACK_THRESHOLD + 1}--{0:064x}.png")
+    batches = list(plan_packs([small[0], large, small[1], small[2]], lambda key: key))
+    assert batches == [[large], small]
+
+def test_server_requests(tmp_path):
+    stored = make_key(b'{"id": 1}')
+    missing = make_key(b'{"id": 2}')
+    (tmp_path / get_key_path(stored)).parent.mkdir(parents=True)
+    (tmp_path / get_key_path(stored)).write_bytes(b'{"id": 1}')
+
+    def request(data: bytes) -> bytes:
+        wfile = io.BytesIO()
+        handle_request(io.BytesIO(data), wfile, tmp_path)
+        return wfile.getvalue()
+
+    assert set(request(b"HELLO\n").decode().split()) == {"HAS", "PUT", "GET"}
+    assert request(f"HAS\n{stored}\n{missing}\n\n".encode()) == f"{stored}\n".encode()
+
+    pack = io.BytesIO(request(f"GET\n{stored}\n{missing}\n\n".encode()))
+    assert read_pack(pack, tmp_path / "dest") == [stored]
+
+def test_server_rejects_paths_that_are_not_keys(tmp_path):
+    root = tmp_path / "filestore"
+    (tmp_path / "secret").write_bytes(b"secret")
+    # Create the bucket directories the path would be resolved through, so that it would reach the secret if it were used.
+    traversal = AnnexKey("../../../secret")
+    bucket, sub_bucket, *_ = get_key_path(traversal).parts
+    (root / bucket / sub_bucket).mkdir(parents=True)
+    assert (root / get_key_path(traversal)).read_bytes() == b"secret"
+    wfile = io.BytesIO()
+    handle_request(io.BytesIO(f"GET\n{traversal}\n\n".encode()), wfile, root)
+    assert read_pack(io.BytesIO(wfile.getvalue()), tmp_path / "dest") == []
+    assert b"secret" not in wfile.getvalue()
+
+    # HAS can't be used to probe for paths outside the filestore either.
+    wfile = io.BytesIO()
+    handle_request(io.BytesIO(f"HAS\n{traversal}\n\n".encode()), wfile, root)
+    assert wfile.getvalue() == b""
+    assert find_key(traversal, root) is None
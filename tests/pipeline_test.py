@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+import time
+
+import pytest
+
+from dolt_annex.pipeline import pipelined
+
+def test_pipelined_preserves_order():
+    assert list(pipelined(range(100), lambda x: x * 2, 4)) == [x * 2 for x in range(100)]
+
+def test_pipelined_raises_from_worker():
+    def process(x):
+        if x == 5:
+            raise ValueError("transfer failed")
+        return x
+    results = []
+    with pytest.raises(ValueError):
+        for result in pipelined(range(10), process, 2):
+            results.append(result)
+    assert results == [0, 1, 2, 3, 4]
+
+def test_pipelined_raises_from_producer():
+    def produce():
+        yield 1
+        raise RuntimeError("diff failed")
+    with pytest.raises(RuntimeError):
+        list(pipelined(produce(), lambda x: x, 2))
+
+def test_pipelined_stops_when_closed():
+    processed = []
+    results = pipelined(range(1000), processed.append, 2)
+    next(results)
+    results.close()
+    assert len(processed) < 1000
+
+def test_pipelined_workers_preserve_order():
+    def process(x):
+        time.sleep(random.random() / 1000)
+        return x
+    assert list(pipelined(range(200), process, 8, workers=4)) == list(range(200))
+
+def test_pipelined_workers_yield_results_before_failure():
+    def process(x):
+        if x == 50:
+            raise ValueError("transfer failed")
+        time.sleep(random.random() / 1000)
+        return x
+    results = []
+    with pytest.raises(ValueError):
+        for result in pipelined(range(100), process, 8, workers=4):
+            results.append(result)
+    assert results == list(range(50))
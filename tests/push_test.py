@@ -14,12 +14,14 @@ from dolt_annex import importers, move_functions, context
 from dolt_annex.datatypes.table import DatasetSchema, DatasetSource
 from dolt_annex.table import Dataset
 from dolt_annex.commands.import_command import ImportConfig, do_import
-from dolt_annex.commands.push import push_dataset
+from dolt_annex.commands.push import diff_keys, push_dataset
 from dolt_annex.commands.server_command import server_context
 from dolt_annex.dolt import DoltSqlServer
 from dolt_annex.filestore import get_key_path
 from dolt_annex.datatypes import Repo, TableRow
 from dolt_annex.commands.sync import SshSettings
+from dolt_annex.diff import DiffCursor
+from dolt_annex.watermarks import SyncWatermarks
 
 from tests.setup import setup, setup_file_remote, setup_ssh_remote, base_config, init
 
@@ -109,6 +111,80 @@ def do_test_push(tmp_path, dataset_name: str, remote: Repo):
             assert files_pushed == 1
 
 
+def test_push_incrementally(tmp_path):
+    """After a push has recorded a watermark, pushing rows added since then diffs from the watermark instead of all rows."""
+    remote = setup_file_remote(tmp_path)
+    dataset_name = "submissions"
+    importer = TestImporter()
+    shutil.copy(config_directory / "submissions.dataset", tmp_path / "submissions.dataset")
+    dataset_schema = DatasetSchema.must_load(dataset_name)
+    shutil.copytree(import_directory, os.path.join(tmp_path, "import_data"))
+    db_config = {
+        "unix_socket": base_config.dolt_server_socket,
+        "user": "root",
+        "database": base_config.dolt_db,
+        "autocommit": True,
+        "port": random.randint(20000, 21000),
+    }
+    dataset_source = DatasetSource(dataset_schema, repo=base_config.local_repo())
+    with DoltSqlServer(base_config.dolt_dir, base_config.dolt_db, db_config, base_config.spawn_dolt_server) as dolt_server:
+        with Dataset(dolt_server, dataset_source, base_config.auto_push, import_config.batch_size) as downloader:
+            ssh_settings = SshSettings(Path(__file__).parent / "config/ssh_config", None)
+            local_uuid = str(context.local_uuid.get())
+            table = next(iter(downloader.tables.values()))
+            do_import(base_config.local_repo(), import_config, table, importer, ["import_data/00"])
+            downloader.flush()
+            assert push_and_verify(downloader, remote, ssh_settings) == 2
+
+            watermarks = SyncWatermarks()
+            watermark = watermarks.get(local_uuid, remote.uuid, dataset_name, table.schema.name)
+            assert watermark is not None
+
+            do_import(base_config.local_repo(), import_config, table, importer, ["import_data/08"])
+            downloader.flush()
+            diff = diff_keys(dolt_server, local_uuid, str(remote.uuid), dataset_name, table.schema, [], None, table.batch_size, watermarks)
+            assert isinstance(diff, DiffCursor)
+            assert diff.from_commit == watermark
+            assert len(list(diff)) == 1
+
+            assert push_and_verify(downloader, remote, ssh_settings) == 1
+            assert watermarks.get(local_uuid, remote.uuid, dataset_name, table.schema.name) != watermark
+
+def test_failed_push_keeps_watermark(tmp_path):
+    """If a file fails to transfer, no watermark is recorded, so the next push diffs its row again."""
+    remote = setup_file_remote(tmp_path)
+    dataset_name = "submissions"
+    shutil.copy(config_directory / "submissions.dataset", tmp_path / "submissions.dataset")
+    dataset_schema = DatasetSchema.must_load(dataset_name)
+    shutil.copytree(import_directory, os.path.join(tmp_path, "import_data"))
+    db_config = {
+        "unix_socket": base_config.dolt_server_socket,
+        "user": "root",
+        "database": base_config.dolt_db,
+        "autocommit": True,
+        "port": random.randint(20000, 21000),
+    }
+    dataset_source = DatasetSource(dataset_schema, repo=base_config.local_repo())
+    with DoltSqlServer(base_config.dolt_dir, base_config.dolt_db, db_config, base_config.spawn_dolt_server) as dolt_server:
+        with Dataset(dolt_server, dataset_source, base_config.auto_push, import_config.batch_size) as downloader:
+            ssh_settings = SshSettings(Path(__file__).parent / "config/ssh_config", None)
+            local_uuid = str(context.local_uuid.get())
+            table = next(iter(downloader.tables.values()))
+            do_import(base_config.local_repo(), import_config, table, TestImporter(), ["import_data/00"])
+            downloader.flush()
+
+            # Losing one of the two imported files makes its transfer fail.
+            lost = next(path for path in Path(base_config.files_dir).rglob("*") if path.is_file())
+            lost_data = lost.read_bytes()
+            lost.unlink()
+            assert push_and_verify(downloader, remote, ssh_settings) == 1
+            watermarks = SyncWatermarks()
+            assert watermarks.get(local_uuid, remote.uuid, dataset_name, table.schema.name) is None
+
+            lost.write_bytes(lost_data)
+            assert push_and_verify(downloader, remote, ssh_settings) == 1
+            assert watermarks.get(local_uuid, remote.uuid, dataset_name, table.schema.name) is not None
+
 def push_and_verify(downloader: Dataset, file_remote: Repo, ssh_settings: SshSettings):
 
     files_pushed = push_dataset(downloader, file_remote, ssh_settings, [], limit=None)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pymysql
+
+from dolt_annex import query_stats
+from dolt_annex.query_stats import QueryStats, statement_kind
+
+def test_statement_kind():
+    assert statement_kind("call DOLT_MERGE(%s);") == "CALL DOLT_MERGE"
+    assert statement_kind("CALL dolt_branch(%s, %s)") == "CALL DOLT_BRANCH"
+    assert statement_kind("SELECT to_key FROM dolt_commit_diff_annex_keys WHERE from_commit = %s") == "SELECT dolt_commit_diff"
+    assert statement_kind("REPLACE INTO `db/main`.`annex_keys` VALUES (%s)") == "REPLACE INTO"
+    assert statement_kind("LOAD DATA LOCAL INFILE %s REPLACE INTO TABLE t") == "LOAD DATA"
+    assert statement_kind("  select 1") == "SELECT"
+
+def test_histogram(tmp_path):
+    stats = QueryStats(slow_query_threshold=5.0, slow_query_log=tmp_path / "slow.log")
+    stats.record("SELECT 1", 0.0005, None)
+    stats.record("SELECT 1", 0.05, None)
+    stats.record("call DOLT_MERGE('b')", 2.0, None)
+    summary = stats.as_dict()["statements"]
+    assert summary["SELECT"]["count"] == 2
+    assert summary["SELECT"]["histogram"] == [1, 0, 1, 0, 0, 0]
+    assert summary["CALL DOLT_MERGE"]["max_seconds"] == 2.0
+    assert not (tmp_path / "slow.log").exists()
+
+def test_slow_query_log(tmp_path):
+    stats = QueryStats(slow_query_threshold=1.0, slow_query_log=tmp_path / "slow.log")
+    stats.record("call DOLT_MERGE('b')", 3.0, "db/main")
+    log = (tmp_path / "slow.log").read_text(encoding="utf-8")
+    assert "CALL DOLT_MERGE took 3.000s on db/main" in log
+
+class ExplainingConnection:
+    """Stands in for a Dolt connection, formatting statements with their arguments the way pymysql does."""
+    statements: list = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, args=None):
+        if args is None and "%s" in sql:
+            raise pymysql.err.ProgrammingError(1064, "You have an error in your SQL syntax")
+        self.statements.append(sql % tuple(pymysql.converters.escape_item(arg, "utf8mb4") for arg in args) if args is not None else sql)
+
+    def fetchall(self):
+        return [("Project", "key")]
+
+def test_explain_parameterized_query(tmp_path, monkeypatch):
+    monkeypatch.setattr(query_stats.pymysql, "connect", lambda **config: ExplainingConnection())
+    stats = QueryStats(slow_query_threshold=1.0, slow_query_log=tmp_path / "slow.log")
+    stats.record("SELECT `key` FROM annex_keys WHERE `key` = %s", 3.0, "db/main", ("SHA256E-s1--ab.txt",))
+    assert ExplainingConnection.statements == ["EXPLAIN SELECT `key` FROM annex_keys WHERE `key` = 'SHA256E-s1--ab.txt'"]
+    log = (tmp_path / "slow.log").read_text(encoding="utf-8")
+    assert "Project key" in log
+    assert "EXPLAIN failed" not in log
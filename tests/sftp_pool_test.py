@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import errno
+
+import pytest
+
+from dolt_annex.commands import sync
+from dolt_annex.commands.sync import SftpPool
+
+class FakeSession:
+    def __init__(self, number: int):
+        self.number = number
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class Connector:
+    """Opens numbered fake sessions, failing the attempts listed in failures."""
+    def __init__(self, failures=()):
+        self.attempts = 0
+        self.failures = set(failures)
+        self.sessions = []
+
+    def __call__(self):
+        self.attempts += 1
+        if self.attempts in self.failures:
+            raise ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused")
+        session = FakeSession(self.attempts)
+        self.sessions.append(session)
+        return session
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(sync, "RETRY_DELAY", 0)
+
+def test_network_errors_are_retried():
+    connect = Connector()
+    with SftpPool(connect, 1) as pool:
+        def transfer(sftp):
+            if sftp.number == 1:
+                raise OSError(errno.ENETUNREACH, "Network is unreachable")
+            return sftp.number
+        assert pool.run(transfer) == 2
+        assert connect.sessions[0].closed
+        # Errors about a single file don't break the session.
+        with pytest.raises(FileNotFoundError):
+            pool.run(lambda sftp: open("/nonexistent/file", encoding="utf-8"))
+        assert pool.run(lambda sftp: sftp.number) == 2
+
+def test_sessions_that_fail_to_reconnect_are_not_reused():
+    connect = Connector(failures={2, 3})
+    with SftpPool(connect, 1) as pool:
+        def broken(sftp):
+            raise EOFError()
+        with pytest.raises(ConnectionRefusedError):
+            pool.run(broken)
+        assert connect.sessions[0].closed
+        # The slot is reopened by the next transfer, instead of handing out the closed session.
+        assert pool.run(lambda sftp: (sftp.number, sftp.closed)) == (4, False)
+
+def test_open_sessions_are_closed_if_the_pool_fails_to_start():
+    connect = Connector(failures={3})
+    with pytest.raises(ConnectionRefusedError):
+        SftpPool(connect, 4)
+    assert len(connect.sessions) == 2
+    assert all(session.closed for session in connect.sessions)
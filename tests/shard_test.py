@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import random
+
+import pytest
+
+from dolt_annex.commands.sync import ShardFilter
+from dolt_annex.datatypes import AnnexKey, FileTableSchema
+from dolt_annex.dolt import DoltSqlServer
+from dolt_annex.filestore import get_key_shard
+
+from tests.setup import base_config, setup_file_remote
+
+def test_parse_shard():
+    assert ShardFilter.parse("2/8") == ShardFilter(2, 8)
+    for shard in ["8/8", "-1/8", "1", "a/b", "1/0"]:
+        with pytest.raises(ValueError):
+            ShardFilter.parse(shard)
+
+def test_shard_filter_matches_get_key_shard(tmp_path):
+    """The shard that ShardFilter selects in SQL is the one get_key_shard computes, and the shards partition the keys."""
+    setup_file_remote(tmp_path)
+    keys = [AnnexKey(f"SHA256E-s1--{hashlib.sha256(bytes([i])).hexdigest()}") for i in range(256)]
+    schema = FileTableSchema(name="shard_keys", file_column="annex_key", key_columns=["id"])
+    db_config = {
+        "unix_socket": base_config.dolt_server_socket,
+        "user": "root",
+        "database": base_config.dolt_db,
+        "autocommit": True,
+        "port": random.randint(20000, 21000),
+    }
+    with DoltSqlServer(base_config.dolt_dir, base_config.dolt_db, db_config, base_config.spawn_dolt_server) as dolt:
+        dolt.cursor.execute("CREATE TABLE shard_keys (id INT PRIMARY KEY, annex_key VARCHAR(100))")
+        dolt.executemany("INSERT INTO shard_keys (id, annex_key) VALUES (%s, %s)", list(enumerate(keys)))
+        shards = []
+        for index in range(4):
+            condition, values = ShardFilter(index, 4).condition(schema, "")
+            shard = {AnnexKey(key) for (key,) in dolt.query(f"SELECT annex_key FROM shard_keys WHERE {condition}", values)}
+            assert shard == {key for key in keys if get_key_shard(key, 4) == index}
+            shards.append(shard)
+    assert set().union(*shards) == set(keys)
+    assert sum(len(shard) for shard in shards) == len(keys)
+    assert all(shards)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+
+from dolt_annex.dolt import server_is_running, spawned_servers
+
+def test_server_is_running():
+    # A process that isn't a dolt sql-server, such as one that reused the pid of a server that exited, isn't the server.
+    assert not server_is_running(os.getpid())
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)", "sql-server"])
+    try:
+        assert server_is_running(process.pid)
+    finally:
+        process.kill()
+        process.wait()
+    assert not server_is_running(process.pid)
+
+def test_server_is_running_zombie():
+    # A server that exited but hasn't been reaped still has its pid, but isn't running.
+    process = subprocess.Popen([sys.executable, "-c", "pass", "sql-server"])
+    try:
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        assert not server_is_running(process.pid)
+        spawned_servers.append(process)
+        assert not server_is_running(process.pid)
+    finally:
+        if process in spawned_servers:
+            spawned_servers.remove(process)
+        process.wait()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from pathlib import Path
+
+import pytest
+
+from dolt_annex.walk import walk_files
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_walk_files_matches_os_walk(tmp_path, workers):
+    for i in range(20):
+        directory = tmp_path / f"{i % 4}" / f"{i % 3}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"file-{i}.txt").write_text(str(i))
+    (tmp_path / "link-to-file").symlink_to(tmp_path / "0" / "0" / "file-0.txt")
+    (tmp_path / "link-to-dir").symlink_to(tmp_path / "1")
+    (tmp_path / "broken-link").symlink_to(tmp_path / "missing")
+
+    expected = [Path(root) / file for root, _, files in os.walk(tmp_path) for file in files]
+    entries = list(walk_files(tmp_path, workers))
+    paths = [entry.path for entry in entries]
+    if workers == 1:
+        assert paths == expected
+    else:
+        assert sorted(paths) == sorted(expected)
+    assert {entry.path.name for entry in entries if entry.is_symlink} == {"link-to-file", "broken-link"}